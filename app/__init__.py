@@ -1,11 +1,19 @@
 from flask import Flask
 import os
+import time
 
 def create_app():
+    started = time.perf_counter()
+    
     # Get port from environment variable with default of 8080
     port = int(os.environ.get('PORT', 8080))
     
-    app = Flask(__name__)
+    # Leveled logging for every app.* module, see LOG_LEVEL
+    from app.utils.log import configure_logging
+    configure_logging()
+    
+    # Plots under /static are served by main_routes.static_file (see file_delivery.py)
+    app = Flask(__name__, static_folder=None)
     app.config['UPLOAD_FOLDER'] = 'data'
     app.config['RESULTS_FOLDER'] = 'data/results'
     app.config['MAX_CONTENT_LENGTH'] = 1024 * 1024 * 1024  # 1GB max upload size
@@ -15,11 +23,33 @@ def create_app():
     os.makedirs(app.config['RESULTS_FOLDER'], exist_ok=True)
     os.makedirs('static', exist_ok=True)
     
+    # Batch and ONA segment workers fork from a server that has imported their modules once
+    from app.utils.preload import PRELOAD, preload, configure_worker_preload, record_startup_time
+    configure_worker_preload()
+    
     # Import and register blueprints
     from app.routes.main_routes import main_bp
     from app.routes.api_routes import api_bp
+    from app.routes.upload_routes import upload_bp
+    from app.routes.series_routes import series_bp
+    from app.routes.metrics_routes import metrics_bp
+    from app.routes.export_routes import export_bp
     
     app.register_blueprint(main_bp)
     app.register_blueprint(api_bp, url_prefix='/api')
+    app.register_blueprint(upload_bp, url_prefix='/api/uploads')
+    app.register_blueprint(series_bp, url_prefix='/api/series')
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(export_bp, url_prefix='/api/jobs')
+    
+    # Age and byte quotas of the upload, results and plot folders are enforced off the request path
+    from app.utils.janitor import start_janitor
+    start_janitor()
+    
+    # plotly, scipy and the ONA kernel load in the first job that needs them unless
+    # PRELOAD=eager moves that cost to startup
+    if PRELOAD == 'eager':
+        preload()
+    record_startup_time('create_app', time.perf_counter() - started)
     
     return app, port
@@ -0,0 +1,351 @@
+import argparse
+import glob
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from app.processing.input_streams import INPUT_EXTENSIONS
+from app.processing.aethalometer import WAVELENGTHS
+from app.processing.batch import BATCH_WORKERS, BATCH_START_METHOD
+from app.processing.disk_mode import (
+    use_disk_mode, spill_aethalometer_data, apply_ona_disk, result_preview, iter_result_blocks, iter_combined_blocks,
+    release_spilled
+)
+from app.processing.weather import process_weather_data, synchronize_data
+from app.processing.export import EXPORT_FORMATS, write_chunks
+from app.processing.pipeline import Pipeline, PIPELINE_STAGES
+from app.processing import compact
+from app.utils.log import configure_logging
+from app.utils.profiling import track_stage
+from app.utils.status_tracker import processing_stages
+
+logger = logging.getLogger(__name__)
+
+def expand_inputs(patterns):
+    """Input files matching the given paths and globs, in order and without repeats"""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) or [pattern]
+        for path in matches:
+            if not os.path.isfile(path):
+                raise ValueError(f"No input file matches {pattern}")
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+def input_name(path):
+    """File name of an input without its (possibly multi-part) extension"""
+    name = os.path.basename(path)
+    for ext in sorted(INPUT_EXTENSIONS, key=len, reverse=True):
+        if name.lower().endswith('.' + ext):
+            return name[:-len(ext) - 1]
+    return os.path.splitext(name)[0]
+
+def output_names(paths):
+    """
+    Output name of every input: its file name, prefixed with as many parent folders as
+    needed where inputs of different folders share a name (a/day1.csv and b/day1.csv
+    become a_day1 and b_day1). Names still repeated, such as day1.csv and day1.csv.gz
+    of one folder, are numbered (day1 and day1_2).
+    """
+    folders = [[part for part in os.path.dirname(os.path.abspath(path)).split(os.sep) if part] for path in paths]
+    names = [input_name(path) for path in paths]
+    depth = 0
+    while True:
+        name_folders = {}
+        for name, folder in zip(names, folders):
+            name_folders.setdefault(name, set()).add(tuple(folder))
+        colliding = [i for i, name in enumerate(names) if len(name_folders[name]) > 1]
+        depth += 1
+        if not colliding or all(depth > len(folders[i]) for i in colliding):
+            break
+        for i in colliding:
+            names[i] = '_'.join(folders[i][-depth:] + [input_name(paths[i])])
+
+    taken = set(names)
+    seen = Counter()
+    for i, name in enumerate(names):
+        seen[name] += 1
+        if seen[name] > 1:
+            number = seen[name]
+            while f'{name}_{number}' in taken:
+                number += 1
+            seen[name] = number
+            names[i] = f'{name}_{number}'
+            taken.add(names[i])
+    return names
+
+def write_output(chunks, columns, path, fmt, compress, rows=None):
+    """Encode chunks to a file, removing the partial file if encoding fails"""
+    try:
+        with open(path, 'wb') as f:
+            write_chunks(f, chunks, columns, fmt, compress, rows)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return path
+
+def report(name, message):
+    print(f"{name}: {message}", file=sys.stderr, flush=True)
+
+def parse_weather(job_id, name, weather_path):
+    """Parsed weather data, or None with a warning when it cannot be read"""
+    try:
+        with track_stage(job_id, 'parse') as record:
+            weather_df = process_weather_data(weather_path, job_id=job_id)
+            record['rows'] = len(weather_df) if weather_df is not None else 0
+    except Exception as e:
+        report(name, f"warning: weather synchronization failed: {e}")
+        return None
+    if weather_df is None or weather_df.empty:
+        return None
+    return weather_df
+
+def synchronize_weather(job_id, name, processed, weather_df):
+    """Weather data merged with the processed output, or None with a warning when it fails"""
+    try:
+        with track_stage(job_id, 'synchronize') as record:
+            combined_df = synchronize_data(processed, weather_df, job_id=job_id)
+            record['rows'] = len(combined_df)
+        return combined_df
+    except Exception as e:
+        report(name, f"warning: weather synchronization failed: {e}")
+        return None
+
+def output_paths(name, options):
+    """Processed and combined output paths of an input"""
+    extension = EXPORT_FORMATS[options['format']][1] + ('.gz' if options['compress'] else '')
+    return tuple(os.path.join(options['output_dir'], f"{name}_{table}_{options['wavelength']}.{extension}")
+                 for table in ('processed', 'combined'))
+
+def report_stage(name, result):
+    """Pipeline progress callback printing each stage of a file to stderr"""
+    def callback(stage, produced):
+        if stage == 'ona':
+            result['rows'] = len(produced)
+            report(name, f"ONA applied to {len(produced)} rows")
+        elif stage == 'ingest':
+            report(name, f"ingested {len(produced)} rows")
+        elif stage in ('weather', 'sync') and produced is None:
+            report(name, "warning: weather synchronization failed, no combined output")
+        elif stage == 'export':
+            report(name, f"wrote {', '.join(os.path.basename(p) for p in produced)}")
+        elif stage == 'visualize':
+            report(name, "plots written")
+    return callback
+
+def process_in_memory(path, name, job_id, options, result):
+    """The requested outputs of one file through the lazy pipeline (see pipeline.py)"""
+    processed_path, combined_path = output_paths(name, options)
+    pipeline = Pipeline(path, options['wavelength'], options['atn_min'], weather_path=options['weather'],
+                        job_id=job_id, progress_callback=report_stage(name, result))
+    pipeline.export(processed_path, fmt=options['format'], compress=options['compress'])
+    if options['weather']:
+        pipeline.export(combined_path, table='combined', fmt=options['format'], compress=options['compress'])
+    if options['plots']:
+        pipeline.visualize(options['output_dir'], name)
+    outputs = pipeline.collect()
+    result['outputs'] = outputs['exports'] + [os.path.join(options['output_dir'], os.path.basename(url))
+                                              for url in (outputs.get('plots') or {}).values() if url]
+
+def process_disk_backed(path, name, job_id, options, result):
+    """
+    The same stages over memory-mapped spill files (see disk_mode.py). The combined
+    output is merged block by block at full resolution; plots use a reduced preview,
+    as in the web app.
+    """
+    wavelength = options['wavelength']
+    processed_path, combined_path = output_paths(name, options)
+    spilled = None
+    try:
+        with track_stage(job_id, 'ingest') as record:
+            spilled = spill_aethalometer_data(path, wavelength, job_id=job_id)
+            record['rows'] = result['rows'] = spilled['rows']
+        report(name, f"ingested {spilled['rows']} rows")
+
+        with track_stage(job_id, 'ona', rows=spilled['rows']):
+            apply_ona_disk(spilled, options['atn_min'], job_id=job_id)
+            preview_df = result_preview(spilled)
+        report(name, f"ONA applied to {spilled['rows']} rows")
+
+        weather_df = combined_df = None
+        if options['weather']:
+            with track_stage(job_id, 'sync', rows=len(preview_df)):
+                weather_df = parse_weather(job_id, name, options['weather'])
+                if weather_df is not None and options['plots']:
+                    combined_df = synchronize_weather(job_id, name, preview_df, weather_df)
+
+        with track_stage(job_id, 'export', rows=spilled['rows']):
+            columns = ['timestamp', 'rawBC', 'processedBC', spilled['atn_col'], 'windowStart', 'windowEnd']
+            result['outputs'].append(write_output(iter_result_blocks(spilled), columns, processed_path,
+                                                  options['format'], options['compress'], spilled['rows']))
+            if weather_df is not None:
+                # Merged block by block at full resolution, one row per processed row; the
+                # preview is only for plots
+                try:
+                    blocks = iter_combined_blocks(spilled, weather_df)
+                    first = next(blocks)
+                    result['outputs'].append(write_output(itertools.chain([first], blocks), list(first.columns),
+                                                          combined_path, options['format'], options['compress'],
+                                                          spilled['rows']))
+                except Exception as e:
+                    report(name, f"warning: weather synchronization failed: {e}")
+        report(name, f"wrote {', '.join(os.path.basename(p) for p in result['outputs'])}")
+
+        if options['plots']:
+            from app.processing.visualization import create_visualizations
+            with track_stage(job_id, 'visualize', rows=len(preview_df)):
+                visualizations = create_visualizations(preview_df, combined_df, wavelength, name,
+                                                       job_id=job_id, static_folder=options['output_dir'])
+            result['outputs'] += [os.path.join(options['output_dir'], os.path.basename(url))
+                                  for url in visualizations.values() if url]
+            report(name, "plots written")
+    finally:
+        if spilled is not None:
+            release_spilled(spilled)
+
+def process_file(path, name, options):
+    """
+    Run ingest, ONA, weather synchronization, export and (optionally) plots on one file.
+
+    The same stage functions as a web job, without the upload, status and JSON result
+    steps. Outputs and plots are named after name (see output_names()). Inputs expected
+    to exceed the memory budget are processed disk-backed. Returns the output paths and
+    the stage records of profiling.py.
+    """
+    job_id = f'cli_{name}'
+    result = {'input': path, 'name': name, 'outputs': [], 'rows': None, 'disk_backed': False, 'error': None}
+    started = time.perf_counter()
+    try:
+        result['disk_backed'] = use_disk_mode(os.path.getsize(path), path)
+        if result['disk_backed']:
+            process_disk_backed(path, name, job_id, options, result)
+        else:
+            process_in_memory(path, name, job_id, options, result)
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+        logger.debug("Processing %s failed", path, exc_info=True)
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    result['stages'] = processing_stages.pop(job_id, [])
+    return result
+
+def run_files(paths, names, options, workers):
+    """Process every file, on a pool of worker processes when workers > 1; yields results as they finish"""
+    if workers == 1:
+        for path, name in zip(paths, names):
+            yield process_file(path, name, options)
+        return
+
+    context = multiprocessing.get_context(BATCH_START_METHOD)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=configure_logging, initargs=(options['log_level'],)) as executor:
+        futures = [executor.submit(process_file, path, name, options) for path, name in zip(paths, names)]
+        for future in as_completed(futures):
+            yield future.result()
+
+def summarize_stages(results):
+    """Top-level stage timings added up over all files, in pipeline order"""
+    totals = {}
+    for result in results:
+        for record in result['stages']:
+            if '/' in record['stage'] or 'seconds' not in record:
+                continue
+            total = totals.setdefault(record['stage'], {'stage': record['stage'], 'files': 0, 'rows': 0,
+                                                        'seconds': 0.0, 'cpu_seconds': 0.0, 'peak_rss_mb': 0.0})
+            total['files'] += 1
+            total['rows'] += record['rows'] or 0
+            total['seconds'] = round(total['seconds'] + record['seconds'], 6)
+            total['cpu_seconds'] = round(total['cpu_seconds'] + record['cpu_seconds'], 6)
+            total['peak_rss_mb'] = max(total['peak_rss_mb'], record['peak_rss_mb'])
+    return [totals[stage] for stage in PIPELINE_STAGES if stage in totals]
+
+def print_summary(summary, results, seconds):
+    print(f"{'stage':<14} {'files':>5} {'rows':>12} {'seconds':>10} {'cpu s':>10} {'rows/s':>12} {'peak MB':>9}")
+    for total in summary:
+        rate = total['rows'] / total['seconds'] if total['seconds'] > 0 else 0
+        print(f"{total['stage']:<14} {total['files']:>5} {total['rows']:>12} {total['seconds']:>10.3f} "
+              f"{total['cpu_seconds']:>10.3f} {rate:>12.0f} {total['peak_rss_mb']:>9.1f}")
+    failed = sum(1 for result in results if result['error'])
+    print(f"{len(results) - failed} of {len(results)} files processed in {seconds:.3f}s")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m app.cli',
+        description='Run the ONA processing pipeline on local aethalometer files, without the web app'
+    )
+    parser.add_argument('inputs', nargs='+', help='Aethalometer files or globs (csv, csv.gz, csv.zst or zip)')
+    parser.add_argument('--weather', help='Weather file synchronized with every input')
+    parser.add_argument('--wavelength', choices=WAVELENGTHS, default='Blue', help='Wavelength to process (default Blue)')
+    parser.add_argument('--atn-min', type=float, default=0.01, help='Minimum ATN change of an ONA window (default 0.01)')
+    parser.add_argument('--output-dir', default='.', help='Folder for outputs and plots (default the current folder)')
+    parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv', help='Output format (default csv)')
+    parser.add_argument('--gzip', action='store_true', help='Gzip the outputs')
+    parser.add_argument('--no-plots', dest='plots', action='store_false', help='Skip the HTML plots')
+    parser.add_argument('--workers', type=int, default=BATCH_WORKERS,
+                        help=f'Files processed at the same time (default {BATCH_WORKERS})')
+    parser.add_argument('--compact', action='store_true',
+                        help='Hold BC as float32 (COMPACT_DTYPES=1, see app/processing/compact.py)')
+    parser.add_argument('--log-level', default='WARNING', help='Level of the app log on stderr (default WARNING)')
+    parser.add_argument('--json', action='store_true', help='Print the results and stage timings as JSON')
+    args = parser.parse_args(argv)
+
+    if args.atn_min <= 0:
+        parser.error('--atn-min must be positive')
+    if args.format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            parser.error('Parquet output needs pyarrow, which is not installed')
+    if args.weather and not os.path.isfile(args.weather):
+        parser.error(f'Weather file not found: {args.weather}')
+    try:
+        paths = expand_inputs(args.inputs)
+    except ValueError as e:
+        parser.error(str(e))
+    names = output_names(paths)
+
+    configure_logging(args.log_level)
+    if args.compact:
+        # Worker processes read the setting from the environment when they import compact.py
+        os.environ['COMPACT_DTYPES'] = '1'
+        compact.COMPACT_DTYPES = True
+    os.makedirs(args.output_dir, exist_ok=True)
+    options = {
+        'weather': args.weather,
+        'wavelength': args.wavelength,
+        'atn_min': args.atn_min,
+        'output_dir': args.output_dir,
+        'format': args.format,
+        'compress': args.gzip,
+        'plots': args.plots,
+        'log_level': args.log_level
+    }
+    workers = max(1, min(args.workers, len(paths)))
+    print(f"Processing {len(paths)} files with {workers} workers...", file=sys.stderr, flush=True)
+
+    started = time.perf_counter()
+    results = []
+    for result in run_files(paths, names, options, workers):
+        results.append(result)
+        status = f"failed: {result['error']}" if result['error'] else f"done, {result['rows']} rows"
+        print(f"[{len(results)}/{len(paths)}] {result['name']} {status} ({result['seconds']:.3f}s)",
+              file=sys.stderr, flush=True)
+    seconds = time.perf_counter() - started
+
+    order = {path: i for i, path in enumerate(paths)}
+    results.sort(key=lambda result: order[result['input']])
+    summary = summarize_stages(results)
+    if args.json:
+        print(json.dumps({'files': results, 'stages': summary, 'seconds': round(seconds, 3)}, indent=2))
+    else:
+        print_summary(summary, results, seconds)
+    return 1 if any(result['error'] for result in results) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
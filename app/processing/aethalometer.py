@@ -1,10 +1,22 @@
+import logging
 import pandas as pd
 import numpy as np
 import os
 import re
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from app.utils.status_tracker import processing_status, processing_progress, processing_messages
-from app.processing.weather import ensure_tz_aware
+from app.processing.input_streams import open_input
+from app.processing.ona_kernels import scan_ona_windows
+from app.processing.segmentation import find_segmented_windows
+from app.utils.shared_arrays import as_frame
+from app.utils.profiling import track_stage
+from app.utils.cancellation import check_cancelled
+from app.processing import timestamp_parser
+from app.processing.timestamp_parser import detect_timestamp_parser, parse_timestamps
+from app.processing.compact import compact_columns, bc_dtype
+
+logger = logging.getLogger(__name__)
 
 def transform_header(header):
     """Transform header to camelCase format"""
@@ -24,15 +36,42 @@ def map_field_names(df):
     """Map field names to standardized format"""
     return df.rename(columns={col: transform_header(col) for col in df.columns})
 
-def validate_aethalometer_data(df, wavelength):
-    """Validate required columns and data format"""
-    atn_pattern = re.compile(f"{wavelength}\\s*ATN1", re.IGNORECASE)
-    bc_pattern = re.compile(f"{wavelength}\\s*BC1", re.IGNORECASE)
+# Instrument wavelengths, in order of increasing wavelength
+WAVELENGTHS = ['UV', 'Blue', 'Green', 'Red', 'IR']
+
+# Dual-spot measurement variants as (ATN suffix, BC suffix). The loading-compensated
+# BCc series has no ATN of its own, so its windows follow spot 1.
+ONA_VARIANTS = {
+    '1': ('ATN1', 'BC1'),
+    '2': ('ATN2', 'BC2'),
+    'c': ('ATN1', 'BCc')
+}
+
+def find_measurement_columns(columns, wavelength, variant='1'):
+    """Find the (ATN, BC) column pair for a wavelength and dual-spot variant"""
+    atn_suffix, bc_suffix = ONA_VARIANTS[variant]
+    atn_pattern = re.compile(f"{wavelength}\\s*{atn_suffix}$", re.IGNORECASE)
+    bc_pattern = re.compile(f"{wavelength}\\s*{bc_suffix}$", re.IGNORECASE)
     
-    atn_col = next((col for col in df.columns if atn_pattern.search(col)), None)
-    bc_col = next((col for col in df.columns if bc_pattern.search(col)), None)
+    atn_col = next((col for col in columns if atn_pattern.search(col)), None)
+    bc_col = next((col for col in columns if bc_pattern.search(col)), None)
+    return atn_col, bc_col
+
+def bc_columns(columns):
+    """Every BC column of any wavelength and dual-spot variant"""
+    found = []
+    for wavelength in WAVELENGTHS:
+        for variant in ONA_VARIANTS:
+            _, bc_col = find_measurement_columns(columns, wavelength, variant)
+            if bc_col and bc_col not in found:
+                found.append(bc_col)
+    return found
+
+def validate_aethalometer_data(df, wavelength, variant='1'):
+    """Validate required columns and data format"""
+    atn_col, bc_col = find_measurement_columns(df.columns, wavelength, variant)
     
-    print(f"[DEBUG] Found columns - ATN: {atn_col}, BC: {bc_col}")
+    logger.debug("Found columns - ATN: %s, BC: %s", atn_col, bc_col)
     
     if not (atn_col and bc_col):
         raise ValueError(f"Required columns for {wavelength} wavelength not found")
@@ -41,56 +80,101 @@ def validate_aethalometer_data(df, wavelength):
     df[atn_col] = pd.to_numeric(df[atn_col], errors='coerce')
     df[bc_col] = pd.to_numeric(df[bc_col], errors='coerce')
     
+    df = compact_columns(df, [bc_col])
+    
     # Remove rows with invalid data
     df = df.dropna(subset=[atn_col, bc_col])
     
     return df, atn_col, bc_col
 
-def process_aethalometer_data_in_chunks(file_path, chunk_size=50000, job_id=None):
-    """Process aethalometer data file in chunks with improved memory efficiency"""
+def iter_aethalometer_chunks(file_path, chunk_size=50000, job_id=None, max_chunk_bytes=None):
+    """
+    Yield parsed chunks of an aethalometer file with standardized column names and a
+    tz-aware UTC timestamp column.
+    
+    file_path may be a plain, .csv.gz, .csv.zst or .zip file, or a readable binary
+    stream exposing total_size. With max_chunk_bytes, the size of the first chunk is
+    used to pick a row count that keeps later chunks under that many bytes in memory.
+    """
+    timestamp_spec = None
+    unparsed_timestamps = 0
+    compact = None
+    rows = chunk_size
+    
+    # Compressed inputs are inflated on the fly; progress follows the stored (compressed) bytes
+    with open_input(file_path) as source:
+        reader = pd.read_csv(source.stream, chunksize=chunk_size)
+        chunk_num = 0
+        while True:
+            check_cancelled(job_id)
+            try:
+                with track_stage(job_id, 'read_chunk', accumulate=True) as record:
+                    chunk = reader.get_chunk(rows)
+                    record['rows'] = len(chunk)
+            except StopIteration:
+                break
+            
+            if job_id:
+                progress = min(60, 10 + int(source.fraction_read * 50))
+                processing_progress[job_id] = progress
+                processing_messages[job_id] = (
+                    f"Processing chunk {chunk_num+1} ({int(source.fraction_read * 100)}% of input read)..."
+                )
+            
+            if max_chunk_bytes and chunk_num == 0 and len(chunk):
+                row_bytes = chunk.memory_usage(deep=True).sum() / len(chunk)
+                rows = max(1000, int(max_chunk_bytes / row_bytes))
+            
+            # Standardize column names
+            chunk = map_field_names(chunk)
+            
+            # Detect the timestamp layout once; later chunks reuse the cached explicit format
+            if timestamp_spec is None:
+                timestamp_spec = detect_timestamp_parser(chunk)
+            
+            # Parsed straight to a tz-aware UTC series, so no per-chunk ensure_tz_aware pass is
+            # needed; a layout re-detected mid-stream is kept for the following chunks
+            with track_stage(job_id, 'parse_timestamps', rows=len(chunk), accumulate=True):
+                chunk['timestamp'], timestamp_spec, unparsed = parse_timestamps(chunk, timestamp_spec)
+            if len(unparsed):
+                unparsed_timestamps += len(unparsed)
+                if unparsed_timestamps > timestamp_parser.MAX_UNPARSED_TIMESTAMPS:
+                    raise ValueError(
+                        f"{unparsed_timestamps} timestamps could not be parsed, such as {unparsed.iloc[0]!r} "
+                        f"(MAX_UNPARSED_TIMESTAMPS allows {timestamp_parser.MAX_UNPARSED_TIMESTAMPS})"
+                    )
+                logger.warning("%s timestamps could not be parsed and were left empty, such as %r",
+                               len(unparsed), unparsed.iloc[0])
+            
+            # BC columns are stored as float32 in compact mode (see compact.py)
+            if compact is None:
+                compact = bc_columns(chunk.columns)
+            chunk = compact_columns(chunk, compact)
+            chunk_num += 1
+            yield chunk
+
+def process_aethalometer_data_in_chunks(file_path, chunk_size=50000, job_id=None, transform=None):
+    """
+    Process aethalometer data file in chunks with improved memory efficiency.
+    
+    file_path may be a plain, .csv.gz, .csv.zst or .zip file, or a readable binary
+    stream exposing total_size, such as an upload that is still being received.
+    transform, when given, is applied to each parsed chunk before it is kept, so
+    column selection and conversions happen in the same pass as parsing and
+    columns it drops are never combined.
+    """
     try:
         if job_id:
             processing_status[job_id] = "Reading"
             processing_messages[job_id] = "Initializing data processing..."
             processing_progress[job_id] = 5
         
-        # Get file size for progress tracking
-        file_size = os.path.getsize(file_path)
-        total_chunks = file_size // (chunk_size * 100) + 1  # Estimate total chunks
-        
         # Initialize an empty list to store DataFrames
         processed_chunks = []
         
-        # Process the file in chunks
-        for chunk_num, chunk in enumerate(pd.read_csv(file_path, chunksize=chunk_size)):
-            if job_id:
-                progress = min(60, 10 + int(chunk_num * 50 / total_chunks))
-                processing_progress[job_id] = progress
-                processing_messages[job_id] = f"Processing chunk {chunk_num+1}/{total_chunks}..."
-            
-            # Standardize column names
-            chunk = map_field_names(chunk)
-            
-            # Handle timestamp
-            timestamp_col = next((col for col in chunk.columns if any(x in col.lower() for x in ['timestamp', 'date', 'time'])), None)
-            
-            if timestamp_col:
-                try:
-                    # Convert to datetime without timezone first
-                    chunk['timestamp'] = pd.to_datetime(chunk[timestamp_col])
-                except:
-                    # Try to find separate date and time columns
-                    date_col = next((col for col in chunk.columns if 'date' in col.lower()), None)
-                    time_col = next((col for col in chunk.columns if 'time' in col.lower()), None)
-                    
-                    if date_col and time_col:
-                        chunk['timestamp'] = pd.to_datetime(chunk[date_col] + ' ' + chunk[time_col])
-                    else:
-                        raise ValueError("No valid timestamp information found")
-            
-            # Ensure timestamp is timezone aware
-            chunk['timestamp'] = ensure_tz_aware(chunk['timestamp'])
-            
+        for chunk in iter_aethalometer_chunks(file_path, chunk_size, job_id=job_id):
+            if transform is not None:
+                chunk = transform(chunk)
             processed_chunks.append(chunk)
             
             # Free memory periodically
@@ -102,8 +186,10 @@ def process_aethalometer_data_in_chunks(file_path, chunk_size=50000, job_id=None
             processing_progress[job_id] = 65
         
         # Combine all chunks efficiently
-        df = pd.concat(processed_chunks, ignore_index=True)
-        df = df.sort_values('timestamp')
+        with track_stage(job_id, 'combine') as record:
+            df = pd.concat(processed_chunks, ignore_index=True)
+            df = df.sort_values('timestamp')
+            record['rows'] = len(df)
         
         if job_id:
             processing_messages[job_id] = "Data processing complete"
@@ -116,17 +202,71 @@ def process_aethalometer_data_in_chunks(file_path, chunk_size=50000, job_id=None
         if job_id:
             processing_status[job_id] = "Error"
             processing_messages[job_id] = error_msg
-        print(error_msg)
+        logger.error(error_msg)
         raise RuntimeError(error_msg)
 
+def find_ona_windows(atn_values, atn_min, progress_callback=None):
+    """
+    Find ONA averaging windows in a sequence of ATN values.
+    
+    A window starts at row i and ends at the first row j where ATN has risen by at
+    least atn_min; the next window starts at j + 1. Returns (window_starts, window_ends,
+    open_start), where open_start is the first row of the trailing window that has not
+    reached atn_min yet (len(atn_values) when every row is in a closed window).
+    
+    The scan runs on the kernel chosen at startup (see ona_kernels.py).
+    """
+    return scan_ona_windows(atn_values, atn_min, progress_callback=progress_callback)
+
+def window_membership(n_points, window_starts, window_ends):
+    """Boolean mask of the rows that belong to a closed window"""
+    delta = np.zeros(n_points + 1, dtype=np.int8)
+    delta[window_starts] += 1
+    delta[window_ends + 1] -= 1
+    return np.cumsum(delta[:-1]) > 0
+
+def windows_tile(window_starts, window_ends):
+    """True when the windows cover every row up to the last window end without gaps"""
+    return window_starts[0] == 0 and np.array_equal(window_starts[1:], window_ends[:-1] + 1)
+
+def average_windows(bc_values, window_starts, window_ends):
+    """Replace BC in each closed window by the window mean; rows outside a closed window keep raw BC"""
+    processed_bc = np.array(bc_values, dtype=np.float64)
+    if len(window_starts):
+        counts = window_ends - window_starts + 1
+        if windows_tile(window_starts, window_ends):
+            # One reduceat over the window starts gives every window sum
+            closed = window_ends[-1] + 1
+            sums = np.add.reduceat(processed_bc[:closed], window_starts)
+            processed_bc[:closed] = np.repeat(sums / counts, counts)
+        else:
+            # Segment tails separate the windows; reduce over (start, end + 1) pairs and keep the window sums
+            bounds = np.column_stack((window_starts, window_ends + 1)).ravel()
+            if bounds[-1] == len(processed_bc):
+                bounds = bounds[:-1]
+            sums = np.add.reduceat(processed_bc, bounds)[::2]
+            processed_bc[window_membership(len(processed_bc), window_starts, window_ends)] = np.repeat(sums / counts, counts)
+    return processed_bc
+
 def apply_ona_algorithm(df, wavelength="Blue", atn_min=0.01, job_id=None):
-    """Apply optimized ONA algorithm with improved memory efficiency"""
+    """
+    Apply optimized ONA algorithm with improved memory efficiency (df may be a shared frame descriptor).
+    
+    Returns only the result table; the validated copy of the input is not kept.
+    """
     try:
+        df = as_frame(df)
         if job_id:
             processing_status[job_id] = "Applying ONA"
             processing_messages[job_id] = "Preparing data for ONA algorithm..."
             processing_progress[job_id] = 70
         
+        # Only the timestamp and the measurement pair are needed; narrowing first keeps
+        # the validation and sort copies small
+        atn_col, bc_col = find_measurement_columns(df.columns, wavelength)
+        if atn_col and bc_col:
+            df = df[['timestamp', atn_col, bc_col]]
+        
         # Validate data and get column names
         df, atn_col, bc_col = validate_aethalometer_data(df, wavelength)
         
@@ -142,55 +282,38 @@ def apply_ona_algorithm(df, wavelength="Blue", atn_min=0.01, job_id=None):
         bc_values = df[bc_col].values
         n_points = len(df)
         
-        # Pre-allocate arrays for results
-        processed_bc = np.zeros(n_points)
-        window_starts = []
-        window_ends = []
-        
         if job_id:
             processing_messages[job_id] = "Applying ONA algorithm..."
         
-        # Process data in a more efficient way
-        i = 0
-        while i < n_points:
-            start_atn = atn_values[i]
-            j = i + 1
-            
-            # Find window end
-            while j < n_points and (atn_values[j] - start_atn) < atn_min:
-                j += 1
-            
-            # Process window
-            if j < n_points:
-                window_bc_avg = np.mean(bc_values[i:j+1])
-                processed_bc[i:j+1] = window_bc_avg
-                window_starts.append(i)
-                window_ends.append(j)
-                i = j + 1
-            else:
-                # Handle remaining points
-                processed_bc[i:] = bc_values[i:]
-                break
-            
-            # Update progress
-            if job_id and len(window_starts) % 100 == 0:
-                progress = 70 + int((i / n_points) * 25)
-                processing_progress[job_id] = min(95, progress)
+        def report_progress(fraction):
+            # Called every few windows and segments, so it doubles as the cancellation checkpoint
+            check_cancelled(job_id)
+            if job_id:
+                processing_progress[job_id] = min(95, 70 + int(fraction * 25))
+        
+        # Find window boundaries per segment (tape advances and gaps end a segment),
+        # then average each window in one vectorized pass
+        with track_stage(job_id, 'find_windows', rows=n_points):
+            window_starts, window_ends, _ = find_segmented_windows(
+                atn_values, timestamps, atn_min, progress_callback=report_progress
+            )
+        with track_stage(job_id, 'average_windows', rows=n_points):
+            processed_bc = average_windows(bc_values, window_starts, window_ends)
         
         # Create result DataFrame efficiently
         result = pd.DataFrame({
             'timestamp': timestamps,
             'rawBC': bc_values,
-            'processedBC': processed_bc
+            'processedBC': processed_bc.astype(bc_dtype(), copy=False)
         })
         # Preserve original ATN column name
         result[atn_col] = atn_values
-        print(f"[DEBUG] Result DataFrame columns: {result.columns.tolist()}")
+        logger.debug("Result DataFrame columns: %s", result.columns.tolist())
         
         # Add window information
         result['windowStart'] = False
         result['windowEnd'] = False
-        if window_starts:
+        if len(window_starts):
             result.iloc[window_starts, result.columns.get_loc('windowStart')] = True
             result.iloc[window_ends, result.columns.get_loc('windowEnd')] = True
         
@@ -198,18 +321,142 @@ def apply_ona_algorithm(df, wavelength="Blue", atn_min=0.01, job_id=None):
             processing_messages[job_id] = "ONA algorithm completed successfully"
             processing_progress[job_id] = 95
         
-        return df, result
+        return result
         
     except Exception as e:
         error_msg = f"Error in ONA algorithm: {str(e)}"
         if job_id:
             processing_status[job_id] = "Error"
             processing_messages[job_id] = error_msg
-        print(error_msg)
+        logger.error(error_msg)
+        raise RuntimeError(error_msg)
+
+def resolve_ona_series(columns, wavelengths=None, variants=None):
+    """
+    List the (wavelength, variant, ATN column, BC column) series present in a frame.
+    
+    Defaults to every wavelength and variant; combinations missing from the file are skipped.
+    """
+    series = []
+    for wavelength in wavelengths or WAVELENGTHS:
+        for variant in variants or ONA_VARIANTS:
+            atn_col, bc_col = find_measurement_columns(columns, wavelength, variant)
+            if atn_col and bc_col:
+                series.append((wavelength, variant, atn_col, bc_col))
+    return series
+
+def _ona_for_atn_column(df, atn_col, bc_cols, atn_min):
+    """
+    Run ONA for every BC column driven by one ATN column.
+    
+    The window scan is the only sequential part, so when the BC columns share the same
+    valid rows (BC1 and BCc on spot 1) it runs once and only the averaging is repeated.
+    """
+    atn_values = pd.to_numeric(df[atn_col], errors='coerce').to_numpy(dtype=np.float64)
+    timestamps = df['timestamp'].values
+    atn_valid = ~np.isnan(atn_values)
+    n_points = len(atn_values)
+    
+    outputs = {}
+    scanned_mask = None
+    windows = None
+    for bc_col in bc_cols:
+        bc_values = pd.to_numeric(df[bc_col], errors='coerce').to_numpy(dtype=bc_dtype())
+        valid = atn_valid & ~np.isnan(bc_values)
+        all_valid = bool(valid.all())
+        rows = None if all_valid else np.flatnonzero(valid)
+        
+        if windows is None or not np.array_equal(valid, scanned_mask):
+            windows = find_segmented_windows(
+                atn_values if all_valid else atn_values[rows],
+                timestamps if all_valid else timestamps[rows],
+                atn_min
+            )
+            scanned_mask = valid
+        window_starts, window_ends, _ = windows
+        
+        averaged = average_windows(bc_values if all_valid else bc_values[rows], window_starts, window_ends)
+        averaged = averaged.astype(bc_dtype(), copy=False)
+        window_ids = np.full(len(averaged), -1, dtype=np.int32)
+        if len(window_starts):
+            counts = window_ends - window_starts + 1
+            in_window = window_membership(len(averaged), window_starts, window_ends)
+            window_ids[in_window] = np.repeat(np.arange(len(window_starts), dtype=np.int32), counts)
+        
+        if all_valid:
+            processed_bc, window_col = averaged, window_ids
+        else:
+            processed_bc = np.full(n_points, np.nan, dtype=bc_dtype())
+            processed_bc[rows] = averaged
+            window_col = np.full(n_points, -1, dtype=np.int32)
+            window_col[rows] = window_ids
+        
+        outputs[bc_col] = (bc_values, processed_bc, window_col)
+    return atn_values, outputs
+
+def apply_ona_multi(df, series=None, atn_min=0.01, job_id=None, max_workers=None):
+    """
+    Apply ONA to several (ATN, BC) series of one parsed frame and return a single table.
+    
+    The frame is sorted once and its timestamp array is shared by every series. Series
+    are grouped by ATN column and the groups run on a thread pool. For each BC column
+    the table has its raw values, '<bc>Processed' and '<bc>Window' (the ONA window
+    index, -1 for rows outside a closed window).
+    """
+    try:
+        if job_id:
+            processing_status[job_id] = "Applying ONA"
+            processing_messages[job_id] = "Applying ONA to all measurement series..."
+            processing_progress[job_id] = 70
+        
+        if series is None:
+            series = resolve_ona_series(df.columns)
+        if not series:
+            raise ValueError("No ATN/BC column pairs found")
+        
+        df = df.sort_values('timestamp')
+        
+        groups = {}
+        for _, _, atn_col, bc_col in series:
+            groups.setdefault(atn_col, [])
+            if bc_col not in groups[atn_col]:
+                groups[atn_col].append(bc_col)
+        
+        max_workers = max(1, min(max_workers or os.cpu_count() or 1, len(groups)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                atn_col: executor.submit(_ona_for_atn_column, df, atn_col, bc_cols, atn_min)
+                for atn_col, bc_cols in groups.items()
+            }
+            results = {atn_col: future.result() for atn_col, future in futures.items()}
+        
+        columns = {'timestamp': df['timestamp'].to_numpy()}
+        for atn_col, (atn_values, outputs) in results.items():
+            columns[atn_col] = atn_values
+            for bc_col, (bc_values, processed_bc, window_ids) in outputs.items():
+                columns[bc_col] = bc_values
+                columns[f'{bc_col}Processed'] = processed_bc
+                columns[f'{bc_col}Window'] = window_ids
+        
+        result = pd.DataFrame(columns, copy=False)
+        logger.debug("Multi-series ONA processed %s series over %s ATN columns", len(series), len(groups))
+        
+        if job_id:
+            processing_messages[job_id] = f"ONA applied to {len(series)} measurement series"
+            processing_progress[job_id] = 95
+        
+        return result
+        
+    except Exception as e:
+        error_msg = f"Error in multi-series ONA: {str(e)}"
+        if job_id:
+            processing_status[job_id] = "Error"
+            processing_messages[job_id] = error_msg
+        logger.error(error_msg)
         raise RuntimeError(error_msg)
 
 def process_ona_chunk(df, atn_col, bc_col, atn_min):
     """Process a chunk of data with the ONA algorithm - kept for compatibility"""
     # This function is maintained for backward compatibility
     # but we recommend using the optimized apply_ona_algorithm instead
-    return apply_ona_algorithm(df, wavelength=atn_col.replace('ATN1', ''), atn_min=atn_min)[1]
+    return apply_ona_algorithm(df, wavelength=atn_col.replace('ATN1', ''), atn_min=atn_min)
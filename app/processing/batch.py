@@ -0,0 +1,107 @@
+import logging
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from app.processing.aethalometer import process_aethalometer_data_in_chunks
+from app.utils.status_tracker import processing_status, processing_progress, processing_messages
+from app.utils.cancellation import cancel_requested, check_cancelled
+
+logger = logging.getLogger(__name__)
+
+# Worker processes used to parse the files of a batch
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', os.cpu_count() or 1))
+
+# Workers are started from the job's background thread, so avoid plain fork there
+BATCH_START_METHOD = os.environ.get('BATCH_START_METHOD', 'forkserver')
+
+def list_archive_members(archive_path):
+    """List the CSV files inside a zip archive of daily instrument files"""
+    with zipfile.ZipFile(archive_path) as archive:
+        members = sorted(
+            info.filename for info in archive.infolist()
+            if not info.is_dir() and not info.filename.startswith('__MACOSX')
+            and info.filename.lower().endswith('.csv')
+        )
+    if not members:
+        raise ValueError("Archive does not contain any CSV files")
+    return [(archive_path, member) for member in members]
+
+def describe_input(item):
+    """Human-readable name of a batch input (a path or an archive member)"""
+    if isinstance(item, tuple):
+        return item[1]
+    return os.path.basename(item)
+
+def parse_batch_input(item):
+    """Parse one batch input in a worker process"""
+    if isinstance(item, tuple):
+        archive_path, member = item
+        with zipfile.ZipFile(archive_path) as archive:
+            info = archive.getinfo(member)
+            with archive.open(info) as stream:
+                stream.total_size = info.file_size
+                return process_aethalometer_data_in_chunks(stream)
+    return process_aethalometer_data_in_chunks(item)
+
+def parse_files_parallel(inputs, max_workers=None, job_id=None):
+    """Parse many aethalometer files on a worker pool, returning frames in input order"""
+    max_workers = max(1, min(max_workers or BATCH_WORKERS, len(inputs)))
+
+    if job_id:
+        processing_status[job_id] = "Reading"
+        processing_messages[job_id] = f"Parsing {len(inputs)} files with {max_workers} workers..."
+        processing_progress[job_id] = 5
+
+    frames = [None] * len(inputs)
+    if max_workers == 1:
+        for i, item in enumerate(inputs):
+            check_cancelled(job_id)
+            frames[i] = parse_batch_input(item)
+            if job_id:
+                processing_progress[job_id] = 5 + int((i + 1) * 55 / len(inputs))
+        return frames
+
+    context = multiprocessing.get_context(BATCH_START_METHOD)
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        futures = {executor.submit(parse_batch_input, item): i for i, item in enumerate(inputs)}
+        for done, future in enumerate(as_completed(futures), 1):
+            if cancel_requested(job_id):
+                # Files not started yet are dropped; the ones being parsed finish in their workers
+                for pending in futures:
+                    pending.cancel()
+                check_cancelled(job_id)
+            i = futures[future]
+            try:
+                frames[i] = future.result()
+            except Exception as e:
+                raise RuntimeError(f"Error parsing {describe_input(inputs[i])}: {str(e)}")
+            if job_id:
+                processing_progress[job_id] = 5 + int(done * 55 / len(inputs))
+                processing_messages[job_id] = f"Parsed {done}/{len(inputs)} files..."
+
+    return frames
+
+def merge_aethalometer_frames(frames, job_id=None):
+    """Merge per-file frames into one continuous series sorted and deduplicated by timestamp"""
+    if job_id:
+        processing_messages[job_id] = "Merging files into a continuous series..."
+        processing_progress[job_id] = 62
+
+    frames = [frame for frame in frames if frame is not None and not frame.empty]
+    if not frames:
+        raise ValueError("No aethalometer data found in batch")
+
+    df = pd.concat(frames, ignore_index=True)
+    df = df.dropna(subset=['timestamp'])
+
+    # Daily files often overlap at midnight; keep the first reading of each timestamp
+    df = df.sort_values('timestamp', kind='mergesort')
+    before = len(df)
+    df = df.drop_duplicates(subset=['timestamp'], keep='first').reset_index(drop=True)
+    logger.debug("Merged %s files into %s rows (%s duplicate timestamps dropped)", len(frames), len(df), before - len(df))
+
+    if job_id:
+        processing_progress[job_id] = 70
+    return df
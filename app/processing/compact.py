@@ -0,0 +1,43 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Opt-in compact representation of measurement data: BC columns, raw and processed, are
+# held as float32 instead of float64 from ingestion through ONA, shared arrays, spill
+# files and outputs. BC is integer-like ng/m³, exact in float32; window means are still
+# accumulated in float64. ATN stays float64: windows close on differences of readings
+# that are close to atn_min, and ATN with six decimals exceeds float32's ~7 significant
+# digits once it passes 10, which moved most window boundaries (benchmarks/accuracy.py).
+# Timestamps are datetime64[ns], already 64-bit integers. Single-series ONA output
+# (apply_ona_algorithm) keeps its bool windowStart/windowEnd flags in both modes rather
+# than the int32 window id of apply_ona_multi: the flags take 2 bytes per row against 4,
+# and plots, disk mode and exports read them.
+COMPACT_DTYPES = os.environ.get('COMPACT_DTYPES', '0') == '1'
+
+def bc_dtype():
+    """dtype BC values are stored in"""
+    return np.float32 if COMPACT_DTYPES else np.float64
+
+def compact_columns(df, columns):
+    """
+    In compact mode, store the given columns as float32, with unparseable values as NaN
+    like the validation before ONA; otherwise return the frame unchanged.
+    """
+    if not COMPACT_DTYPES:
+        return df
+    columns = [col for col in columns if col in df.columns and df[col].dtype != np.float32]
+    if not columns:
+        return df
+    return df.assign(**{col: pd.to_numeric(df[col], errors='coerce').astype(np.float32) for col in columns})
+
+def json_floats(df):
+    """
+    Frame for JSON output with float32 columns widened at their shortest decimal form.
+
+    Plain widening would serialize 0.281023 as 0.2810229957103729; going through the
+    float32 repr keeps the value that was read and that CSV outputs show.
+    """
+    columns = [col for col in df.columns if df[col].dtype == np.float32]
+    if not columns:
+        return df
+    return df.astype({col: str for col in columns}).astype({col: np.float64 for col in columns})
@@ -0,0 +1,272 @@
+import logging
+import os
+import numpy as np
+import pandas as pd
+from app.processing.aethalometer import iter_aethalometer_chunks, find_measurement_columns
+from app.processing.segmentation import find_segmented_windows
+from app.processing.export import write_indexed_csv
+from app.processing.weather import synchronize_data
+from app.processing.compact import bc_dtype
+from app.utils.shared_arrays import ArraySpool, allocate_array, attach_array, release_array
+from app.utils.status_tracker import processing_status, processing_progress, processing_messages
+from app.utils.cancellation import check_cancelled
+
+logger = logging.getLogger(__name__)
+
+# Memory the processing of one job should stay under; larger inputs are processed from disk
+MEMORY_BUDGET_MB = int(os.environ.get('MEMORY_BUDGET_MB', 1024))
+
+# 'auto' spills inputs expected to exceed the budget, 'always' and 'never' force a mode
+DISK_MODE = os.environ.get('DISK_MODE', 'auto')
+
+# Rough peak memory of parsing and ONA relative to the CSV (measured at 3.1 on the
+# 200k-row MA350 benchmark file, with some margin), and of a CSV relative to its
+# compressed file. With the default budget, CSVs from about 300 MB are spilled.
+FRAME_BYTES_PER_CSV_BYTE = 3.5
+CSV_BYTES_PER_COMPRESSED_BYTE = 8
+
+# Bytes of temporaries per row while a block is processed
+BLOCK_BYTES_PER_ROW = 128
+
+COMPRESSED_SUFFIXES = ('.gz', '.zst', '.zip')
+
+def memory_budget_bytes():
+    return MEMORY_BUDGET_MB * 1024 * 1024
+
+def block_rows():
+    """Rows processed at a time so a block's temporaries use a fraction of the budget"""
+    return max(10000, memory_budget_bytes() // (4 * BLOCK_BYTES_PER_ROW))
+
+def use_disk_mode(total_size, filename=''):
+    """Decide whether a job should spill its arrays to disk instead of holding frames in memory"""
+    if DISK_MODE in ('always', 'never'):
+        return DISK_MODE == 'always'
+    estimate = total_size * FRAME_BYTES_PER_CSV_BYTE
+    if filename.lower().endswith(COMPRESSED_SUFFIXES):
+        estimate *= CSV_BYTES_PER_COMPRESSED_BYTE
+    return estimate > memory_budget_bytes()
+
+def release_spilled(spilled):
+    """Delete the files behind every spilled array of a job"""
+    for descriptor in spilled.get('arrays', {}).values():
+        release_array(descriptor)
+
+def spill_aethalometer_data(file_path, wavelength, job_id=None):
+    """
+    Parse an aethalometer file chunk by chunk, keeping only the columns ONA needs.
+
+    Timestamps (as int64 UTC nanoseconds), ATN and BC of the wavelength (BC as float32
+    in compact mode, see compact.py) are appended to memory-mapped spill files and each
+    parsed chunk is dropped before the next is read, so the full frame is never held in
+    memory. Rows are sorted by timestamp on disk when the file is not already in order.
+    """
+    if job_id:
+        processing_status[job_id] = "Reading"
+        processing_messages[job_id] = "Reading data in disk-backed mode..."
+        processing_progress[job_id] = 5
+
+    spools = {'timestamp': ArraySpool(np.int64), 'atn': ArraySpool(np.float64), 'bc': ArraySpool(bc_dtype())}
+    atn_col = bc_col = None
+    last_timestamp = None
+    in_order = True
+    try:
+        for chunk in iter_aethalometer_chunks(file_path, job_id=job_id, max_chunk_bytes=memory_budget_bytes() // 4):
+            if atn_col is None:
+                atn_col, bc_col = find_measurement_columns(chunk.columns, wavelength)
+                if not (atn_col and bc_col):
+                    raise ValueError(f"Required columns for {wavelength} wavelength not found")
+                logger.debug("Disk-backed mode, found columns - ATN: %s, BC: %s", atn_col, bc_col)
+
+            atn = pd.to_numeric(chunk[atn_col], errors='coerce').to_numpy(dtype=np.float64)
+            bc = pd.to_numeric(chunk[bc_col], errors='coerce').to_numpy(dtype=bc_dtype())
+            timestamps = chunk['timestamp']
+            keep = ~(np.isnan(atn) | np.isnan(bc) | timestamps.isna().to_numpy())
+            times = timestamps[keep].dt.as_unit('ns').dt.tz_localize(None).to_numpy().view(np.int64)
+            del chunk
+
+            if len(times):
+                if (last_timestamp is not None and times[0] < last_timestamp) or (np.diff(times) < 0).any():
+                    in_order = False
+                last_timestamp = times[-1]
+            spools['timestamp'].append(times)
+            spools['atn'].append(atn[keep])
+            spools['bc'].append(bc[keep])
+    except Exception:
+        for spool in spools.values():
+            spool.discard()
+        raise
+
+    spilled = {
+        'arrays': {key: spool.finish() for key, spool in spools.items()},
+        'atn_col': atn_col,
+        'bc_col': bc_col,
+        'rows': spools['timestamp'].length
+    }
+    if spilled['rows'] == 0:
+        release_spilled(spilled)
+        raise ValueError("Invalid aethalometer data format")
+
+    if not in_order:
+        if job_id:
+            processing_messages[job_id] = "Sorting spilled data by timestamp..."
+        _sort_spilled(spilled)
+
+    if job_id:
+        processing_messages[job_id] = f"Spilled {spilled['rows']} rows to disk"
+        processing_progress[job_id] = 70
+    return spilled
+
+def _sort_spilled(spilled):
+    """Reorder every spilled array by timestamp, block by block"""
+    order = np.argsort(attach_array(spilled['arrays']['timestamp']), kind='stable')
+    step = block_rows()
+    for key, descriptor in list(spilled['arrays'].items()):
+        values = attach_array(descriptor)
+        sorted_ref, sorted_values = allocate_array(values.shape, values.dtype, backend='raw')
+        for start in range(0, len(order), step):
+            sorted_values[start:start + step] = values[order[start:start + step]]
+        sorted_values.flush()
+        del values
+        release_array(descriptor)
+        spilled['arrays'][key] = sorted_ref
+
+def _window_sums(bc_values, window_starts, window_ends, step):
+    """Per-window BC sums accumulated block by block"""
+    sums = np.zeros(len(window_starts))
+    n_points = len(bc_values)
+    for start in range(0, n_points, step):
+        stop = min(n_points, start + step)
+        lo = np.searchsorted(window_ends, start, side='left')
+        hi = np.searchsorted(window_starts, stop, side='left')
+        if lo >= hi:
+            continue
+        # Windows are clipped to the block; a window crossing blocks gets its parts added up
+        seg_starts = np.maximum(window_starts[lo:hi], start) - start
+        seg_ends = np.minimum(window_ends[lo:hi] + 1, stop) - start
+        bounds = np.column_stack((seg_starts, seg_ends)).ravel()
+        if bounds[-1] == stop - start:
+            bounds = bounds[:-1]
+        block = np.asarray(bc_values[start:stop], dtype=np.float64)
+        sums[lo:hi] += np.add.reduceat(block, bounds)[::2]
+    return sums
+
+def apply_ona_disk(spilled, atn_min=0.01, job_id=None):
+    """
+    Run ONA over spilled arrays and write processed BC to another spill file.
+
+    Window boundaries are kept in memory (two integers per window); BC is read and
+    written in blocks.
+    """
+    if job_id:
+        processing_status[job_id] = "Applying ONA"
+        processing_messages[job_id] = "Applying ONA algorithm in disk-backed mode..."
+        processing_progress[job_id] = 72
+
+    arrays = spilled['arrays']
+    timestamps = attach_array(arrays['timestamp']).view('datetime64[ns]')
+    atn_values = attach_array(arrays['atn'])
+    bc_values = attach_array(arrays['bc'])
+    window_starts, window_ends, _ = find_segmented_windows(atn_values, timestamps, atn_min,
+                                                           progress_callback=lambda _: check_cancelled(job_id))
+
+    step = block_rows()
+    counts = window_ends - window_starts + 1
+    means = _window_sums(bc_values, window_starts, window_ends, step) / np.maximum(counts, 1)
+
+    # Stored like the raw BC it replaces; the window means themselves are float64
+    processed_ref, processed = allocate_array(bc_values.shape, bc_values.dtype, backend='raw')
+    for start in range(0, len(bc_values), step):
+        check_cancelled(job_id)
+        rows = np.arange(start, min(len(bc_values), start + step))
+        window_ids = np.searchsorted(window_starts, rows, side='right') - 1
+        safe_ids = np.maximum(window_ids, 0)
+        in_window = (window_ids >= 0) & (rows <= window_ends[safe_ids]) if len(window_starts) else np.zeros(len(rows), dtype=bool)
+        block = np.asarray(bc_values[start:start + step], dtype=np.float64)
+        processed[start:start + step] = np.where(in_window, means[safe_ids] if len(means) else block, block)
+        if job_id:
+            processing_progress[job_id] = 72 + int(20 * min(1.0, (start + step) / len(bc_values)))
+    processed.flush()
+
+    arrays['processedBC'] = processed_ref
+    spilled['window_starts'] = window_starts
+    spilled['window_ends'] = window_ends
+    logger.debug("Disk-backed ONA found %s windows over %s rows", len(window_starts), spilled['rows'])
+    return spilled
+
+def iter_result_blocks(spilled, step=None):
+    """Yield the processed output in blocks, with the same columns as apply_ona_algorithm()"""
+    step = step or block_rows()
+    arrays = spilled['arrays']
+    timestamps = attach_array(arrays['timestamp'])
+    atn_values = attach_array(arrays['atn'])
+    bc_values = attach_array(arrays['bc'])
+    processed = attach_array(arrays['processedBC'])
+    window_starts = spilled['window_starts']
+    window_ends = spilled['window_ends']
+
+    for start in range(0, spilled['rows'], step):
+        stop = min(spilled['rows'], start + step)
+        block = pd.DataFrame({
+            'timestamp': np.asarray(timestamps[start:stop]).view('datetime64[ns]'),
+            'rawBC': np.asarray(bc_values[start:stop]),
+            'processedBC': np.asarray(processed[start:stop])
+        })
+        block[spilled['atn_col']] = np.asarray(atn_values[start:stop])
+        starts_in = window_starts[(window_starts >= start) & (window_starts < stop)] - start
+        ends_in = window_ends[(window_ends >= start) & (window_ends < stop)] - start
+        block['windowStart'] = False
+        block['windowEnd'] = False
+        block.iloc[starts_in, block.columns.get_loc('windowStart')] = True
+        block.iloc[ends_in, block.columns.get_loc('windowEnd')] = True
+        yield block
+
+def iter_combined_blocks(spilled, weather_df, step=None):
+    """
+    The processed output merged with weather data, block by block.
+
+    synchronize_data() matches each row to its nearest weather reading on its own, so
+    merging block by block gives the same rows as merging the whole output at once;
+    only the (much smaller) weather frame is held in memory.
+    """
+    for block in iter_result_blocks(spilled, step=step):
+        yield synchronize_data(block, weather_df)
+
+def write_result_csv(spilled, path):
+    """Write the processed output to CSV block by block, with the sparse time index used by exports"""
+    write_indexed_csv(iter_result_blocks(spilled), path)
+
+def result_head(spilled, rows):
+    """First rows of the processed output"""
+    return next(iter_result_blocks(spilled, step=max(1, rows)))
+
+def result_preview(spilled, max_points=10000):
+    """
+    Reduced copy of the processed output for plots.
+
+    Like downsample_data(), every max_points-th timestamp is kept with the mean of
+    the rows it stands for, replaced by the maximum where the spread is significant;
+    the statistics are taken over consecutive blocks rather than rolling windows so
+    the full series never has to be loaded.
+    """
+    n_points = spilled['rows']
+    stride = max(1, -(-n_points // max_points))
+    step = max(stride, block_rows() // stride * stride)
+    columns = ['rawBC', 'processedBC', spilled['atn_col']]
+
+    timestamps, means, mins, maxs = [], {c: [] for c in columns}, {c: [] for c in columns}, {c: [] for c in columns}
+    for block in iter_result_blocks(spilled, step=step):
+        bounds = np.arange(0, len(block), stride)
+        timestamps.append(block['timestamp'].to_numpy()[bounds])
+        sizes = np.diff(np.append(bounds, len(block)))
+        for col in columns:
+            values = block[col].to_numpy(dtype=np.float64)
+            means[col].append(np.add.reduceat(values, bounds) / sizes)
+            mins[col].append(np.minimum.reduceat(values, bounds))
+            maxs[col].append(np.maximum.reduceat(values, bounds))
+
+    preview = pd.DataFrame({'timestamp': np.concatenate(timestamps)})
+    for col in columns:
+        mean, low, high = (np.concatenate(parts[col]) for parts in (means, mins, maxs))
+        significant = (high - low) > pd.Series(mean).std()
+        preview[col] = np.where(significant, high, mean)
+    return preview
@@ -0,0 +1,398 @@
+import bisect
+import io
+import json
+import logging
+import os
+import struct
+import zlib
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Rows between the entries of a result's sparse time index
+EXPORT_INDEX_ROWS = int(os.environ.get('EXPORT_INDEX_ROWS', 10000))
+
+# Rows read and encoded at a time while streaming an export
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', 50000))
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'netcdf': ('application/x-netcdf', 'nc')
+}
+
+INDEX_SUFFIX = '.index.json'
+
+def index_path(csv_path):
+    return csv_path + INDEX_SUFFIX
+
+def write_indexed_csv(frames, path):
+    """
+    Write frames to one CSV with a sparse time index next to it.
+
+    Every EXPORT_INDEX_ROWS rows the index records the first timestamp (UTC
+    nanoseconds) and the byte offset of the row, so an export of a time range can seek
+    straight to it instead of parsing the file from the start. The frames must follow
+    each other in time order.
+    """
+    columns = None
+    entries = []
+    rows = 0
+    with open(path, 'wb') as f:
+        for frame in frames:
+            if columns is None:
+                columns = list(frame.columns)
+                frame.head(0).to_csv(f, index=False, encoding='utf-8')
+            times = pd.to_datetime(frame['timestamp'], utc=True)
+            for start in range(0, len(frame), EXPORT_INDEX_ROWS):
+                block = frame.iloc[start:start + EXPORT_INDEX_ROWS]
+                entries.append([int(times.iloc[start].value), f.tell(), len(block)])
+                block.to_csv(f, index=False, header=False, encoding='utf-8')
+                rows += len(block)
+    with open(index_path(path), 'w') as f:
+        json.dump({'columns': columns, 'rows': rows, 'blocks': entries}, f)
+    return path
+
+def load_index(path):
+    """Sparse time index of a result CSV, or one covering the whole file for results written without it"""
+    try:
+        with open(index_path(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        with open(path, 'rb') as f:
+            columns = f.readline().decode('utf-8').strip().split(',')
+            return {'columns': columns, 'rows': None, 'blocks': [[None, f.tell(), None]]}
+
+def export_columns(index, requested=None):
+    """Columns of an export, timestamp first; raises ValueError for unknown columns"""
+    available = [c for c in index['columns'] if c != 'timestamp']
+    if not requested:
+        return ['timestamp'] + available
+    unknown = [c for c in requested if c not in available and c != 'timestamp']
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}. Available: {', '.join(available)}")
+    return ['timestamp'] + [c for c in requested if c != 'timestamp']
+
+def parse_resample(rule):
+    """Fixed resampling interval such as 1h or 15min; raises ValueError otherwise"""
+    if not rule:
+        return None
+    try:
+        offset = pd.tseries.frequencies.to_offset(rule)
+    except ValueError:
+        offset = None
+    if not isinstance(offset, pd.offsets.Tick):
+        raise ValueError('Invalid resample interval. Use a fixed interval such as 1min, 15min, 1h or 1D')
+    return offset
+
+def _parse_utc(values):
+    """Parse timestamp strings as UTC; an explicit +00:00 is dropped first as offsets parse several times slower"""
+    if len(values) and values.iloc[0].endswith('+00:00') and values.iloc[-1].endswith('+00:00'):
+        values = values.str[:-6]
+    return pd.to_datetime(values, utc=True, format='ISO8601')
+
+def iter_range_chunks(path, index, columns, start=None, end=None):
+    """Parsed chunks of the rows between start and end (inclusive), read from the indexed offset onwards"""
+    blocks = index['blocks']
+    first, last = 0, len(blocks)
+    if blocks[0][0] is not None:
+        block_starts = [b[0] for b in blocks]
+        if start is not None:
+            # Last block starting at or before start; earlier blocks cannot hold rows in range
+            first = max(0, bisect.bisect_right(block_starts, start.value) - 1)
+        if end is not None:
+            # Blocks starting after end cannot either
+            last = max(first + 1, bisect.bisect_right(block_starts, end.value))
+    rows = sum(b[2] for b in blocks[first:last]) if blocks[0][2] is not None else None
+
+    with open(path, 'rb') as f:
+        f.seek(blocks[first][1])
+        reader = pd.read_csv(f, header=None, names=index['columns'], usecols=columns, nrows=rows,
+                             dtype={'timestamp': str}, chunksize=min(EXPORT_CHUNK_ROWS, EXPORT_INDEX_ROWS * 2))
+        for chunk in reader:
+            chunk['timestamp'] = _parse_utc(chunk['timestamp'])
+            chunk = chunk[columns]
+            if start is not None:
+                chunk = chunk[chunk['timestamp'] >= start]
+            if end is not None:
+                past_end = chunk['timestamp'] > end
+                if past_end.any():
+                    chunk = chunk[~past_end]
+                    if len(chunk):
+                        yield chunk
+                    return
+            if len(chunk):
+                yield chunk
+
+def _aggregate(frame, offset):
+    bins = frame['timestamp'].dt.floor(offset).rename('timestamp')
+    values = frame.drop(columns='timestamp')
+    if values.empty:
+        return bins.drop_duplicates().to_frame()
+    aggregations = {c: 'max' if values[c].dtype == bool else 'mean' for c in values.columns}
+    return values.groupby(bins).agg(aggregations).reset_index()
+
+def resample_chunks(chunks, offset):
+    """
+    Mean of each interval (window flags: whether any row had them), chunk by chunk.
+
+    Intervals are aligned to the epoch. The rows of the last interval of a chunk are
+    held back until the next chunk shows the interval is complete.
+    """
+    pending = None
+    for chunk in chunks:
+        if pending is not None:
+            chunk = pd.concat([pending, chunk], ignore_index=True)
+        last_bin = chunk['timestamp'].iloc[-1].floor(offset)
+        complete = chunk['timestamp'] < last_bin
+        pending = chunk[~complete]
+        if complete.any():
+            yield _aggregate(chunk[complete], offset)
+    if pending is not None and len(pending):
+        yield _aggregate(pending, offset)
+
+def encode_csv(chunks, columns):
+    header = True
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=header).encode('utf-8')
+        header = False
+    if header:
+        yield (','.join(columns) + '\n').encode('utf-8')
+
+class _DrainedSink(io.RawIOBase):
+    """Write-only file whose contents are handed out and forgotten, for writers that need a file"""
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+def encode_parquet(chunks, columns):
+    """
+    Parquet row groups written as the chunks arrive (requires pyarrow).
+
+    The schema is taken from the first chunk and later chunks are converted to it, so a
+    column whose inferred type would differ in one chunk (all empty, say) still matches
+    the file.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _DrainedSink()
+    writer = None
+    for chunk in chunks:
+        if writer is None:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            writer = pq.ParquetWriter(sink, table.schema)
+        else:
+            table = pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False)
+        writer.write_table(table)
+        yield sink.drain()
+    if writer is None:
+        writer = pq.ParquetWriter(sink, pa.schema([('timestamp', pa.timestamp('ns', tz='UTC'))]))
+    writer.close()
+    yield sink.drain()
+
+# netCDF classic (CDF-1) tags and types
+NC_DIMENSION, NC_VARIABLE, NC_ATTRIBUTE = 0x0A, 0x0B, 0x0C
+NC_CHAR, NC_INT, NC_FLOAT, NC_DOUBLE = 2, 4, 5, 6
+NC_NUMRECS_OFFSET = 4
+NC_RECORD_TYPES = {NC_INT: '>i4', NC_FLOAT: '>f4', NC_DOUBLE: '>f8'}
+
+# Record count of a netCDF file written before its length is known
+NC_STREAMING = 0xFFFFFFFF
+
+UNIX_EPOCH = pd.Timestamp(0, tz='UTC')
+
+def _nc_name(name):
+    data = name.encode('utf-8')
+    return struct.pack('>i', len(data)) + data + b'\0' * (-len(data) % 4)
+
+def _nc_text_attributes(attributes):
+    if not attributes:
+        return b'\0' * 8
+    out = struct.pack('>ii', NC_ATTRIBUTE, len(attributes))
+    for key, value in attributes.items():
+        out += _nc_name(key) + struct.pack('>i', NC_CHAR) + _nc_name(value)
+    return out
+
+def netcdf_header(variables, numrecs=0):
+    """
+    Header of a netCDF classic file whose variables all run along an unlimited time dimension.
+
+    variables is a list of (name, nc_type, attributes). The record count sits at
+    NC_NUMRECS_OFFSET so it can be filled in once the records are written.
+    """
+    sizes = {NC_INT: 4, NC_FLOAT: 4, NC_DOUBLE: 8}
+
+    def build(begins):
+        out = b'CDF\x01' + struct.pack('>I', numrecs)
+        out += struct.pack('>ii', NC_DIMENSION, 1) + _nc_name('time') + struct.pack('>i', 0)
+        out += _nc_text_attributes({'source': 'Aethalometer ONA processed data export'})
+        out += struct.pack('>ii', NC_VARIABLE, len(variables))
+        for (name, nc_type, attributes), begin in zip(variables, begins):
+            out += _nc_name(name) + struct.pack('>ii', 1, 0) + _nc_text_attributes(attributes)
+            out += struct.pack('>iii', nc_type, sizes[nc_type], begin)
+        return out
+
+    length = len(build([0] * len(variables)))
+    offsets = np.cumsum([0] + [sizes[t] for _, t, _ in variables[:-1]])
+    return build([length + int(o) for o in offsets])
+
+def _netcdf_variables(columns, chunk):
+    variables = []
+    for col in columns:
+        if col == 'timestamp':
+            variables.append((col, NC_DOUBLE, {'units': 'seconds since 1970-01-01 00:00:00', 'calendar': 'standard',
+                                               'time_zone': 'UTC'}))
+        elif chunk is not None and chunk[col].dtype == bool:
+            variables.append((col, NC_INT, {}))
+        elif chunk is not None and chunk[col].dtype == np.float32:
+            # Compact-mode measurements (see compact.py) keep their size on disk
+            variables.append((col, NC_FLOAT, {}))
+        else:
+            variables.append((col, NC_DOUBLE, {}))
+    return variables
+
+def _netcdf_parts(chunks, columns, numrecs=0):
+    """Header and records (one per row) of a netCDF file"""
+    header_sent = False
+    dtype = None
+    for chunk in chunks:
+        if not header_sent:
+            variables = _netcdf_variables(columns, chunk)
+            dtype = np.dtype([(name, NC_RECORD_TYPES[nc_type]) for name, nc_type, _ in variables])
+            yield netcdf_header(variables, numrecs)
+            header_sent = True
+        records = np.empty(len(chunk), dtype=dtype)
+        for name in columns:
+            if name == 'timestamp':
+                # Naive timestamps, such as those of in-memory ONA output, are UTC
+                times = chunk[name] if chunk[name].dt.tz is not None else chunk[name].dt.tz_localize('UTC')
+                records[name] = (times - UNIX_EPOCH) / pd.Timedelta(seconds=1)
+            elif dtype[name].kind == 'f':
+                records[name] = chunk[name].to_numpy(dtype=dtype[name].newbyteorder('='), na_value=np.nan)
+            else:
+                records[name] = chunk[name].to_numpy(dtype=np.int32)
+        yield records.tobytes()
+    if not header_sent:
+        yield netcdf_header(_netcdf_variables(columns, None), numrecs)
+
+def write_netcdf(f, chunks, columns):
+    """
+    Write a netCDF classic file to a seekable file as the chunks arrive, then its
+    record count into the header; returns the number of records.
+
+    The count is only known at the end, and readers such as scipy's netcdf_file
+    reject the STREAMING count the format allows instead.
+    """
+    rows = 0
+    start = f.tell()
+    def counted(chunks):
+        nonlocal rows
+        for chunk in chunks:
+            rows += len(chunk)
+            yield chunk
+    for part in _netcdf_parts(counted(chunks), columns):
+        f.write(part)
+    end = f.tell()
+    f.seek(start + NC_NUMRECS_OFFSET)
+    f.write(struct.pack('>I', rows))
+    f.seek(end)
+    return rows
+
+def encode_netcdf(chunks, columns, rows=None):
+    """
+    netCDF classic file streamed as the chunks arrive, for outputs that cannot seek back
+    to the record count (HTTP responses, gzip).
+
+    rows is the number of rows the chunks hold, counted beforehand (see stream_export);
+    without it the header carries the STREAMING count, which netCDF-C reads but scipy's
+    netcdf_file does not. Raises ValueError if the chunks hold a different number of rows.
+    """
+    written = 0
+    def counted(chunks):
+        nonlocal written
+        for chunk in chunks:
+            written += len(chunk)
+            yield chunk
+    yield from _netcdf_parts(counted(chunks), columns, NC_STREAMING if rows is None else rows)
+    if rows is not None and written != rows:
+        raise ValueError(f"netCDF export declared {rows} records but wrote {written}")
+
+def gzip_stream(parts, level=6):
+    """Gzip a stream of byte strings on the fly"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for part in parts:
+        data = compressor.compress(part)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def iter_export_chunks(sources, columns, start=None, end=None, resample=None):
+    """Parsed chunks of the rows in range of (path, index) sources that follow each other in time"""
+    def chunks():
+        for path, index in sources:
+            yield from iter_range_chunks(path, index, columns, start, end)
+    return resample_chunks(chunks(), resample) if resample is not None else chunks()
+
+def count_export_rows(sources, start=None, end=None, resample=None):
+    """
+    Rows an export will hold: from the indexes for whole results, otherwise by a pass
+    over the range that parses the timestamp column only.
+    """
+    if start is None and end is None and resample is None and all(index['rows'] is not None for _, index in sources):
+        return sum(index['rows'] for _, index in sources)
+    return sum(len(chunk) for chunk in iter_export_chunks(sources, ['timestamp'], start, end, resample))
+
+def stream_export(paths, fmt='csv', columns=None, start=None, end=None, resample=None, compress=False):
+    """
+    Encode the rows of a result CSV in a time range as csv, parquet or netcdf, chunk by chunk.
+
+    paths is a result CSV or a list of CSVs with the same columns in time order, such as
+    the segments of a series. The range is found through the sparse time index (see
+    write_indexed_csv), only the requested columns are parsed, and with resample each
+    interval is averaged as it completes, so memory use is bounded by EXPORT_CHUNK_ROWS
+    whatever the result size. A netCDF header holds the record count, so its rows are
+    counted first.
+    """
+    paths = [paths] if isinstance(paths, str) else paths
+    sources = [(path, load_index(path)) for path in paths]
+    columns = export_columns(sources[0][1], columns)
+    rows = count_export_rows(sources, start, end, resample) if fmt == 'netcdf' else None
+    chunks = iter_export_chunks(sources, columns, start, end, resample)
+    return encode_chunks(chunks, columns, fmt, compress, rows)
+
+def encode_chunks(chunks, columns, fmt='csv', compress=False, rows=None):
+    """Byte strings of frames encoded as csv, parquet or netcdf (rows: see encode_netcdf), optionally gzipped"""
+    if fmt == 'parquet':
+        parts = encode_parquet(chunks, columns)
+    elif fmt == 'netcdf':
+        parts = encode_netcdf(chunks, columns, rows)
+    else:
+        parts = encode_csv(chunks, columns)
+    return gzip_stream(parts) if compress else parts
+
+def write_chunks(f, chunks, columns, fmt='csv', compress=False, rows=None):
+    """Write frames encoded as csv, parquet or netcdf to a file; uncompressed netCDF is written in place"""
+    if fmt == 'netcdf' and not compress:
+        write_netcdf(f, chunks, columns)
+        return
+    for part in encode_chunks(chunks, columns, fmt, compress, rows):
+        f.write(part)
@@ -0,0 +1,137 @@
+import logging
+import gzip
+import io
+import os
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+# Input file extensions accepted for aethalometer and weather uploads
+INPUT_EXTENSIONS = {'csv', 'csv.gz', 'csv.zst', 'zip'}
+
+# Magic numbers used to recognise compressed inputs regardless of their file name
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+ZIP_MAGIC = b'PK\x03\x04'
+
+# Read-ahead buffer between the compressed file and the decompressor
+READ_BUFFER_SIZE = 1024 * 1024
+
+class CountingReader(io.RawIOBase):
+    """Pass-through binary reader that counts the (compressed) bytes consumed from its source"""
+    def __init__(self, raw):
+        super().__init__()
+        self.raw = raw
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.raw.read(len(buffer))
+        size = len(data)
+        buffer[:size] = data
+        self.bytes_read += size
+        return size
+
+    def seekable(self):
+        return self.raw.seekable()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.raw.seek(offset, whence)
+
+    def tell(self):
+        return self.raw.tell()
+
+    def close(self):
+        if not self.closed:
+            self.raw.close()
+        super().close()
+
+def _select_zip_member(archive):
+    """Pick the CSV file inside a zip archive"""
+    members = [
+        info for info in archive.infolist()
+        if not info.is_dir() and not info.filename.startswith('__MACOSX')
+        and info.filename.lower().endswith('.csv')
+    ]
+    if not members:
+        raise ValueError("Zip archive does not contain a CSV file")
+    if len(members) > 1:
+        logger.debug("Zip archive has %s CSV files, reading %s", len(members), members[0].filename)
+    return members[0]
+
+class InputStream:
+    """
+    Decompressed, read-only view of an input file.
+
+    `stream` yields the CSV bytes (inflated on the fly for .gz, .zst and .zip inputs,
+    nothing is written to disk), while `bytes_read` and `total_size` refer to the file
+    as stored, so progress reflects the compressed bytes consumed.
+    """
+    def __init__(self, source):
+        if hasattr(source, 'read'):
+            raw = source
+            self.total_size = source.total_size
+        else:
+            raw = open(source, 'rb')
+            self.total_size = os.path.getsize(source)
+
+        self._counter = CountingReader(raw)
+        self._archive = None
+        buffered = io.BufferedReader(self._counter, buffer_size=READ_BUFFER_SIZE)
+        magic = buffered.peek(4)[:4]
+
+        try:
+            if magic.startswith(GZIP_MAGIC):
+                self.compression = 'gzip'
+                self.stream = gzip.GzipFile(fileobj=buffered, mode='rb')
+            elif magic == ZSTD_MAGIC:
+                self.compression = 'zstd'
+                try:
+                    import zstandard
+                except ImportError:
+                    raise ValueError("Reading .zst files requires the zstandard package")
+                reader = zstandard.ZstdDecompressor().stream_reader(buffered, read_across_frames=True)
+                self.stream = io.BufferedReader(reader, buffer_size=READ_BUFFER_SIZE)
+            elif magic == ZIP_MAGIC:
+                self.compression = 'zip'
+                if not buffered.seekable():
+                    raise ValueError("Zip archives can only be read once fully uploaded; use .csv.gz or .csv.zst to stream")
+                self._archive = zipfile.ZipFile(buffered)
+                self.stream = self._archive.open(_select_zip_member(self._archive))
+            else:
+                self.compression = None
+                self.stream = buffered
+        except Exception:
+            buffered.close()
+            raise
+
+        self._buffered = buffered
+
+    @property
+    def bytes_read(self):
+        return self._counter.bytes_read
+
+    @property
+    def fraction_read(self):
+        """Share of the stored file consumed so far, between 0 and 1"""
+        if not self.total_size:
+            return 1.0
+        return min(1.0, self.bytes_read / self.total_size)
+
+    def close(self):
+        self.stream.close()
+        if self._archive is not None:
+            self._archive.close()
+        self._buffered.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def open_input(source):
+    """Open a path or binary stream (plain, gzip, zstd or zip) for chunked CSV reading"""
+    return InputStream(source)
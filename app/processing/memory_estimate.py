@@ -0,0 +1,95 @@
+import logging
+import os
+import zipfile
+from app.processing.input_streams import open_input
+from app.processing.aethalometer import WAVELENGTHS, ONA_VARIANTS
+from app.processing.disk_mode import (
+    memory_budget_bytes, COMPRESSED_SUFFIXES, CSV_BYTES_PER_COMPRESSED_BYTE
+)
+
+logger = logging.getLogger(__name__)
+
+# Bytes of the input read to count its columns and measure its row length
+SNIFF_BYTES = 64 * 1024
+
+# Used when the head of the input cannot be read yet (an upload still arriving) or parsed;
+# an MA350 export has 77 columns and about 500 bytes per row
+DEFAULT_COLUMNS = 77
+DEFAULT_ROW_BYTES = 500
+
+# Peak memory above the idle process by stage, calibrated with the benchmark suite on
+# MA350-style files (400k rows x 77 columns): parsing peaks at ~17.5 bytes per cell while
+# chunks are combined, and that memory stays resident through ONA. ONA adds a few
+# arrays per row, each extra multi-series output ~36 bytes per row, and weather
+# synchronization a merged frame per row plus the parsed weather file.
+STAGE_MEMORY_FACTORS = {
+    'ingest_bytes_per_cell': 18,
+    'ona_bytes_per_row': 64,
+    'multi_series_bytes_per_row': 40,
+    'weather_bytes_per_row': 160,
+    'weather_bytes_per_input_byte': 5
+}
+
+def sniff_layout(path):
+    """(columns, bytes per row) of a CSV input from its first lines, or None if they cannot be read"""
+    try:
+        with open_input(path) as source:
+            head = source.stream.read(SNIFF_BYTES)
+    except Exception as e:
+        logger.debug("Could not sniff %s: %s", path, e)
+        return None
+    lines = head.split(b'\n')[:-1]
+    # A pre-allocated upload reads as NUL bytes until its first part arrives
+    if len(lines) < 2 or b'\0' in lines[0]:
+        return None
+    columns = lines[0].count(b',') + 1
+    rows = lines[1:]
+    return columns, sum(len(line) + 1 for line in rows) / len(rows)
+
+def estimate_rows(size, filename, row_bytes):
+    """Rows in an input of size bytes, allowing for compression"""
+    if filename.lower().endswith(COMPRESSED_SUFFIXES):
+        size *= CSV_BYTES_PER_COMPRESSED_BYTE
+    return int(size / max(row_bytes, 1))
+
+def count_series(ona_series):
+    """Extra ONA series written for a multi-series request"""
+    if not ona_series:
+        return 0
+    return len(ona_series['wavelengths'] or WAVELENGTHS) * len(ona_series['variants'] or ONA_VARIANTS)
+
+def estimate_peak_bytes(rows, columns, ona_series=None, weather_size=0, disk_mode=False):
+    """Peak memory of a job over its stages, from its row and column counts and requested series"""
+    factors = STAGE_MEMORY_FACTORS
+    weather = weather_size * factors['weather_bytes_per_input_byte']
+    if disk_mode:
+        # Disk-backed jobs keep their blocks and the plot preview under the per-job budget
+        return memory_budget_bytes() + weather
+
+    parsed = rows * columns * factors['ingest_bytes_per_cell']
+    ona = parsed + rows * (factors['ona_bytes_per_row'] + count_series(ona_series) * factors['multi_series_bytes_per_row'])
+    synchronized = parsed + rows * factors['weather_bytes_per_row'] + weather if weather_size else 0
+    return int(max(ona, synchronized))
+
+def estimate_job_memory(aethalometer_path, total_size, weather_path=None, ona_series=None, disk_mode=False):
+    """Estimated peak memory of a single-file job"""
+    layout = sniff_layout(aethalometer_path) or (DEFAULT_COLUMNS, DEFAULT_ROW_BYTES)
+    rows = estimate_rows(total_size, aethalometer_path, layout[1])
+    weather_size = os.path.getsize(weather_path) if weather_path else 0
+    return estimate_peak_bytes(rows, layout[0], ona_series, weather_size, disk_mode)
+
+def estimate_batch_memory(inputs, weather_path=None, ona_series=None):
+    """Estimated peak memory of a batch, whose files are merged into one frame before ONA"""
+    files = [item for item in inputs if not isinstance(item, tuple)]
+    columns, row_bytes = (sniff_layout(files[0]) if files else None) or (DEFAULT_COLUMNS, DEFAULT_ROW_BYTES)
+    rows = 0
+    for item in inputs:
+        if isinstance(item, tuple):
+            # Archive members are counted by their uncompressed size
+            archive_path, member = item
+            with zipfile.ZipFile(archive_path) as archive:
+                rows += estimate_rows(archive.getinfo(member).file_size, member, row_bytes)
+        else:
+            rows += estimate_rows(os.path.getsize(item), item, row_bytes)
+    weather_size = os.path.getsize(weather_path) if weather_path else 0
+    return estimate_peak_bytes(rows, columns, ona_series, weather_size)
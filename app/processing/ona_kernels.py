@@ -0,0 +1,184 @@
+import logging
+import os
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Requested ONA kernel backend: auto (numba when installed, else numpy), numba, numpy or python
+ONA_BACKEND = os.environ.get('ONA_BACKEND', 'auto')
+
+# Backend chosen by select_ona_backend(), reported in job metadata
+_active_backend = None
+_numba_scan = None
+
+# Rows checked one by one before the NumPy kernel switches to vectorized search
+SCALAR_PROBE_ROWS = 32
+
+def scan_windows_python(atn_values, atn_min, progress_callback=None):
+    """
+    Reference kernel: the original row-by-row Python loop.
+
+    Returns (window_starts, window_ends, open_start); see find_ona_windows().
+    """
+    n_points = len(atn_values)
+    window_starts = []
+    window_ends = []
+
+    i = 0
+    while i < n_points:
+        start_atn = atn_values[i]
+        j = i + 1
+
+        # Find window end
+        while j < n_points and (atn_values[j] - start_atn) < atn_min:
+            j += 1
+
+        if j >= n_points:
+            break
+
+        window_starts.append(i)
+        window_ends.append(j)
+        i = j + 1
+
+        # Update progress
+        if progress_callback and len(window_starts) % 100 == 0:
+            progress_callback(i / n_points)
+
+    return np.array(window_starts, dtype=np.int64), np.array(window_ends, dtype=np.int64), min(i, n_points)
+
+def scan_windows_numpy(atn_values, atn_min, progress_callback=None):
+    """
+    Pure-NumPy kernel.
+
+    Windows still chain sequentially, but after a short scalar probe (cheaper for
+    windows of a few rows) each window end is found with a vectorized comparison over
+    a slice that doubles until it contains the end, sized from the previous window.
+    The comparison is written exactly like the reference loop, so results are
+    identical, including how NaN closes a window.
+    """
+    atn_values = np.asarray(atn_values, dtype=np.float64)
+    # Python floats are much faster than NumPy scalars for the element-wise probe
+    atn_list = atn_values.tolist()
+    n_points = len(atn_values)
+    window_starts = []
+    window_ends = []
+    width = 16
+
+    i = 0
+    while i < n_points - 1:
+        start_atn = atn_list[i]
+        j = -1
+        lo = i + 1
+        probe_end = min(n_points, lo + SCALAR_PROBE_ROWS)
+        while lo < probe_end:
+            if not (atn_list[lo] - start_atn) < atn_min:
+                j = lo
+                break
+            lo += 1
+
+        step = width
+        while j < 0 and lo < n_points:
+            hi = min(n_points, lo + step)
+            closes = ~((atn_values[lo:hi] - start_atn) < atn_min)
+            k = int(closes.argmax())
+            if closes[k]:
+                j = lo + k
+                break
+            lo = hi
+            step *= 2
+
+        if j < 0:
+            break
+
+        window_starts.append(i)
+        window_ends.append(j)
+        width = max(16, 2 * (j - i))
+        i = j + 1
+
+        if progress_callback and len(window_starts) % 1000 == 0:
+            progress_callback(i / n_points)
+
+    return np.array(window_starts, dtype=np.int64), np.array(window_ends, dtype=np.int64), min(i, n_points)
+
+def _compile_numba_kernel():
+    """Build the JIT-compiled scan, or return None when numba is not installed"""
+    try:
+        from numba import njit
+    except ImportError:
+        return None
+
+    @njit(cache=True, nogil=True)
+    def scan(atn_values, atn_min, window_starts, window_ends):
+        n_points = atn_values.shape[0]
+        count = 0
+        i = 0
+        while i < n_points:
+            start_atn = atn_values[i]
+            j = i + 1
+            while j < n_points and (atn_values[j] - start_atn) < atn_min:
+                j += 1
+            if j >= n_points:
+                break
+            window_starts[count] = i
+            window_ends[count] = j
+            count += 1
+            i = j + 1
+        return count, min(i, n_points)
+
+    return scan
+
+def scan_windows_numba(atn_values, atn_min, progress_callback=None):
+    """JIT-compiled kernel; releases the GIL so several series can scan in parallel threads"""
+    atn_values = np.ascontiguousarray(atn_values, dtype=np.float64)
+    # Every closed window spans at least two rows
+    capacity = len(atn_values) // 2 + 1
+    window_starts = np.empty(capacity, dtype=np.int64)
+    window_ends = np.empty(capacity, dtype=np.int64)
+    count, open_start = _numba_scan(atn_values, float(atn_min), window_starts, window_ends)
+    if progress_callback:
+        progress_callback(1.0)
+    return window_starts[:count].copy(), window_ends[:count].copy(), int(open_start)
+
+ONA_KERNELS = {
+    'numba': scan_windows_numba,
+    'numpy': scan_windows_numpy,
+    'python': scan_windows_python
+}
+
+def select_ona_backend(name=None):
+    """
+    Choose the ONA kernel, compiling the numba backend up front if it is used.
+
+    Called once at startup; falls back to the NumPy kernel when numba is requested
+    (or auto-selected) but not installed.
+    """
+    global _active_backend, _numba_scan
+    name = name or ONA_BACKEND
+    if name not in ONA_KERNELS and name != 'auto':
+        raise ValueError(f"Unknown ONA backend: {name}")
+
+    if name in ('auto', 'numba'):
+        if _numba_scan is None:
+            _numba_scan = _compile_numba_kernel()
+        if _numba_scan is not None:
+            # Trigger compilation now rather than in the first job
+            scan_windows_numba(np.array([0.0, 1.0, 2.0]), 0.5)
+            name = 'numba'
+        else:
+            if name == 'numba':
+                logger.debug("numba is not installed, falling back to the NumPy ONA kernel")
+            name = 'numpy'
+
+    _active_backend = name
+    logger.debug("ONA kernel backend: %s", name)
+    return name
+
+def get_ona_backend():
+    """Name of the active ONA kernel backend"""
+    if _active_backend is None:
+        select_ona_backend()
+    return _active_backend
+
+def scan_ona_windows(atn_values, atn_min, progress_callback=None):
+    """Run the active ONA kernel"""
+    return ONA_KERNELS[get_ona_backend()](atn_values, atn_min, progress_callback=progress_callback)
@@ -0,0 +1,239 @@
+import logging
+import numpy as np
+import pandas as pd
+from app.processing.aethalometer import (
+    process_aethalometer_data_in_chunks, apply_ona_algorithm, find_measurement_columns
+)
+from app.processing.weather import process_weather_data, synchronize_data
+from app.processing.export import EXPORT_FORMATS, EXPORT_CHUNK_ROWS, write_chunks
+from app.processing.compact import compact_columns
+from app.utils.profiling import track_stage
+from app.utils.cancellation import check_cancelled
+
+logger = logging.getLogger(__name__)
+
+# Declared stages in the order they run: the table each produces and the tables it
+# needs. Optional inputs are used when they can be produced (weather needs a weather
+# file), but a stage is never planned only because something uses it optionally.
+# The export stage needs whichever tables were passed to Pipeline.export().
+PIPELINE_STAGES = {
+    'ingest': {'produces': 'aethalometer', 'requires': ()},
+    'ona': {'produces': 'processed', 'requires': ('aethalometer',)},
+    'weather': {'produces': 'weather', 'requires': ()},
+    'sync': {'produces': 'combined', 'requires': ('processed', 'weather')},
+    'aggregate': {'produces': 'windows', 'requires': ('processed',)},
+    'visualize': {'produces': 'plots', 'requires': ('processed',), 'optional': ('combined',)},
+    'export': {'produces': 'exports', 'requires': ()}
+}
+
+# Tables whose failure is only a warning, as in a web job: the table is then None
+WARNING_STAGES = ('weather', 'sync')
+
+def ona_columns(wavelength):
+    """
+    Chunk transform keeping the timestamp and the ATN and BC columns of a wavelength as numbers.
+
+    Fused into ingestion when nothing downstream needs the other columns, so the
+    parsed frame is combined at a few bytes per row instead of every column's.
+    """
+    def transform(chunk):
+        atn_col, bc_col = find_measurement_columns(chunk.columns, wavelength)
+        if not (atn_col and bc_col):
+            # Left whole, so ONA reports the missing columns
+            return chunk
+        chunk = chunk[['timestamp', atn_col, bc_col]].copy()
+        chunk[atn_col] = pd.to_numeric(chunk[atn_col], errors='coerce')
+        chunk[bc_col] = pd.to_numeric(chunk[bc_col], errors='coerce')
+        return compact_columns(chunk, [bc_col]).dropna(subset=[atn_col, bc_col])
+    return transform
+
+def aggregate_windows(processed_df, atn_col):
+    """
+    One row per closed ONA window: its start time, length, mean BC and ATN change.
+
+    Rows outside a closed window (the trailing one still below atn_min) are left out.
+    """
+    starts = np.flatnonzero(processed_df['windowStart'].to_numpy())
+    ends = np.flatnonzero(processed_df['windowEnd'].to_numpy())
+    timestamps = processed_df['timestamp']
+    atn_values = processed_df[atn_col].to_numpy(dtype=np.float64)
+    return pd.DataFrame({
+        'timestamp': timestamps.iloc[starts].reset_index(drop=True),
+        'durationSeconds': (timestamps.iloc[ends].to_numpy() - timestamps.iloc[starts].to_numpy())
+                           / np.timedelta64(1, 's'),
+        'rows': ends - starts + 1,
+        # Every row of a window carries the window mean
+        'processedBC': processed_df['processedBC'].to_numpy()[starts],
+        'atnChange': atn_values[ends] - atn_values[starts]
+    })
+
+def frame_chunks(frame):
+    for start in range(0, len(frame), EXPORT_CHUNK_ROWS):
+        yield frame.iloc[start:start + EXPORT_CHUNK_ROWS]
+
+class Pipeline:
+    """
+    Lazily evaluated processing of one aethalometer input.
+
+    Outputs are requested first and nothing runs until collect(): it plans the
+    stages that produce the requested tables, exports and plots, runs only those,
+    and drops each intermediate table after its last use. A plain CSV export never
+    creates plots or reads weather data, and window-level output does not
+    synchronize weather. When only ONA-derived outputs are needed, the column
+    selection and numeric conversion of ONA run inside the ingest pass.
+
+        pipeline = Pipeline('data.csv', wavelength='Blue', weather_path='weather.csv')
+        pipeline.export('windows.csv', table='windows')
+        results = pipeline.collect('processed')
+
+    Each stage is timed under job_id like a web job (see profiling.py), and
+    progress_callback, when given, is called with each stage name and what it
+    produced (None for a weather stage that failed) as soon as the stage has run.
+    """
+
+    def __init__(self, source, wavelength='Blue', atn_min=0.01, weather_path=None, job_id=None,
+                 progress_callback=None):
+        self.source = source
+        self.wavelength = wavelength
+        self.atn_min = atn_min
+        self.weather_path = weather_path
+        self.job_id = job_id
+        self.progress_callback = progress_callback
+        self.exports = []
+        self.plots = None
+        self._stages = []
+        self._outputs = set()
+
+    def export(self, path, table='processed', fmt='csv', compress=False):
+        """Request a table written to path as csv, parquet or netcdf"""
+        if table not in ('aethalometer', 'processed', 'combined', 'windows'):
+            raise ValueError(f"Unknown table: {table}")
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown format: {fmt}")
+        self.exports.append({'path': path, 'table': table, 'fmt': fmt, 'compress': compress})
+        return self
+
+    def visualize(self, folder='app/static', name='pipeline'):
+        """Request the plots, written to folder with name as their suffix"""
+        self.plots = {'folder': folder, 'name': name}
+        return self
+
+    def _inputs(self, stage):
+        declared = PIPELINE_STAGES[stage]
+        inputs = list(declared['requires'])
+        if stage == 'export':
+            inputs += [request['table'] for request in self.exports]
+        for table in declared.get('optional', ()):
+            if self._can_produce(table):
+                inputs.append(table)
+        return inputs
+
+    def _can_produce(self, table):
+        return table not in ('weather', 'combined') or bool(self.weather_path)
+
+    def plan(self, *tables):
+        """Stages that collect(*tables) would run, in order"""
+        wanted = list(tables)
+        if self.exports:
+            wanted.append('exports')
+        if self.plots:
+            wanted.append('plots')
+        producers = {declared['produces']: stage for stage, declared in PIPELINE_STAGES.items()}
+
+        needed = set()
+        pending = list(wanted)
+        while pending:
+            table = pending.pop()
+            if table not in producers:
+                raise ValueError(f"Unknown output: {table}")
+            if not self._can_produce(table):
+                raise ValueError(f"{table} needs a weather file")
+            stage = producers[table]
+            if stage not in needed:
+                needed.add(stage)
+                pending += self._inputs(stage)
+        return [stage for stage in PIPELINE_STAGES if stage in needed]
+
+    def collect(self, *tables):
+        """
+        Run the planned stages; returns the requested tables, plus 'exports' (paths
+        written) and 'plots' (visualization URLs) when those were requested.
+        """
+        stages = self._stages = self.plan(*tables)
+        keep = self._outputs = set(tables) | {'exports', 'plots'}
+        last_use = {}
+        for i, stage in enumerate(stages):
+            for table in self._inputs(stage):
+                last_use[table] = i
+
+        state = {}
+        try:
+            for i, stage in enumerate(stages):
+                check_cancelled(self.job_id)
+                with track_stage(self.job_id, stage) as record:
+                    produced = PIPELINE_STAGES[stage]['produces']
+                    try:
+                        state[produced] = getattr(self, '_run_' + stage)(state)
+                    except Exception as e:
+                        if stage not in WARNING_STAGES:
+                            raise
+                        logger.warning("Pipeline stage %s failed: %s", stage, e)
+                        state[produced] = None
+                    # Stages that write files or plots are counted in rows of the ONA output
+                    if isinstance(state[produced], pd.DataFrame):
+                        record['rows'] = len(state[produced])
+                    elif state.get('processed') is not None:
+                        record['rows'] = len(state['processed'])
+                if self.progress_callback:
+                    self.progress_callback(stage, state[produced])
+                for table, used in last_use.items():
+                    if used == i and table not in keep:
+                        state.pop(table, None)
+            return {table: state.get(table) for table in state if table in keep}
+        finally:
+            state.clear()
+
+    def _run_ingest(self, state):
+        # Only ONA reads the parsed frame, unless the frame itself is an output
+        whole = 'aethalometer' in self._outputs or any(request['table'] == 'aethalometer' for request in self.exports)
+        transform = ona_columns(self.wavelength) if 'ona' in self._stages and not whole else None
+        df = process_aethalometer_data_in_chunks(self.source, job_id=self.job_id, transform=transform)
+        if df.empty:
+            raise ValueError("Invalid aethalometer data format")
+        return df
+
+    def _run_ona(self, state):
+        processed_df = apply_ona_algorithm(state['aethalometer'], self.wavelength, self.atn_min, job_id=self.job_id)
+        if processed_df.empty:
+            raise ValueError(f"Could not find {self.wavelength} ATN and BC columns")
+        return processed_df
+
+    def _run_weather(self, state):
+        return process_weather_data(self.weather_path, job_id=self.job_id)
+
+    def _run_sync(self, state):
+        if state['weather'] is None or state['weather'].empty:
+            return None
+        return synchronize_data(state['processed'], state['weather'], job_id=self.job_id)
+
+    def _run_aggregate(self, state):
+        atn_col, _ = find_measurement_columns(state['processed'].columns, self.wavelength)
+        return aggregate_windows(state['processed'], atn_col)
+
+    def _run_visualize(self, state):
+        from app.processing.visualization import create_visualizations
+        return create_visualizations(state['processed'], state.get('combined'), self.wavelength,
+                                     self.plots['name'], job_id=self.job_id, static_folder=self.plots['folder'])
+
+    def _run_export(self, state):
+        written = []
+        for request in self.exports:
+            frame = state.get(request['table'])
+            if frame is None:
+                # A weather table that failed to build is reported by its stage
+                continue
+            with open(request['path'], 'wb') as f:
+                write_chunks(f, frame_chunks(frame), list(frame.columns), request['fmt'], request['compress'],
+                             len(frame))
+            written.append(request['path'])
+        return written
@@ -0,0 +1,162 @@
+import logging
+import multiprocessing
+import os
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from app.processing.ona_kernels import ONA_KERNELS, get_ona_backend, select_ona_backend
+from app.utils.shared_arrays import publish_array, attach_array, detach_array, release_array
+
+logger = logging.getLogger(__name__)
+
+# A drop in ATN larger than this marks a filter-tape advance (ATN resets to near zero)
+SEGMENT_ATN_DROP = float(os.environ.get('ONA_SEGMENT_ATN_DROP', 5.0))
+
+# A gap between readings longer than this starts a new segment
+SEGMENT_MAX_GAP = os.environ.get('ONA_SEGMENT_MAX_GAP', '1h')
+
+# Processes used to scan segments; smaller inputs are scanned inline
+ONA_WORKERS = int(os.environ.get('ONA_WORKERS', os.cpu_count() or 1))
+PARALLEL_MIN_ROWS = int(os.environ.get('ONA_PARALLEL_MIN_ROWS', 1000000))
+
+# Workers are started from the job's background thread, so avoid plain fork there
+ONA_START_METHOD = os.environ.get('ONA_START_METHOD', 'forkserver')
+
+# Tasks handed to each worker, so uneven segments still balance across the pool
+TASKS_PER_WORKER = 4
+
+# Worker pool kept between jobs so its start-up cost is only paid once; a pool replaced
+# by a larger one is shut down when the last job still using it releases it
+_pool = None
+_pool_workers = 0
+_pool_users = {}
+_pool_lock = threading.Lock()
+
+@contextmanager
+def _borrow_pool(max_workers):
+    """Lend out the shared segment pool, growing it when more workers are requested"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers < max_workers:
+            if _pool is not None and not _pool_users.get(_pool):
+                _pool_users.pop(_pool, None)
+                _pool.shutdown(wait=False)
+            context = multiprocessing.get_context(ONA_START_METHOD)
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+            _pool_workers = max_workers
+        pool = _pool
+        _pool_users[pool] = _pool_users.get(pool, 0) + 1
+    try:
+        yield pool
+    finally:
+        with _pool_lock:
+            _pool_users[pool] -= 1
+            if not _pool_users[pool] and pool is not _pool:
+                del _pool_users[pool]
+                pool.shutdown(wait=False)
+
+def find_segments(atn_values, timestamps=None, atn_drop=None, max_gap=None):
+    """
+    Split a sorted series into independent segments for ONA.
+
+    A segment ends where ATN drops by more than atn_drop from the previous valid
+    reading (a tape advance) or where consecutive timestamps are more than max_gap
+    apart. Returns the segment boundaries: the first row of every segment followed by
+    the number of rows.
+    """
+    atn_values = np.asarray(atn_values, dtype=np.float64)
+    atn_drop = SEGMENT_ATN_DROP if atn_drop is None else atn_drop
+    max_gap = SEGMENT_MAX_GAP if max_gap is None else max_gap
+    n_points = len(atn_values)
+    if n_points < 2:
+        return np.array([0, n_points], dtype=np.int64)
+
+    # Compare each reading with the last valid one so a NaN row cannot hide a reset
+    previous = pd.Series(atn_values).ffill().shift(1).to_numpy()
+    breaks = (atn_values - previous) < -atn_drop
+
+    if timestamps is not None and max_gap:
+        times = pd.DatetimeIndex(timestamps).as_unit('ns').asi8
+        breaks[1:] |= np.diff(times) > pd.Timedelta(max_gap).value
+
+    breaks[0] = False
+    return np.concatenate(([0], np.flatnonzero(breaks), [n_points])).astype(np.int64)
+
+def _scan_segments(atn_values, bounds, atn_min, scan, progress_callback=None):
+    """Scan each segment on its own and shift its windows to absolute row indices"""
+    starts, ends = [], []
+    open_start = bounds[-1]
+    for seg_start, seg_end in zip(bounds[:-1], bounds[1:]):
+        seg_starts, seg_ends, seg_open = scan(atn_values[seg_start:seg_end], atn_min)
+        starts.append(seg_starts + seg_start)
+        ends.append(seg_ends + seg_start)
+        open_start = seg_start + seg_open
+        if progress_callback:
+            progress_callback(seg_end / bounds[-1])
+    return np.concatenate(starts), np.concatenate(ends), int(open_start)
+
+def _scan_segments_worker(atn_ref, bounds, atn_min, backend):
+    """Pool task: attach to the shared ATN array and scan a run of consecutive segments"""
+    if get_ona_backend() != backend:
+        select_ona_backend(backend)
+    try:
+        atn_values = attach_array(atn_ref)
+        starts, ends, open_start = _scan_segments(atn_values, bounds, atn_min, ONA_KERNELS[backend])
+        del atn_values
+    finally:
+        detach_array(atn_ref)
+    return starts, ends, open_start
+
+def _group_segments(bounds, n_tasks):
+    """Split the segment boundaries into at most n_tasks runs of consecutive segments with similar row counts"""
+    n_points = bounds[-1]
+    cuts = np.searchsorted(bounds, np.linspace(0, n_points, n_tasks + 1)[1:-1])
+    cuts = np.unique(np.concatenate(([0], cuts, [len(bounds) - 1])))
+    return [bounds[a:b + 1] for a, b in zip(cuts[:-1], cuts[1:]) if b > a]
+
+def find_segmented_windows(atn_values, timestamps=None, atn_min=0.01, max_workers=None, progress_callback=None):
+    """
+    Find ONA windows segment by segment so no window spans a tape advance or data gap.
+
+    Returns (window_starts, window_ends, open_start) like find_ona_windows(); rows at
+    the end of a segment that never reach atn_min are left outside any window, and
+    open_start refers to the open window of the last segment. Large inputs with several
+    segments are scanned on a process pool that reads ATN from shared memory, unless
+    the numba kernel is active.
+    """
+    atn_values = np.ascontiguousarray(atn_values, dtype=np.float64)
+    bounds = find_segments(atn_values, timestamps)
+    n_segments = len(bounds) - 1
+    n_points = len(atn_values)
+    max_workers = max(1, min(max_workers or ONA_WORKERS, n_segments))
+
+    # The compiled kernel scans faster than work can be shipped to other processes
+    if max_workers == 1 or n_points < PARALLEL_MIN_ROWS or get_ona_backend() == 'numba':
+        backend = get_ona_backend()
+        if n_segments == 1:
+            return ONA_KERNELS[backend](atn_values, atn_min, progress_callback=progress_callback)
+        return _scan_segments(atn_values, bounds, atn_min, ONA_KERNELS[backend], progress_callback)
+
+    tasks = _group_segments(bounds, max_workers * TASKS_PER_WORKER)
+    logger.debug("Scanning %s ONA segments as %s tasks on %s processes", n_segments, len(tasks), max_workers)
+
+    atn_ref = publish_array(atn_values)
+    try:
+        results = [None] * len(tasks)
+        with _borrow_pool(max_workers) as executor:
+            futures = {
+                executor.submit(_scan_segments_worker, atn_ref, task, atn_min, get_ona_backend()): i
+                for i, task in enumerate(tasks)
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                results[futures[future]] = future.result()
+                if progress_callback:
+                    progress_callback(done / len(tasks))
+    finally:
+        release_array(atn_ref)
+
+    window_starts = np.concatenate([starts for starts, _, _ in results])
+    window_ends = np.concatenate([ends for _, ends, _ in results])
+    return window_starts, window_ends, results[-1][2]
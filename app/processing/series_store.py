@@ -0,0 +1,263 @@
+import io
+import json
+import os
+import re
+import threading
+import numpy as np
+import pandas as pd
+from app.processing.aethalometer import validate_aethalometer_data, average_windows
+from app.processing.segmentation import find_segmented_windows
+from app.utils.status_tracker import processing_status, processing_progress, processing_messages
+
+# Root folder for incrementally extended series
+SERIES_FOLDER = 'app/data/series'
+
+# Bucket size of the stored visualization aggregates
+AGGREGATE_FREQ = os.environ.get('SERIES_AGGREGATE_FREQ', '1h')
+
+# Columns written for every finalized row, matching the regular processed output
+AGGREGATE_COLUMNS = ['rawBC', 'processedBC']
+
+# Plot of one revision of a series. Every append that adds rows gets a new name, so a
+# plot URL always shows the same data and may be cached for good.
+SERIES_PLOT_PATTERN = re.compile(r'^series_(?P<series_id>[A-Za-z0-9_-]{1,64})_r(?P<revision>\d+)_bc_time_series\.html$')
+
+# One lock per series so concurrent appends cannot interleave
+_series_locks = {}
+_locks_guard = threading.Lock()
+
+def series_lock(series_id):
+    """Return the lock serializing appends to a series"""
+    with _locks_guard:
+        return _series_locks.setdefault(series_id, threading.Lock())
+
+def series_path(series_id, *parts):
+    """Path of a series folder or a file inside it"""
+    return os.path.join(SERIES_FOLDER, series_id, *parts)
+
+def series_plot_name(series_id, revision):
+    """File name of the plot of a series revision, in the static folder"""
+    return f'series_{series_id}_r{revision}_bc_time_series.html'
+
+def load_series_state(series_id):
+    """Load a series' saved state, or None if the series does not exist yet"""
+    path = series_path(series_id, 'state.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def _save_series_state(state):
+    """Write the state atomically so a crash never leaves a half-written file"""
+    path = series_path(state['series_id'], 'state.json')
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+def _new_series_state(series_id, wavelength, atn_min):
+    """State for a series that has not received any data yet"""
+    return {
+        'series_id': series_id,
+        'wavelength': wavelength,
+        'atn_min': atn_min,
+        'atn_col': None,
+        'rows_finalized': 0,
+        'segments': [],
+        'last_timestamp': None,
+        'open_window': None,
+        'aggregate_freq': AGGREGATE_FREQ,
+        'aggregate_tail_offset': 0,
+        'revision': 0
+    }
+
+def load_pending(state):
+    """Rows of the open ONA window, kept out of the segments until the window closes"""
+    path = series_path(state['series_id'], 'pending.csv')
+    if not state['open_window'] or not os.path.exists(path):
+        return None
+    pending = pd.read_csv(path)
+    pending['timestamp'] = pd.to_datetime(pending['timestamp'], utc=True)
+    return pending
+
+def _aggregate(df, freq):
+    """Per-bucket sum, count, min and max of the BC columns"""
+    buckets = df['timestamp'].dt.floor(freq)
+    grouped = df[AGGREGATE_COLUMNS].groupby(buckets)
+    stats = pd.concat({
+        'sum': grouped.sum(),
+        'count': grouped.count(),
+        'min': grouped.min(),
+        'max': grouped.max()
+    }, axis=1)
+    stats.columns = [f'{col}_{stat}' for stat, col in stats.columns]
+    return stats.reset_index()
+
+def _update_aggregates(state, segment):
+    """Rewrite only the last (possibly partial) bucket of the aggregate file and append new buckets"""
+    path = series_path(state['series_id'], 'aggregates.csv')
+    new_stats = _aggregate(segment, state['aggregate_freq'])
+    if new_stats.empty:
+        return
+
+    if not os.path.exists(path):
+        with open(path, 'wb') as f:
+            f.write((','.join(new_stats.columns) + '\n').encode())
+            state['aggregate_tail_offset'] = f.tell()
+
+    offset = state['aggregate_tail_offset']
+    with open(path, 'r+b') as f:
+        header = f.readline()
+        f.seek(offset)
+        tail_line = f.readline()
+        if tail_line:
+            tail = pd.read_csv(io.BytesIO(header + tail_line))
+            if pd.Timestamp(tail['timestamp'].iloc[0]) == new_stats['timestamp'].iloc[0]:
+                # The new rows continue the last bucket, so fold its partial statistics in
+                for col in AGGREGATE_COLUMNS:
+                    new_stats.at[0, f'{col}_sum'] += tail[f'{col}_sum'].iloc[0]
+                    new_stats.at[0, f'{col}_count'] += tail[f'{col}_count'].iloc[0]
+                    new_stats.at[0, f'{col}_min'] = min(new_stats.at[0, f'{col}_min'], tail[f'{col}_min'].iloc[0])
+                    new_stats.at[0, f'{col}_max'] = max(new_stats.at[0, f'{col}_max'], tail[f'{col}_max'].iloc[0])
+            else:
+                offset = f.tell()
+
+        f.seek(offset)
+        f.truncate()
+        lines = new_stats.to_csv(index=False, header=False).encode().splitlines(keepends=True)
+        f.write(b''.join(lines[:-1]))
+        state['aggregate_tail_offset'] = f.tell()
+        f.write(lines[-1])
+
+def load_aggregates(series_id):
+    """Load the visualization aggregates of a series as bucket means, minima and maxima"""
+    path = series_path(series_id, 'aggregates.csv')
+    if not os.path.exists(path):
+        return None
+    stats = pd.read_csv(path)
+    stats['timestamp'] = pd.to_datetime(stats['timestamp'], utc=True)
+    for col in AGGREGATE_COLUMNS:
+        stats[col] = stats[f'{col}_sum'] / stats[f'{col}_count']
+    return stats
+
+def append_to_series(series_id, new_df, wavelength="Blue", atn_min=0.01, job_id=None):
+    """
+    Extend a stored series with newly parsed aethalometer rows.
+
+    ONA resumes from the open window saved with the series (its first row index,
+    running BC sum and start ATN), so only the new rows are processed. Rows in closed
+    windows are written as one new segment; the open window's rows stay pending until
+    a later append closes it. wavelength and atn_min only apply when the series is created.
+    """
+    with series_lock(series_id):
+        os.makedirs(series_path(series_id, 'segments'), exist_ok=True)
+        state = load_series_state(series_id) or _new_series_state(series_id, wavelength, atn_min)
+
+        if job_id:
+            processing_status[job_id] = "Applying ONA"
+            processing_messages[job_id] = "Resuming ONA from the stored series state..."
+            processing_progress[job_id] = 72
+
+        new_df, atn_col, bc_col = validate_aethalometer_data(new_df, state['wavelength'])
+        if state['atn_col'] and atn_col != state['atn_col']:
+            raise ValueError(f"ATN column {atn_col} does not match the series column {state['atn_col']}")
+        state['atn_col'] = atn_col
+
+        new_rows = pd.DataFrame({
+            'timestamp': new_df['timestamp'].values,
+            'rawBC': new_df[bc_col].values,
+            atn_col: new_df[atn_col].values
+        })
+        new_rows['timestamp'] = pd.to_datetime(new_rows['timestamp'], utc=True)
+        new_rows = new_rows.sort_values('timestamp', kind='mergesort')
+
+        # Rows at or before the last ingested timestamp are already part of the series
+        if state['last_timestamp']:
+            new_rows = new_rows[new_rows['timestamp'] > pd.Timestamp(state['last_timestamp'])]
+        new_rows = new_rows.drop_duplicates(subset=['timestamp'], keep='first')
+        added_rows = len(new_rows)
+        if added_rows == 0:
+            return state, 0
+
+        pending = load_pending(state)
+        rows = pd.concat([pending[new_rows.columns], new_rows], ignore_index=True) if pending is not None else new_rows.reset_index(drop=True)
+
+        atn_values = rows[atn_col].to_numpy(dtype=np.float64)
+        bc_values = rows['rawBC'].to_numpy(dtype=np.float64)
+        window_starts, window_ends, open_start = find_segmented_windows(atn_values, rows['timestamp'].values, state['atn_min'])
+        rows['processedBC'] = average_windows(bc_values, window_starts, window_ends)
+        rows['windowStart'] = False
+        rows['windowEnd'] = False
+        rows.loc[window_starts, 'windowStart'] = True
+        rows.loc[window_ends, 'windowEnd'] = True
+        rows = rows[['timestamp', 'rawBC', 'processedBC', atn_col, 'windowStart', 'windowEnd']]
+
+        segment = rows.iloc[:open_start]
+        open_rows = rows.iloc[open_start:]
+
+        if job_id:
+            processing_messages[job_id] = f"Writing {len(segment)} finalized rows to the series..."
+            processing_progress[job_id] = 85
+
+        # Only the newly finalized rows are written
+        if not segment.empty:
+            segment_name = f"segment_{len(state['segments']) + 1:06d}.csv"
+            segment.to_csv(series_path(series_id, 'segments', segment_name), index=False)
+            state['segments'].append({
+                'file': segment_name,
+                'rows': len(segment),
+                'start': segment['timestamp'].iloc[0].isoformat(),
+                'end': segment['timestamp'].iloc[-1].isoformat()
+            })
+            _update_aggregates(state, segment)
+
+        pending_path = series_path(series_id, 'pending.csv')
+        if open_rows.empty:
+            state['open_window'] = None
+            if os.path.exists(pending_path):
+                os.remove(pending_path)
+        else:
+            open_rows.to_csv(pending_path, index=False)
+            state['open_window'] = {
+                'window_start': state['rows_finalized'] + len(segment),
+                'bc_sum': float(open_rows['rawBC'].sum()),
+                'rows': len(open_rows),
+                'start_atn': float(open_rows[atn_col].iloc[0])
+            }
+
+        state['rows_finalized'] += len(segment)
+        state['last_timestamp'] = rows['timestamp'].iloc[-1].isoformat()
+        # Series stored before revisions were counted start at 0
+        state['revision'] = state.get('revision', 0) + 1
+        _save_series_state(state)
+
+        return state, added_rows
+
+def series_files(series_id, start=None, end=None, include_pending=True):
+    """
+    CSV files holding a series' rows between start and end, in time order: the segments
+    that overlap the range, then the pending rows of its open window.
+    """
+    state = load_series_state(series_id)
+    if state is None:
+        return []
+    files = [
+        series_path(series_id, 'segments', segment['file']) for segment in state['segments']
+        if (start is None or pd.Timestamp(segment['end']) >= start) and (end is None or pd.Timestamp(segment['start']) <= end)
+    ]
+    pending_path = series_path(series_id, 'pending.csv')
+    if include_pending and state['open_window'] and os.path.exists(pending_path):
+        files.append(pending_path)
+    return files
+
+def iter_series_rows(series_id, include_pending=True):
+    """Yield the stored frames of a series in order, segment by segment"""
+    state = load_series_state(series_id)
+    if state is None:
+        return
+    for segment in state['segments']:
+        yield pd.read_csv(series_path(series_id, 'segments', segment['file']))
+    if include_pending:
+        pending = load_pending(state)
+        if pending is not None:
+            yield pending
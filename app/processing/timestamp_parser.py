@@ -0,0 +1,171 @@
+import logging
+import os
+import numpy as np
+import pandas as pd
+from app.utils.metrics import count_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+# Full timestamp formats tried, in order, when sniffing a new file layout.
+# Offset-aware formats come first so a trailing 'Z' is read as UTC.
+TIMESTAMP_FORMATS = [
+    '%Y-%m-%dT%H:%M:%S%z',
+    '%Y-%m-%dT%H:%M:%S.%f%z',
+    '%Y-%m-%d %H:%M:%S%z',
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S.%f',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M:%S.%f',
+    '%Y-%m-%d %H:%M',
+    '%Y/%m/%d %H:%M:%S',
+    '%Y/%m/%d %H:%M',
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y %H:%M',
+    '%d/%m/%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M',
+    '%m/%d/%Y %I:%M:%S %p',
+]
+
+# Formats for files that split the date and the time of day into two columns
+DATE_FORMATS = ['%Y-%m-%d', '%Y/%m/%d', '%m/%d/%Y', '%d/%m/%Y', '%d-%m-%Y', '%Y%m%d']
+TIME_FORMATS = ['%H:%M:%S', '%I:%M:%S %p', '%H:%M:%S.%f', '%H:%M', '%I:%M %p']
+
+# Number of leading non-null values used to detect a format
+SAMPLE_ROWS = 200
+
+# Non-blank timestamps of a file that may fail to parse before ingestion stops with an
+# error; the rows of those allowed are kept with NaT timestamps
+MAX_UNPARSED_TIMESTAMPS = int(os.environ.get('MAX_UNPARSED_TIMESTAMPS', 0))
+
+# Detected parser specs keyed by header signature, so each firmware layout is only sniffed once
+_parser_cache = {}
+
+def _sample(series):
+    """Return the first non-null values of a column as strings"""
+    return series.dropna().astype(str).head(SAMPLE_ROWS)
+
+def _detect_format(sample, formats):
+    """Return the first format that parses every sample value, or None"""
+    if sample.empty:
+        return None
+    for fmt in formats:
+        try:
+            pd.to_datetime(sample, format=fmt)
+            return fmt
+        except (ValueError, TypeError):
+            continue
+    return None
+
+def _find_timestamp_columns(columns):
+    """Locate the timestamp column and the separate date/time columns, if any"""
+    timestamp_col = next((col for col in columns if any(x in col.lower() for x in ['timestamp', 'date', 'time'])), None)
+    date_col = next((col for col in columns if 'date' in col.lower()), None)
+    time_col = next((col for col in columns if 'time' in col.lower() and col != date_col), None)
+    return timestamp_col, date_col, time_col
+
+def detect_timestamp_parser(chunk):
+    """
+    Work out how the timestamps in a chunk are written.
+
+    Returns a small spec dict understood by parse_timestamps(). Specs are cached per
+    header signature, so every later chunk and every later file from the same
+    instrument firmware reuses the detected format.
+    """
+    signature = tuple(chunk.columns)
+    spec = _parser_cache.get(signature)
+    count_cache_lookup('timestamp_format', spec is not None)
+    if spec is not None:
+        return spec
+
+    timestamp_col, date_col, time_col = _find_timestamp_columns(chunk.columns)
+    if not timestamp_col:
+        raise ValueError("No valid timestamp information found")
+
+    spec = None
+    fmt = _detect_format(_sample(chunk[timestamp_col]), TIMESTAMP_FORMATS)
+    if fmt:
+        spec = {'kind': 'single', 'column': timestamp_col, 'format': fmt}
+    elif date_col and time_col:
+        date_fmt = _detect_format(_sample(chunk[date_col]), DATE_FORMATS)
+        time_fmt = _detect_format(_sample(chunk[time_col]), TIME_FORMATS)
+        if date_fmt and time_fmt:
+            spec = {'kind': 'split', 'date_column': date_col, 'date_format': date_fmt,
+                    'time_column': time_col, 'time_format': time_fmt}
+
+    if spec is None:
+        # Fall back to pandas' own parsing, still without per-element format guessing for ISO data
+        sample = _sample(chunk[timestamp_col])
+        fmt = 'ISO8601' if _detect_format(sample, ['ISO8601']) else 'mixed'
+        spec = {'kind': 'single', 'column': timestamp_col, 'format': fmt}
+
+    logger.debug("Detected timestamp parser: %s", spec)
+    _parser_cache[signature] = spec
+    return spec
+
+def _to_utc_series(values_ns, index):
+    """Wrap int64 epoch nanoseconds as a tz-aware UTC series"""
+    return pd.Series(pd.DatetimeIndex(values_ns.view('M8[ns]')).tz_localize('UTC'), index=index)
+
+def _parse_single(column, fmt):
+    """Parse one timestamp column with an explicit format into epoch nanoseconds"""
+    parsed = pd.to_datetime(column, format=fmt, errors='coerce')
+    if parsed.dt.tz is not None:
+        parsed = parsed.dt.tz_convert('UTC').dt.tz_localize(None)
+    return parsed.dt.as_unit('ns').values.view('i8')
+
+def _parse_unique_ns(column, fmt, time_of_day=False):
+    """Parse only the distinct values of a column and return (codes, nanoseconds per code)"""
+    codes, uniques = pd.factorize(column)
+    parsed = pd.to_datetime(pd.Index(uniques).astype(str), format=fmt, errors='coerce').as_unit('ns')
+    if time_of_day:
+        parsed = parsed - parsed.normalize()
+    values = np.asarray(parsed.asi8, dtype=np.int64)
+    return codes, values, np.asarray(parsed.isna())
+
+def _parse_split(chunk, spec):
+    """Combine separate date and time columns with integer arithmetic on the distinct values"""
+    date_codes, date_ns, date_bad = _parse_unique_ns(chunk[spec['date_column']], spec['date_format'])
+    time_codes, time_ns, time_bad = _parse_unique_ns(chunk[spec['time_column']], spec['time_format'], time_of_day=True)
+
+    result = date_ns[date_codes] + time_ns[time_codes]
+    invalid = (date_codes < 0) | (time_codes < 0)
+    if date_bad.any():
+        invalid |= date_bad[date_codes]
+    if time_bad.any():
+        invalid |= time_bad[time_codes]
+    result[invalid] = np.iinfo(np.int64).min  # NaT
+    return result
+
+def _source_values(chunk, spec):
+    """The timestamp text of a chunk's rows, date and time joined for split layouts"""
+    if spec['kind'] == 'split':
+        return chunk[spec['date_column']].astype(str) + ' ' + chunk[spec['time_column']].astype(str)
+    return chunk[spec['column']]
+
+def parse_timestamps(chunk, spec, redetect=True):
+    """
+    Parse a chunk's timestamps with a detected spec into a tz-aware UTC (int64-backed) series.
+
+    Returns (timestamps, spec, unparsed): the spec the chunk was parsed with, which is a
+    re-detected one when the layout changed mid-stream and should be used for the
+    following chunks, and the source values that did not parse (rows with a blank
+    timestamp are not counted), which come out as NaT.
+    """
+    if spec['kind'] == 'split':
+        values = _parse_split(chunk, spec)
+        blank = chunk[spec['date_column']].isna().to_numpy()
+    else:
+        values = _parse_single(chunk[spec['column']], spec['format'])
+        blank = chunk[spec['column']].isna().to_numpy()
+
+    failed = (values == np.iinfo(np.int64).min) & ~blank
+    # If most of a chunk fails the cached format the layout changed mid-stream; re-detect once
+    if redetect and failed.sum() > len(chunk) // 2:
+        logger.debug("Cached timestamp format failed for %s rows, re-detecting", int(failed.sum()))
+        _parser_cache.pop(tuple(chunk.columns), None)
+        retry = detect_timestamp_parser(chunk)
+        if retry != spec:
+            return parse_timestamps(chunk, retry, redetect=False)
+
+    unparsed = _source_values(chunk, spec)[failed] if failed.any() else pd.Series(dtype=object)
+    return _to_utc_series(values, chunk.index), spec, unparsed
@@ -1,12 +1,14 @@
+import logging
 import os
-import plotly
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import re
 
+# plotly and scipy take over a second to import, so they are imported by the functions
+# that plot or correlate rather than with this module (see app/utils/preload.py)
+
 def create_time_series_plot(df, x_col, y_cols, title, y_label):
     """Create a time series plot with multiple lines"""
+    import plotly.graph_objects as go
+    
     fig = go.Figure()
     
     for col in y_cols:
@@ -27,10 +29,15 @@ def create_time_series_plot(df, x_col, y_cols, title, y_label):
     return fig
 import pandas as pd
 import numpy as np
-from scipy import stats
-import traceback
 from typing import Optional, Dict, Any, List
 from app.utils.status_tracker import processing_status, processing_progress, processing_messages
+from app.utils.shared_arrays import as_frame
+from app.utils.profiling import track_stage
+from app.utils.cancellation import check_cancelled
+from app.utils.janitor import register_artifacts, keep_artifacts
+from app.processing.series_store import series_plot_name
+
+logger = logging.getLogger(__name__)
 
 def downsample_data(df: pd.DataFrame, max_points: int = 10000) -> pd.DataFrame:
     """Downsample data intelligently to preserve important features"""
@@ -66,6 +73,8 @@ def downsample_data(df: pd.DataFrame, max_points: int = 10000) -> pd.DataFrame:
 
 def calculate_correlations(data: pd.DataFrame, x: str, y: str) -> Dict[str, float]:
     """Calculate correlations with proper error handling"""
+    from scipy import stats
+    
     try:
         valid_data = data[[x, y]].dropna()
         if len(valid_data) < 5:
@@ -104,14 +113,13 @@ def identify_weather_columns(df: pd.DataFrame) -> List[str]:
     
     return weather_cols
 
-def prepare_visualization_data(original_df: pd.DataFrame, processed_df: pd.DataFrame,
+def prepare_visualization_data(processed_df: pd.DataFrame,
                            combined_df: Optional[pd.DataFrame], wavelength: str,
                            job_id: Optional[str] = None) -> Dict[str, Any]:
     """
     Prepare data for visualization with improved memory efficiency and error handling.
     
     Args:
-        original_df: Original dataframe (not used, kept for backward compatibility)
         processed_df: Processed dataframe containing timestamp, rawBC, and processedBC columns
         combined_df: Optional combined dataframe with weather data
         wavelength: The wavelength being processed
@@ -172,7 +180,7 @@ def prepare_visualization_data(original_df: pd.DataFrame, processed_df: pd.DataF
             # Check for null values in critical columns
             null_counts = viz_df[list(required_columns)].isnull().sum()
             if null_counts.any():
-                print(f"[WARNING] Null values found in columns: {null_counts[null_counts > 0].to_dict()}")
+                logger.warning("Null values found in columns: %s", null_counts[null_counts > 0].to_dict())
 
             # Time Series Data
             if job_id:
@@ -196,7 +204,7 @@ def prepare_visualization_data(original_df: pd.DataFrame, processed_df: pd.DataF
                 
                 # Check data ranges
                 if (viz_df['rawBC'] < 0).any() or (viz_df['processedBC'] < 0).any():
-                    print("[WARNING] Negative BC values found in data")
+                    logger.warning("Negative BC values found in data")
                 
                 valid_bc_data = viz_df[['rawBC', 'processedBC']].dropna()
                 if valid_bc_data.empty:
@@ -217,9 +225,9 @@ def prepare_visualization_data(original_df: pd.DataFrame, processed_df: pd.DataF
                         (1 - len(valid_bc_data) / len(viz_df)) * 100
                     )
                 else:
-                    print("[WARNING] Could not calculate correlation statistics")
+                    logger.warning("Could not calculate correlation statistics")
             except Exception as e:
-                print(f"[ERROR] BC comparison processing failed: {str(e)}")
+                logger.error("BC comparison processing failed: %s", e)
                 if job_id:
                     processing_messages[job_id] = f"Warning: BC comparison processing failed: {str(e)}"
             
@@ -250,8 +258,9 @@ def prepare_visualization_data(original_df: pd.DataFrame, processed_df: pd.DataF
                     aeth_start = processed_df['timestamp'].min()
                     aeth_end = processed_df['timestamp'].max()
                     
-                    print(f"[INFO] Aethalometer data time range: {aeth_start} to {aeth_end}")
-                    print(f"[INFO] Weather data time range before filtering: {combined_df['timestamp'].min()} to {combined_df['timestamp'].max()}")
+                    logger.debug("Aethalometer data time range: %s to %s", aeth_start, aeth_end)
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Weather data time range before filtering: %s to %s", combined_df['timestamp'].min(), combined_df['timestamp'].max())
                     
                     # Filter weather data to match aethalometer time range
                     combined_df = combined_df[
@@ -262,8 +271,9 @@ def prepare_visualization_data(original_df: pd.DataFrame, processed_df: pd.DataF
                     if combined_df.empty:
                         raise ValueError("No overlapping time period between weather and aethalometer data")
                     
-                    print(f"[INFO] Weather data time range after filtering: {combined_df['timestamp'].min()} to {combined_df['timestamp'].max()}")
-                    print(f"[INFO] Number of weather data points after filtering: {len(combined_df)}")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Weather data time range after filtering: %s to %s", combined_df['timestamp'].min(), combined_df['timestamp'].max())
+                    logger.debug("Number of weather data points after filtering: %s", len(combined_df))
                     
                     # Update metadata with time overlap information
                     result['metadata']['weather_data'] = {
@@ -306,18 +316,17 @@ def prepare_visualization_data(original_df: pd.DataFrame, processed_df: pd.DataF
                     if valid_correlations:
                         result['weather_correlation_data'] = weather_data
                     else:
-                        print("[WARNING] No valid weather correlations found")
+                        logger.warning("No valid weather correlations found")
                         if job_id:
                             processing_messages[job_id] = "Warning: No valid weather correlations found"
 
                 except Exception as e:
-                    print(f"[ERROR] Weather correlation processing failed: {str(e)}")
+                    logger.error("Weather correlation processing failed: %s", e)
                     if job_id:
                         processing_messages[job_id] = f"Warning: Weather correlation processing failed: {str(e)}"
         
         except Exception as e:
-            print(f"Error in visualization data preparation: {e}")
-            print(traceback.format_exc())
+            logger.error("Error in visualization data preparation: %s", e, exc_info=True)
             if job_id:
                 processing_messages[job_id] = f"Warning: Some visualization data could not be prepared: {str(e)}"
         
@@ -332,24 +341,32 @@ def prepare_visualization_data(original_df: pd.DataFrame, processed_df: pd.DataF
         if job_id:
             processing_status[job_id] = "Error"
             processing_messages[job_id] = error_msg
-        print(error_msg)
-        print(traceback.format_exc())
+        logger.error(error_msg, exc_info=True)
         return {
             'time_series_data': None,
             'comparison_data': None,
             'weather_correlation_data': None
         }
 
-def create_visualizations(original_df: pd.DataFrame, processed_df: pd.DataFrame,
+def create_visualizations(processed_df: pd.DataFrame,
                         combined_df: Optional[pd.DataFrame], wavelength: str,
-                        timestamp: str, job_id: Optional[str] = None) -> Dict[str, str]:
-    """Create visualizations with improved memory efficiency and error handling"""
+                        timestamp: str, job_id: Optional[str] = None,
+                        static_folder: str = 'app/static') -> Dict[str, str]:
+    """
+    Create visualizations with improved memory efficiency and error handling (frames may be shared frame descriptors).
+    
+    Plots are written to static_folder and returned as /static/ URLs.
+    """
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+    
     try:
-        print(f"[DEBUG] Starting create_visualizations")
-        print(f"[DEBUG] Original DataFrame shape: {original_df.shape}")
-        print(f"[DEBUG] Processed DataFrame shape: {processed_df.shape}")
-        print(f"[DEBUG] Combined DataFrame shape: {combined_df.shape if combined_df is not None else 'None'}")
-        print(f"[DEBUG] Processed DataFrame columns: {processed_df.columns.tolist()}")
+        processed_df = as_frame(processed_df)
+        combined_df = as_frame(combined_df)
+        logger.debug("Starting create_visualizations")
+        logger.debug("Processed DataFrame shape: %s", processed_df.shape)
+        logger.debug("Combined DataFrame shape: %s", combined_df.shape if combined_df is not None else 'None')
+        logger.debug("Processed DataFrame columns: %s", processed_df.columns.tolist())
         
         if 'processedBC' not in processed_df.columns:
             raise ValueError("Required column 'processedBC' not found in processed data")
@@ -357,14 +374,15 @@ def create_visualizations(original_df: pd.DataFrame, processed_df: pd.DataFrame,
         if 'rawBC' not in processed_df.columns:
             raise ValueError("Required column 'rawBC' not found in processed data")
             
-        print(f"[DEBUG] processedBC stats in processed_df: {processed_df['processedBC'].describe()}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("processedBC stats in processed_df: %s", processed_df['processedBC'].describe())
         
         # Create static directory
-        static_folder = 'app/static'
         os.makedirs(static_folder, exist_ok=True)
         
         # Downsample data for visualization
-        viz_df = downsample_data(processed_df)
+        with track_stage(job_id, 'downsample', rows=len(processed_df)):
+            viz_df = downsample_data(processed_df)
         if viz_df.empty:
             raise ValueError("No valid data after downsampling")
         
@@ -377,238 +395,256 @@ def create_visualizations(original_df: pd.DataFrame, processed_df: pd.DataFrame,
         }
         
         # BC Time Series
+        check_cancelled(job_id)
         if job_id:
             processing_messages[job_id] = "Generating BC time series plot..."
             processing_progress[job_id] = 85
         
-        try:
-            print("[DEBUG] Creating BC time series plot")
-            print(f"[DEBUG] Available columns: {viz_df.columns.tolist()}")
+        with track_stage(job_id, 'bc_time_series'):
+            try:
+                logger.debug("Creating BC time series plot")
+                logger.debug("Available columns: %s", viz_df.columns.tolist())
             
-            # Validate BC columns exist
-            if not {'rawBC', 'processedBC'}.issubset(viz_df.columns):
-                raise ValueError("Missing required BC columns. Available columns: " + ", ".join(viz_df.columns))
+                # Validate BC columns exist
+                if not {'rawBC', 'processedBC'}.issubset(viz_df.columns):
+                    raise ValueError("Missing required BC columns. Available columns: " + ", ".join(viz_df.columns))
             
-            # Check for valid data
-            print(f"[DEBUG] BC data stats:")
-            print(f"rawBC: {viz_df['rawBC'].describe()}")
-            print(f"processedBC: {viz_df['processedBC'].describe()}")
+                # Check for valid data
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("BC data stats:")
+                    logger.debug("rawBC: %s", viz_df['rawBC'].describe())
+                    logger.debug("processedBC: %s", viz_df['processedBC'].describe())
             
-            if viz_df['rawBC'].isnull().all() or viz_df['processedBC'].isnull().all():
-                raise ValueError("BC columns contain no valid data")
+                if viz_df['rawBC'].isnull().all() or viz_df['processedBC'].isnull().all():
+                    raise ValueError("BC columns contain no valid data")
             
-            # Create time series plot with error handling
-            try:
-                valid_bc_data = viz_df[['timestamp', 'rawBC', 'processedBC']].dropna()
-                if valid_bc_data.empty:
-                    raise ValueError("No valid BC data after removing null values")
+                # Create time series plot with error handling
+                try:
+                    valid_bc_data = viz_df[['timestamp', 'rawBC', 'processedBC']].dropna()
+                    if valid_bc_data.empty:
+                        raise ValueError("No valid BC data after removing null values")
                     
-                print(f"[DEBUG] Valid BC data points: {len(valid_bc_data)}")
-                bc_fig = create_time_series_plot(
-                    valid_bc_data,
-                    'timestamp',
-                    ['rawBC', 'processedBC'],
-                    f'{wavelength} BC Time Series',
-                    'BC (ng/m³)'
-                )
-                bc_time_series_path = os.path.join(static_folder, f'bc_time_series_{timestamp}.html')
-                bc_fig.write_html(bc_time_series_path)
-                result['bc_time_series'] = f'/static/bc_time_series_{timestamp}.html'
-                print("[DEBUG] Successfully created BC time series plot")
+                    logger.debug("Valid BC data points: %s", len(valid_bc_data))
+                    bc_fig = create_time_series_plot(
+                        valid_bc_data,
+                        'timestamp',
+                        ['rawBC', 'processedBC'],
+                        f'{wavelength} BC Time Series',
+                        'BC (ng/m³)'
+                    )
+                    bc_time_series_path = os.path.join(static_folder, f'bc_time_series_{timestamp}.html')
+                    bc_fig.write_html(bc_time_series_path)
+                    # Owned by the job from the start, so a cancelled job's plots go with it
+                    register_artifacts(job_id, [bc_time_series_path])
+                    result['bc_time_series'] = f'/static/bc_time_series_{timestamp}.html'
+                    logger.debug("Successfully created BC time series plot")
+                except Exception as e:
+                    logger.warning("Error in BC plot creation: %s", e)
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("BC data head:\n%s", viz_df[['timestamp', 'rawBC', 'processedBC']].head())
+                    raise
             except Exception as e:
-                print(f"[DEBUG] Error in BC plot creation: {str(e)}")
-                print("[DEBUG] BC data head:")
-                print(viz_df[['timestamp', 'rawBC', 'processedBC']].head())
-                raise
-        except Exception as e:
-            print(f"[DEBUG] Error creating BC time series: {str(e)}")
+                logger.warning("Error creating BC time series: %s", e)
         
         # ATN Time Series
+        check_cancelled(job_id)
         if job_id:
             processing_messages[job_id] = "Generating ATN time series plot..."
             processing_progress[job_id] = 90
         
-        try:
-            print("[DEBUG] Creating ATN time series plot")
-            print(f"[DEBUG] Available columns for ATN: {viz_df.columns.tolist()}")
+        with track_stage(job_id, 'atn_time_series'):
+            try:
+                logger.debug("Creating ATN time series plot")
+                logger.debug("Available columns for ATN: %s", viz_df.columns.tolist())
             
-            # Find ATN column that matches the wavelength (e.g., "blueAtn1")
-            print(f"[DEBUG] Looking for ATN column with wavelength: {wavelength}")
-            print(f"[DEBUG] All columns before pattern match: {viz_df.columns.tolist()}")
+                # Find ATN column that matches the wavelength (e.g., "blueAtn1")
+                logger.debug("Looking for ATN column with wavelength: %s", wavelength)
+                logger.debug("All columns before pattern match: %s", viz_df.columns.tolist())
             
-            # Try transformed column name first (camelCase format)
-            atn_col = f"{wavelength.lower()}Atn1"
-            print(f"[DEBUG] Trying exact column name: {atn_col}")
+                # Try transformed column name first (camelCase format)
+                atn_col = f"{wavelength.lower()}Atn1"
+                logger.debug("Trying exact column name: %s", atn_col)
             
-            if atn_col not in viz_df.columns:
-                # Try pattern matching as fallback
-                print("[DEBUG] Exact column not found, trying pattern matching")
-                atn_pattern = re.compile(f"{wavelength.lower()}.*atn.*1", re.IGNORECASE)
-                atn_col = next((col for col in viz_df.columns if atn_pattern.search(col)), None)
+                if atn_col not in viz_df.columns:
+                    # Try pattern matching as fallback
+                    logger.debug("Exact column not found, trying pattern matching")
+                    atn_pattern = re.compile(f"{wavelength.lower()}.*atn.*1", re.IGNORECASE)
+                    atn_col = next((col for col in viz_df.columns if atn_pattern.search(col)), None)
             
-            if not atn_col:
-                print("[DEBUG] No ATN column found matching pattern for wavelength:", wavelength)
-                raise ValueError(f"No ATN column found for wavelength {wavelength}. Available columns: " + ", ".join(viz_df.columns))
+                if not atn_col:
+                    logger.debug("No ATN column found matching pattern for wavelength: %s", wavelength)
+                    raise ValueError(f"No ATN column found for wavelength {wavelength}. Available columns: " + ", ".join(viz_df.columns))
             
-            print(f"[DEBUG] Found ATN column: {atn_col}")
-            print(f"[DEBUG] ATN data stats: {viz_df[atn_col].describe()}")
+                logger.debug("Found ATN column: %s", atn_col)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("ATN data stats: %s", viz_df[atn_col].describe())
             
-            if viz_df[atn_col].isnull().all():
-                raise ValueError(f"ATN column '{atn_col}' contains no valid data")
+                if viz_df[atn_col].isnull().all():
+                    raise ValueError(f"ATN column '{atn_col}' contains no valid data")
             
-            # Validate ATN data before plotting
-            if atn_col:
-                print(f"[DEBUG] Found ATN column: {atn_col}")
-                print(f"[DEBUG] ATN data stats: {viz_df[atn_col].describe()}")
+                # Validate ATN data before plotting
+                if atn_col:
+                    logger.debug("Found ATN column: %s", atn_col)
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("ATN data stats: %s", viz_df[atn_col].describe())
                 
-                # Create valid data subset for plotting
-                valid_atn_data = viz_df[['timestamp', atn_col]].dropna()
-                if valid_atn_data.empty:
-                    raise ValueError(f"No valid ATN data after removing null values")
+                    # Create valid data subset for plotting
+                    valid_atn_data = viz_df[['timestamp', atn_col]].dropna()
+                    if valid_atn_data.empty:
+                        raise ValueError(f"No valid ATN data after removing null values")
                 
-                print(f"[DEBUG] Valid ATN data points: {len(valid_atn_data)}")
+                    logger.debug("Valid ATN data points: %s", len(valid_atn_data))
                 
-                try:
-                    atn_fig = create_time_series_plot(
-                        valid_atn_data,
-                        'timestamp',
-                        [atn_col],
-                        f'{wavelength} ATN Time Series',
-                        'ATN'
-                    )
-                    atn_time_series_path = os.path.join(static_folder, f'atn_time_series_{timestamp}.html')
-                    atn_fig.write_html(atn_time_series_path)
-                    result['atn_time_series'] = f'/static/atn_time_series_{timestamp}.html'
-                    print("[DEBUG] Successfully created ATN time series plot")
-                except Exception as e:
-                    print(f"[DEBUG] Error creating ATN time series plot: {str(e)}")
-                    print(f"[DEBUG] ATN data head: {valid_atn_data.head()}")
-                    raise
-            else:
-                print("[DEBUG] No ATN column found matching the pattern")
-                raise ValueError(f"No ATN column found for wavelength {wavelength}")
-        except Exception as e:
-            print(f"[DEBUG] Error creating ATN time series: {str(e)}")
+                    try:
+                        atn_fig = create_time_series_plot(
+                            valid_atn_data,
+                            'timestamp',
+                            [atn_col],
+                            f'{wavelength} ATN Time Series',
+                            'ATN'
+                        )
+                        atn_time_series_path = os.path.join(static_folder, f'atn_time_series_{timestamp}.html')
+                        atn_fig.write_html(atn_time_series_path)
+                        register_artifacts(job_id, [atn_time_series_path])
+                        result['atn_time_series'] = f'/static/atn_time_series_{timestamp}.html'
+                        logger.debug("Successfully created ATN time series plot")
+                    except Exception as e:
+                        logger.warning("Error creating ATN time series plot: %s", e)
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug("ATN data head: %s", valid_atn_data.head())
+                        raise
+                else:
+                    logger.debug("No ATN column found matching the pattern")
+                    raise ValueError(f"No ATN column found for wavelength {wavelength}")
+            except Exception as e:
+                logger.warning("Error creating ATN time series: %s", e)
         
         # BC Comparison
+        check_cancelled(job_id)
         if job_id:
             processing_messages[job_id] = "Generating BC comparison plot..."
             processing_progress[job_id] = 95
             
-        try:
-            valid_bc_data = viz_df[['rawBC', 'processedBC']].dropna()
-            if len(valid_bc_data) > 0:
-                fig = go.Figure()
-                fig.add_trace(go.Scatter(
-                    x=valid_bc_data['rawBC'],
-                    y=valid_bc_data['processedBC'],
-                    mode='markers',
-                    name='BC Comparison',
-                    marker=dict(
-                        color=valid_bc_data['processedBC'],
-                        colorscale='Viridis',
-                        showscale=True
-                    )
-                ))
+        with track_stage(job_id, 'bc_comparison'):
+            try:
+                valid_bc_data = viz_df[['rawBC', 'processedBC']].dropna()
+                if len(valid_bc_data) > 0:
+                    fig = go.Figure()
+                    fig.add_trace(go.Scatter(
+                        x=valid_bc_data['rawBC'],
+                        y=valid_bc_data['processedBC'],
+                        mode='markers',
+                        name='BC Comparison',
+                        marker=dict(
+                            color=valid_bc_data['processedBC'],
+                            colorscale='Viridis',
+                            showscale=True
+                        )
+                    ))
                 
-                min_val = min(valid_bc_data['rawBC'].min(), valid_bc_data['processedBC'].min())
-                max_val = max(valid_bc_data['rawBC'].max(), valid_bc_data['processedBC'].max())
-                fig.add_trace(go.Scatter(
-                    x=[min_val, max_val],
-                    y=[min_val, max_val],
-                    mode='lines',
-                    name='1:1 Line',
-                    line=dict(dash='dash')
-                ))
+                    min_val = min(valid_bc_data['rawBC'].min(), valid_bc_data['processedBC'].min())
+                    max_val = max(valid_bc_data['rawBC'].max(), valid_bc_data['processedBC'].max())
+                    fig.add_trace(go.Scatter(
+                        x=[min_val, max_val],
+                        y=[min_val, max_val],
+                        mode='lines',
+                        name='1:1 Line',
+                        line=dict(dash='dash')
+                    ))
                 
-                corr_stats = calculate_correlations(valid_bc_data, 'rawBC', 'processedBC')
-                if corr_stats:
-                    fig.add_annotation(
-                        text=f"Pearson r: {corr_stats['pearson_r']:.3f}<br>Spearman ρ: {corr_stats['spearman_r']:.3f}",
-                        xref="paper", yref="paper",
-                        x=0.05, y=0.95,
-                        showarrow=False,
-                        bgcolor='rgba(255,255,255,0.8)'
-                    )
+                    corr_stats = calculate_correlations(valid_bc_data, 'rawBC', 'processedBC')
+                    if corr_stats:
+                        fig.add_annotation(
+                            text=f"Pearson r: {corr_stats['pearson_r']:.3f}<br>Spearman ρ: {corr_stats['spearman_r']:.3f}",
+                            xref="paper", yref="paper",
+                            x=0.05, y=0.95,
+                            showarrow=False,
+                            bgcolor='rgba(255,255,255,0.8)'
+                        )
                 
-                fig.update_layout(
-                    title=f'{wavelength} BC: Raw vs Processed',
-                    xaxis_title='Raw BC (ng/m³)',
-                    yaxis_title='Processed BC (ng/m³)',
-                    template='plotly_white'
-                )
+                    fig.update_layout(
+                        title=f'{wavelength} BC: Raw vs Processed',
+                        xaxis_title='Raw BC (ng/m³)',
+                        yaxis_title='Processed BC (ng/m³)',
+                        template='plotly_white'
+                    )
                 
-                bc_comparison_path = os.path.join(static_folder, f'bc_comparison_{timestamp}.html')
-                fig.write_html(bc_comparison_path)
-                result['bc_comparison'] = f'/static/bc_comparison_{timestamp}.html'
-        except Exception as e:
-            print(f"[DEBUG] Error creating BC comparison plot: {str(e)}")
+                    bc_comparison_path = os.path.join(static_folder, f'bc_comparison_{timestamp}.html')
+                    fig.write_html(bc_comparison_path)
+                    register_artifacts(job_id, [bc_comparison_path])
+                    result['bc_comparison'] = f'/static/bc_comparison_{timestamp}.html'
+            except Exception as e:
+                logger.warning("Error creating BC comparison plot: %s", e)
         
         # Weather correlation plots
+        check_cancelled(job_id)
         if combined_df is not None and not combined_df.empty:
-            try:
-                if 'processedBC' not in combined_df.columns and 'processedBC' in processed_df.columns:
-                    combined_df = combined_df.copy()
-                    combined_df['processedBC'] = processed_df['processedBC']
+            with track_stage(job_id, 'weather_correlation'):
+                try:
+                    if 'processedBC' not in combined_df.columns and 'processedBC' in processed_df.columns:
+                        combined_df = combined_df.copy()
+                        combined_df['processedBC'] = processed_df['processedBC']
                 
-                combined_viz_df = downsample_data(combined_df)
-                weather_cols = identify_weather_columns(combined_viz_df)
+                    with track_stage(job_id, 'downsample', rows=len(combined_df)):
+                        combined_viz_df = downsample_data(combined_df)
+                    weather_cols = identify_weather_columns(combined_viz_df)
                 
-                if weather_cols and 'processedBC' in combined_viz_df.columns:
-                    fig = make_subplots(
-                        rows=len(weather_cols),
-                        cols=1,
-                        subplot_titles=[f'{wavelength} BC vs {col}' for col in weather_cols],
-                        vertical_spacing=0.2
-                    )
+                    if weather_cols and 'processedBC' in combined_viz_df.columns:
+                        fig = make_subplots(
+                            rows=len(weather_cols),
+                            cols=1,
+                            subplot_titles=[f'{wavelength} BC vs {col}' for col in weather_cols],
+                            vertical_spacing=0.2
+                        )
                     
-                    for i, weather_col in enumerate(weather_cols, 1):
-                        corr_stats = calculate_correlations(combined_viz_df, 'processedBC', weather_col)
+                        for i, weather_col in enumerate(weather_cols, 1):
+                            corr_stats = calculate_correlations(combined_viz_df, 'processedBC', weather_col)
                         
-                        fig.add_trace(
-                            go.Scatter(
-                                x=combined_viz_df[weather_col],
-                                y=combined_viz_df['processedBC'],
-                                mode='markers',
-                                marker=dict(
-                                    size=8,
-                                    color=combined_viz_df['processedBC'],
-                                    colorscale='Plasma',
-                                    showscale=True if i == len(weather_cols) else False,
-                                    colorbar=dict(title='BC (ng/m³)') if i == 1 else None
+                            fig.add_trace(
+                                go.Scatter(
+                                    x=combined_viz_df[weather_col],
+                                    y=combined_viz_df['processedBC'],
+                                    mode='markers',
+                                    marker=dict(
+                                        size=8,
+                                        color=combined_viz_df['processedBC'],
+                                        colorscale='Plasma',
+                                        showscale=True if i == len(weather_cols) else False,
+                                        colorbar=dict(title='BC (ng/m³)') if i == 1 else None
+                                    ),
+                                    name=weather_col
                                 ),
-                                name=weather_col
-                            ),
-                            row=i, col=1
-                        )
-                        
-                        if corr_stats:
-                            fig.add_annotation(
-                                text=(f"Pearson r: {corr_stats['pearson_r']:.3f}<br>"
-                                     f"Spearman ρ: {corr_stats['spearman_r']:.3f}"),
-                                xref=f"x{i}", yref=f"y{i}",
-                                x=0.95, y=0.95,
-                                showarrow=False,
-                                bgcolor='rgba(255,255,255,0.8)',
-                                xanchor='right'
+                                row=i, col=1
                             )
+                        
+                            if corr_stats:
+                                fig.add_annotation(
+                                    text=(f"Pearson r: {corr_stats['pearson_r']:.3f}<br>"
+                                         f"Spearman ρ: {corr_stats['spearman_r']:.3f}"),
+                                    xref=f"x{i}", yref=f"y{i}",
+                                    x=0.95, y=0.95,
+                                    showarrow=False,
+                                    bgcolor='rgba(255,255,255,0.8)',
+                                    xanchor='right'
+                                )
                     
-                    fig.update_layout(
-                        height=300 * len(weather_cols),
-                        width=800,
-                        template='plotly_white',
-                        showlegend=False
-                    )
+                        fig.update_layout(
+                            height=300 * len(weather_cols),
+                            width=800,
+                            template='plotly_white',
+                            showlegend=False
+                        )
                     
-                    for i, weather_col in enumerate(weather_cols, 1):
-                        fig.update_xaxes(title_text=f'{weather_col}', row=i, col=1)
-                        fig.update_yaxes(title_text='Black Carbon (ng/m³)', row=i, col=1)
+                        for i, weather_col in enumerate(weather_cols, 1):
+                            fig.update_xaxes(title_text=f'{weather_col}', row=i, col=1)
+                            fig.update_yaxes(title_text='Black Carbon (ng/m³)', row=i, col=1)
                     
-                    weather_correlation_path = os.path.join(static_folder, f'weather_correlation_{timestamp}.html')
-                    fig.write_html(weather_correlation_path)
-                    result['weather_correlation'] = f'/static/weather_correlation_{timestamp}.html'
-            except Exception as e:
-                print(f"[DEBUG] Error creating weather correlation plot: {str(e)}")
+                        weather_correlation_path = os.path.join(static_folder, f'weather_correlation_{timestamp}.html')
+                        fig.write_html(weather_correlation_path)
+                        register_artifacts(job_id, [weather_correlation_path])
+                        result['weather_correlation'] = f'/static/weather_correlation_{timestamp}.html'
+                except Exception as e:
+                    logger.warning("Error creating weather correlation plot: %s", e)
         
         # Verify that at least one visualization was created
         if not any(result.values()):
@@ -618,13 +654,43 @@ def create_visualizations(original_df: pd.DataFrame, processed_df: pd.DataFrame,
             processing_messages[job_id] = "Visualizations created successfully"
             processing_progress[job_id] = 100
             
-        print(f"[DEBUG] Visualization creation complete. Results: {result}")
+        logger.debug("Visualization creation complete. Results: %s", result)
         return result
         
     except Exception as e:
         error_msg = f"Error creating visualizations: {str(e)}"
-        print(error_msg)
-        print(traceback.format_exc())
+        logger.error(error_msg, exc_info=True)
         if job_id:
             processing_messages[job_id] = error_msg
         raise
+
+def create_series_visualizations(aggregates_df: pd.DataFrame, pending_df: Optional[pd.DataFrame],
+                                 wavelength: str, series_id: str, revision: int) -> Dict[str, str]:
+    """Plot an incrementally extended series from its stored bucket aggregates, under the name of its revision"""
+    static_folder = 'app/static'
+    os.makedirs(static_folder, exist_ok=True)
+    
+    plot_df = aggregates_df[['timestamp', 'rawBC', 'processedBC']]
+    if pending_df is not None and not pending_df.empty:
+        # Rows of the still-open ONA window are shown raw, as in a regular job
+        plot_df = pd.concat([plot_df, pending_df[['timestamp', 'rawBC', 'processedBC']]], ignore_index=True)
+    
+    fig = create_time_series_plot(
+        plot_df,
+        'timestamp',
+        ['rawBC', 'processedBC'],
+        f'{wavelength} BC Time Series ({series_id})',
+        'BC (ng/m³)'
+    )
+    plot_name = series_plot_name(series_id, revision)
+    plot_path = os.path.join(static_folder, plot_name)
+    fig.write_html(plot_path)
+    # Kept for as long as it is the series' current plot; older revisions age out
+    keep_artifacts(f'series:{series_id}', [plot_path])
+    
+    return {
+        'bc_time_series': f'/static/{plot_name}',
+        'atn_time_series': None,
+        'bc_comparison': None,
+        'weather_correlation': None
+    }
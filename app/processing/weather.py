@@ -1,9 +1,14 @@
+import logging
 import pandas as pd
 import os
 import numpy as np
 from datetime import datetime, timezone
+from app.processing.input_streams import open_input
 from app.utils.status_tracker import processing_status, processing_progress, processing_messages
-import traceback
+from app.utils.shared_arrays import as_frame
+from app.utils.cancellation import check_cancelled
+
+logger = logging.getLogger(__name__)
 
 def standardize_column_names(df):
     """Standardize weather data column names"""
@@ -32,20 +37,20 @@ def standardize_column_names(df):
                 renamed_columns[col] = actual_name
                 break
     
-    print(f"[DEBUG] Column renaming map: {renamed_columns}")
+    logger.debug("Column renaming map: %s", renamed_columns)
     
     if renamed_columns:
         df = df.rename(columns=renamed_columns)
-        print(f"[DEBUG] Columns after renaming: {df.columns.tolist()}")
+        logger.debug("Columns after renaming: %s", df.columns.tolist())
     
     return df
 
 def validate_weather_data(df):
     """Validate weather data columns and format"""
-    print("[DEBUG] Starting weather data validation")
-    print(f"[DEBUG] Input DataFrame shape: {df.shape}")
-    print(f"[DEBUG] Input columns: {df.columns.tolist()}")
-    print(f"[DEBUG] Input data types:\n{df.dtypes}")
+    logger.debug("Starting weather data validation")
+    logger.debug("Input DataFrame shape: %s", df.shape)
+    logger.debug("Input columns: %s", df.columns.tolist())
+    logger.debug("Input data types:\n%s", df.dtypes)
     
     # Define base required columns
     base_required = {
@@ -56,85 +61,89 @@ def validate_weather_data(df):
     found_columns = []
     
     # First standardize column names
-    print("[DEBUG] Standardizing column names")
+    logger.debug("Standardizing column names")
     df = standardize_column_names(df)
-    print(f"[DEBUG] After standardization columns: {df.columns.tolist()}")
+    logger.debug("After standardization columns: %s", df.columns.tolist())
     
     # Convert columns to numeric and validate
-    print("[DEBUG] Converting columns to numeric")
+    logger.debug("Converting columns to numeric")
     for col in df.columns:
         # Check if this column is a required column or a numbered version of it
         base_col = col.split('_')[0] if '_' in col else col
         if base_col in base_required:
-            print(f"[DEBUG] Converting {col} to numeric")
-            print(f"[DEBUG] Column type before conversion: {df[col].dtype}")
-            print(f"[DEBUG] Sample data before conversion:\n{df[col].head()}")
+            logger.debug("Converting %s to numeric", col)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Column type before conversion: %s", df[col].dtype)
+                logger.debug("Sample data before conversion:\n%s", df[col].head())
             
             try:
                 df[col] = pd.to_numeric(df[col], errors='coerce')
-                print(f"[DEBUG] Column type after conversion: {df[col].dtype}")
-                print(f"[DEBUG] Sample data after conversion:\n{df[col].head()}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Column type after conversion: %s", df[col].dtype)
+                    logger.debug("Sample data after conversion:\n%s", df[col].head())
                 base_required[base_col] = True
                 found_columns.append(col)
             except Exception as e:
-                print(f"[DEBUG] Error converting {col} to numeric: {str(e)}")
-                print(f"[DEBUG] Column data sample: {df[col].head()}")
+                logger.warning("Error converting %s to numeric: %s", col, e)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Column data sample: %s", df[col].head())
                 raise
     
     # Check if all required base columns were found
     missing_columns = [col for col, found in base_required.items() if not found]
     if missing_columns:
-        print(f"[DEBUG] Missing base columns: {missing_columns}")
+        logger.debug("Missing base columns: %s", missing_columns)
         raise ValueError(f"Missing required weather columns: {', '.join(missing_columns)}")
     
-    print("[DEBUG] Weather data validation complete")
-    print(f"[DEBUG] Final data shape: {df.shape}")
-    print(f"[DEBUG] Final columns: {df.columns.tolist()}")
-    print(f"[DEBUG] Final data types:\n{df.dtypes}")
-    print(f"[DEBUG] Found columns: {found_columns}")
+    logger.debug("Weather data validation complete")
+    logger.debug("Final data shape: %s", df.shape)
+    logger.debug("Final columns: %s", df.columns.tolist())
+    logger.debug("Final data types:\n%s", df.dtypes)
+    logger.debug("Found columns: %s", found_columns)
     
     return df
 
 def ensure_tz_aware(timestamp_data):
     """Ensure a timestamp series is timezone aware"""
     try:
-        print(f"[DEBUG] ensure_tz_aware input type: {type(timestamp_data)}")
+        logger.debug("ensure_tz_aware input type: %s", type(timestamp_data))
         
         # Convert DataFrame to Series if needed
         if isinstance(timestamp_data, pd.DataFrame):
-            print("[DEBUG] Converting DataFrame to Series")
+            logger.debug("Converting DataFrame to Series")
             if len(timestamp_data.columns) != 1:
                 raise ValueError("DataFrame must have exactly one column")
             timestamp_data = timestamp_data.iloc[:, 0]
         
         # Convert to Series if not already
         if not isinstance(timestamp_data, pd.Series):
-            print("[DEBUG] Converting to Series")
+            logger.debug("Converting to Series")
             timestamp_data = pd.Series(timestamp_data)
         
-        print(f"[DEBUG] Data type after Series conversion: {timestamp_data.dtype}")
+        logger.debug("Data type after Series conversion: %s", timestamp_data.dtype)
         
         # Convert to datetime if not already
         if not pd.api.types.is_datetime64_any_dtype(timestamp_data):
-            print("[DEBUG] Converting to datetime")
+            logger.debug("Converting to datetime")
             timestamp_data = pd.to_datetime(timestamp_data)
-            print(f"[DEBUG] Data type after datetime conversion: {timestamp_data.dtype}")
+            logger.debug("Data type after datetime conversion: %s", timestamp_data.dtype)
         
         # Add timezone if not present
         if timestamp_data.dt.tz is None:
-            print("[DEBUG] Adding UTC timezone")
+            logger.debug("Adding UTC timezone")
             return timestamp_data.dt.tz_localize('UTC')
         return timestamp_data
         
     except Exception as e:
-        print(f"[DEBUG] Error in ensure_tz_aware: {str(e)}")
-        print(f"[DEBUG] Input type: {type(timestamp_data)}")
-        if hasattr(timestamp_data, 'head'):
-            print(f"[DEBUG] Input sample: {timestamp_data.head()}")
-        elif hasattr(timestamp_data, '__getitem__'):
-            print(f"[DEBUG] Input sample: {timestamp_data[:5]}")
-        else:
-            print(f"[DEBUG] Input value: {timestamp_data}")
+        logger.warning("Error in ensure_tz_aware: %s", e)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Input type: %s", type(timestamp_data))
+            if hasattr(timestamp_data, 'head'):
+                logger.debug("Input sample: %s", timestamp_data.head())
+            elif hasattr(timestamp_data, '__getitem__'):
+                logger.debug("Input sample: %s", timestamp_data[:5])
+            else:
+                logger.debug("Input value: %s", timestamp_data)
         raise
 
 def process_weather_data(file_path, job_id=None):
@@ -152,20 +161,22 @@ def process_weather_data(file_path, job_id=None):
         if os.path.getsize(file_path) == 0:
             raise ValueError("Weather data file is empty")
             
-        print(f"[DEBUG] Reading weather data from: {file_path}")
-        print(f"[DEBUG] File size: {os.path.getsize(file_path)} bytes")
+        logger.debug("Reading weather data from: %s", file_path)
+        logger.debug("File size: %s bytes", os.path.getsize(file_path))
         
-        # Read and validate CSV file
+        # Read and validate CSV file (compressed inputs are inflated on the fly)
         try:
-            df = pd.read_csv(file_path)
+            with open_input(file_path) as source:
+                df = pd.read_csv(source.stream)
             if df.empty:
                 raise ValueError("No data found in weather file")
                 
-            print(f"[DEBUG] Original weather data shape: {df.shape}")
-            print(f"[DEBUG] Original weather columns: {df.columns.tolist()}")
-            print(f"[DEBUG] Data types of columns:\n{df.dtypes}")
-            print(f"[DEBUG] First few rows of weather data:\n{df.head()}")
-            print(f"[DEBUG] Any null values:\n{df.isnull().sum()}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Original weather data shape: %s", df.shape)
+                logger.debug("Original weather columns: %s", df.columns.tolist())
+                logger.debug("Data types of columns:\n%s", df.dtypes)
+                logger.debug("First few rows of weather data:\n%s", df.head())
+                logger.debug("Any null values:\n%s", df.isnull().sum())
             
             # Basic data validation
             if df.shape[1] < 2:  # At least timestamp and one weather metric
@@ -176,18 +187,20 @@ def process_weather_data(file_path, job_id=None):
         except Exception as e:
             raise ValueError(f"Error reading weather data file: {str(e)}")
         
+        check_cancelled(job_id)
+        
         # Standardize column names using weather-specific standardization
-        print("[DEBUG] Starting column name standardization")
-        print("[DEBUG] Original columns:")
-        print(f"Columns: {df.columns.tolist()}")
-        print(f"Sample data:\n{df.head()}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Starting column name standardization")
+            logger.debug("Original columns: %s", df.columns.tolist())
+            logger.debug("Sample data:\n%s", df.head())
         
         df = standardize_column_names(df)
         
-        print("[DEBUG] After standardize_column_names:")
-        print(f"Columns: {df.columns.tolist()}")
-        print(f"Data types:\n{df.dtypes}")
-        print(f"Sample data:\n{df.head()}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("After standardize_column_names: %s", df.columns.tolist())
+            logger.debug("Data types:\n%s", df.dtypes)
+            logger.debug("Sample data:\n%s", df.head())
         
         if job_id:
             processing_progress[job_id] = 30
@@ -217,36 +230,37 @@ def process_weather_data(file_path, job_id=None):
                     time_col = col
             
             if date_col and time_col:
-                print(f"[DEBUG] Creating timestamp from {date_col} and {time_col}")
+                logger.debug("Creating timestamp from %s and %s", date_col, time_col)
                 try:
-                    print(f"[DEBUG] Creating timestamp from date and time columns")
-                    print(f"Date column type: {type(df[date_col])}")
-                    print(f"Date sample: {df[date_col].head()}")
-                    print(f"Time column type: {type(df[time_col])}")
-                    print(f"Time sample: {df[time_col].head()}")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Date sample: %s", df[date_col].head())
+                        logger.debug("Time sample: %s", df[time_col].head())
                     
                     # Convert to string and combine
                     date_series = pd.Series(df[date_col]).astype(str)
                     time_series = pd.Series(df[time_col]).astype(str)
                     combined_series = date_series + ' ' + time_series
                     
-                    print(f"[DEBUG] Combined datetime strings: {combined_series.head()}")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Combined datetime strings: %s", combined_series.head())
                     
                     # Convert to datetime
                     df['timestamp'] = pd.to_datetime(combined_series)
-                    print(f"[DEBUG] Converted to datetime. Sample: {df['timestamp'].head()}")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Converted to datetime. Sample: %s", df['timestamp'].head())
                     timestamp_found = True
                 except Exception as e:
-                    print(f"[DEBUG] Error creating timestamp: {str(e)}")
-                    print(f"[DEBUG] Date column info:\n{df[date_col].describe()}")
-                    print(f"[DEBUG] Time column info:\n{df[time_col].describe()}")
+                    logger.warning("Error creating timestamp: %s", e)
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Date column info:\n%s", df[date_col].describe())
+                        logger.debug("Time column info:\n%s", df[time_col].describe())
             elif date_col:
-                print(f"[DEBUG] Creating timestamp from {date_col}")
+                logger.debug("Creating timestamp from %s", date_col)
                 try:
                     df['timestamp'] = pd.to_datetime(df[date_col])
                     timestamp_found = True
                 except Exception as e:
-                    print(f"[DEBUG] Error creating timestamp: {str(e)}")
+                    logger.warning("Error creating timestamp: %s", e)
         
         if not timestamp_found:
             raise ValueError("No valid timestamp column found in weather data")
@@ -255,30 +269,25 @@ def process_weather_data(file_path, job_id=None):
         if timestamp_found:
             try:
                 if timestamp_col:
-                    print(f"[DEBUG] Converting timestamp column: {timestamp_col}")
-                    print(f"[DEBUG] Timestamp column info:")
-                    print(f"Type: {type(df[timestamp_col])}")
-                    print(f"Sample data: {df[timestamp_col].head()}")
+                    logger.debug("Converting timestamp column: %s", timestamp_col)
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Sample data: %s", df[timestamp_col].head())
                     
                     # First convert the column to a Series explicitly
                     timestamp_series = pd.Series(df[timestamp_col])
-                    print(f"[DEBUG] Converted to Series. Type: {type(timestamp_series)}")
                     
                     # Convert to datetime
                     timestamp_series = pd.to_datetime(timestamp_series)
-                    print(f"[DEBUG] Converted to datetime. Type: {type(timestamp_series)}")
-                    print(f"[DEBUG] Sample after datetime conversion: {timestamp_series.head()}")
                     
                     # Make timezone aware
                     timestamp_series = ensure_tz_aware(timestamp_series)
-                    print(f"[DEBUG] Made timezone aware. Type: {type(timestamp_series)}")
-                    print(f"[DEBUG] Sample after timezone conversion: {timestamp_series.head()}")
                     
                     # Assign back to DataFrame
                     df['timestamp'] = timestamp_series
-                    print(f"[DEBUG] Timestamp conversion successful. Final sample: {df['timestamp'].head()}")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Timestamp conversion successful. Final sample: %s", df['timestamp'].head())
             except Exception as e:
-                print(f"[DEBUG] Error converting timestamp: {str(e)}")
+                logger.warning("Error converting timestamp: %s", e)
                 raise
         
         if job_id:
@@ -287,18 +296,18 @@ def process_weather_data(file_path, job_id=None):
         
         # Validate and clean data
         df = validate_weather_data(df)
-        print(f"[DEBUG] Final weather columns after validation: {df.columns.tolist()}")
+        logger.debug("Final weather columns after validation: %s", df.columns.tolist())
         
         # Remove rows with invalid timestamps
         df = df.dropna(subset=['timestamp'])
-        print(f"[DEBUG] Data shape after removing invalid timestamps: {df.shape}")
+        logger.debug("Data shape after removing invalid timestamps: %s", df.shape)
         
         # Sort by timestamp
         df = df.sort_values('timestamp')
         
         # Remove duplicates
         df = df.drop_duplicates(subset=['timestamp'], keep='first')
-        print(f"[DEBUG] Final data shape: {df.shape}")
+        logger.debug("Final data shape: %s", df.shape)
         
         if job_id:
             processing_progress[job_id] = 90
@@ -312,7 +321,7 @@ def process_weather_data(file_path, job_id=None):
         if job_id:
             processing_status[job_id] = "Error"
             processing_messages[job_id] = error_msg
-        print(error_msg)
+        logger.error(error_msg)
         raise RuntimeError(error_msg)
 
 def filter_weather_data_by_range(weather_df, aethalometer_df):
@@ -324,8 +333,9 @@ def filter_weather_data_by_range(weather_df, aethalometer_df):
     aeth_min_date = aethalometer_df['timestamp'].min()
     aeth_max_date = aethalometer_df['timestamp'].max()
     
-    print(f"[DEBUG] Aethalometer data range: {aeth_min_date} to {aeth_max_date}")
-    print(f"[DEBUG] Weather data range before filtering: {weather_df['timestamp'].min()} to {weather_df['timestamp'].max()}")
+    logger.debug("Aethalometer data range: %s to %s", aeth_min_date, aeth_max_date)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Weather data range before filtering: %s to %s", weather_df['timestamp'].min(), weather_df['timestamp'].max())
     
     # Filter weather data to match aethalometer date range
     filtered_df = weather_df[
@@ -333,8 +343,9 @@ def filter_weather_data_by_range(weather_df, aethalometer_df):
         (weather_df['timestamp'] <= aeth_max_date)
     ]
     
-    print(f"[DEBUG] Weather data range after filtering: {filtered_df['timestamp'].min() if not filtered_df.empty else 'No data'} to {filtered_df['timestamp'].max() if not filtered_df.empty else 'No data'}")
-    print(f"[DEBUG] Filtered weather data shape: {filtered_df.shape}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Weather data range after filtering: %s to %s", filtered_df['timestamp'].min() if not filtered_df.empty else 'No data', filtered_df['timestamp'].max() if not filtered_df.empty else 'No data')
+    logger.debug("Filtered weather data shape: %s", filtered_df.shape)
     
     if filtered_df.empty:
         raise ValueError("No weather data available for the aethalometer data time period")
@@ -344,6 +355,10 @@ def filter_weather_data_by_range(weather_df, aethalometer_df):
 def synchronize_data(aethalometer_df, weather_df, job_id=None):
     """Synchronize aethalometer and weather data by timestamp with improved handling"""
     try:
+        # Either input may be a shared frame descriptor from an earlier stage
+        aethalometer_df = as_frame(aethalometer_df)
+        weather_df = as_frame(weather_df)
+        
         # Input validation
         if not isinstance(aethalometer_df, pd.DataFrame) or not isinstance(weather_df, pd.DataFrame):
             raise ValueError("Both inputs must be pandas DataFrames")
@@ -351,11 +366,12 @@ def synchronize_data(aethalometer_df, weather_df, job_id=None):
         if aethalometer_df.empty or weather_df.empty:
             raise ValueError("Empty dataframe provided for synchronization")
         
+        check_cancelled(job_id)
         if job_id:
             processing_messages[job_id] = "Synchronizing aethalometer and weather data..."
             processing_progress[job_id] = 60
         
-        print("[DEBUG] Starting data synchronization")
+        logger.debug("Starting data synchronization")
         
         # Convert timestamps to datetime if they're not already
         aethalometer_df['timestamp'] = pd.to_datetime(aethalometer_df['timestamp'])
@@ -372,14 +388,9 @@ def synchronize_data(aethalometer_df, weather_df, job_id=None):
         else:
             weather_df['timestamp'] = weather_df['timestamp'].dt.tz_convert('UTC')
             
-        print("[DEBUG] Aethalometer data range:", 
-              aethalometer_df['timestamp'].min().strftime('%Y-%m-%d %H:%M:%S'),
-              "to",
-              aethalometer_df['timestamp'].max().strftime('%Y-%m-%d %H:%M:%S'))
-        print("[DEBUG] Weather data range before filtering:",
-              weather_df['timestamp'].min().strftime('%Y-%m-%d %H:%M:%S'),
-              "to", 
-              weather_df['timestamp'].max().strftime('%Y-%m-%d %H:%M:%S'))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Aethalometer data range: %s to %s", aethalometer_df['timestamp'].min().strftime('%Y-%m-%d %H:%M:%S'), aethalometer_df['timestamp'].max().strftime('%Y-%m-%d %H:%M:%S'))
+            logger.debug("Weather data range before filtering: %s to %s", weather_df['timestamp'].min().strftime('%Y-%m-%d %H:%M:%S'), weather_df['timestamp'].max().strftime('%Y-%m-%d %H:%M:%S'))
         
         # Handle multiple windSpeed columns if they exist
         wind_speed_cols = [col for col in weather_df.columns if col.startswith('windSpeed')]
@@ -414,12 +425,16 @@ def synchronize_data(aethalometer_df, weather_df, job_id=None):
         aethalometer_reset = aethalometer_reset.sort_values('timestamp')
         weather_reset = weather_reset.sort_values('timestamp')
         
+        # merge_asof needs both keys in the same resolution (pandas parses to us, spilled data is ns)
+        weather_reset['timestamp'] = weather_reset['timestamp'].dt.as_unit(aethalometer_reset['timestamp'].dt.unit)
+        
         # Handle overlapping columns
         overlapping_cols = [col for col in aethalometer_reset.columns if col in weather_reset.columns and col != 'timestamp']
         if overlapping_cols:
             weather_reset = weather_reset.rename(columns={col: f"weather_{col}" for col in overlapping_cols})
         
         # Merge dataframes
+        check_cancelled(job_id)
         combined = pd.merge_asof(
             aethalometer_reset,
             weather_reset,
@@ -440,8 +455,7 @@ def synchronize_data(aethalometer_df, weather_df, job_id=None):
         
     except Exception as e:
         error_msg = f"Error synchronizing data: {str(e)}"
-        print(error_msg)
-        print(f"[DEBUG] Full traceback: {traceback.format_exc()}")
+        logger.error(error_msg, exc_info=True)
         if job_id:
             processing_messages[job_id] = error_msg
         raise RuntimeError(error_msg)
@@ -1,44 +1,121 @@
-from flask import Blueprint, request, jsonify, send_from_directory, Response
+import logging
+from flask import Blueprint, request, jsonify, Response
 from werkzeug.utils import secure_filename
 import os
 import threading
 import datetime
-import traceback
 import json
 import numpy as np
 import pandas as pd
 import shutil
-from typing import Optional, Dict, Any
+import uuid
+import zipfile
+from typing import Optional, Dict, Any, List, Callable
 
-from app.processing.aethalometer import process_aethalometer_data_in_chunks, apply_ona_algorithm
+from app.processing.input_streams import INPUT_EXTENSIONS
+from app.processing.aethalometer import (
+    process_aethalometer_data_in_chunks, apply_ona_algorithm, apply_ona_multi, resolve_ona_series,
+    WAVELENGTHS, ONA_VARIANTS
+)
+from app.processing.ona_kernels import get_ona_backend
+from app.processing.batch import list_archive_members, parse_files_parallel, merge_aethalometer_frames
+from app.processing.disk_mode import (
+    use_disk_mode, spill_aethalometer_data, apply_ona_disk, result_preview, result_head,
+    write_result_csv, release_spilled
+)
 from app.processing.weather import process_weather_data, synchronize_data
+from app.processing.export import write_indexed_csv, index_path
 from app.processing.visualization import create_visualizations  # Changed from prepare_visualization_data
-from app.utils.status_tracker import processing_status, processing_progress, processing_messages
+from app.processing.memory_estimate import estimate_job_memory, estimate_batch_memory
+from app.processing.compact import json_floats
+from app.utils.status_tracker import processing_status, processing_progress, processing_messages, processing_admissions
 from app.utils.json_encoder import NpEncoder, safe_json_dumps, clean_dict_for_json, ensure_json_serializable
+from app.utils.shared_arrays import publish_frame, attach_frame, release_frame
+from app.utils.profiling import track_stage, capture_profile, parse_profiler, job_profile
+from app.utils.metrics import count_upload_bytes, count_cache_lookup, inc_counter, FINISHED_STATUSES
+from app.utils.coalescing import save_hashed, job_key, claim_job, release_job, detach_job
+from app.utils.janitor import register_artifacts, touch_job, touch_artifact, discard_job_artifacts
+from app.utils.admission import admission
+from app.utils.cancellation import JobCancelled, request_cancel, cancel_requested, check_cancelled, clear_cancel
+from app.utils.upload_store import upload_sessions, release_upload
+from app.utils.file_delivery import send_artifact, precompress
+
+logger = logging.getLogger(__name__)
 
 api_bp = Blueprint('api', __name__)
 
+def validate_filename(filename: str, allowed_extensions=None) -> bool:
+    """Validate a bare filename against the allowed extensions"""
+    if not filename:
+        return False
+    
+    if allowed_extensions:
+        # Match whole suffixes so multi-part extensions such as csv.gz are recognised
+        return any(filename.lower().endswith('.' + ext) for ext in allowed_extensions)
+    return True
+
 def validate_file(file, allowed_extensions=None) -> bool:
     """Validate file extension and content"""
     if not file or not file.filename:
         return False
     
-    if allowed_extensions:
-        return '.' in file.filename and file.filename.rsplit('.', 1)[1].lower() in allowed_extensions
-    return True
+    return validate_filename(file.filename, allowed_extensions)
 
-def cleanup_old_files(directory: str, max_age_hours: int = 24):
-    """Clean up old temporary files"""
+def parse_processing_params(values) -> Dict[str, Any]:
+    """Validate the ONA parameters of a request, raising ValueError with a client-facing message"""
     try:
-        current_time = datetime.datetime.now()
-        for filename in os.listdir(directory):
-            filepath = os.path.join(directory, filename)
-            if os.path.isfile(filepath):
-                file_time = datetime.datetime.fromtimestamp(os.path.getmtime(filepath))
-                if (current_time - file_time).total_seconds() > max_age_hours * 3600:
-                    os.remove(filepath)
-    except Exception as e:
-        print(f"Error during cleanup: {e}")
+        atn_min = float(values.get('atn_min', 0.01))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid ATN min value')
+    if atn_min <= 0:
+        raise ValueError('ATN min must be positive')
+    
+    wavelength = values.get('wavelength', 'Blue')
+    if wavelength not in WAVELENGTHS:
+        raise ValueError('Invalid wavelength specified')
+    
+    # Optional extra ONA series: variants (1, 2, c) for the listed wavelengths, or 'all'
+    ona_series = None
+    variants = values.get('variants')
+    if variants:
+        variants = list(ONA_VARIANTS) if variants == 'all' else [v.strip() for v in variants.split(',') if v.strip()]
+        if any(v not in ONA_VARIANTS for v in variants):
+            raise ValueError('Invalid variants specified. Use a comma-separated list of 1, 2 and c')
+        wavelengths = values.get('wavelengths', 'all')
+        wavelengths = list(WAVELENGTHS) if wavelengths == 'all' else [w.strip() for w in wavelengths.split(',') if w.strip()]
+        if any(w not in WAVELENGTHS for w in wavelengths):
+            raise ValueError('Invalid wavelengths specified')
+        ona_series = {'wavelengths': wavelengths, 'variants': variants}
+    
+    return {'atn_min': atn_min, 'wavelength': wavelength, 'ona_series': ona_series,
+            'profile': parse_profiler(values)}
+
+def new_job_id(filename: str) -> str:
+    """Generate a job ID for an uploaded file, unique even for the same file within a second"""
+    timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+    return f"job_{timestamp}_{hash(filename)}_{uuid.uuid4().hex[:8]}"
+
+def init_job_status(job_id: str):
+    """Make a job visible to /api/status as initializing"""
+    processing_status[job_id] = "Initializing"
+    processing_progress[job_id] = 0
+    processing_messages[job_id] = "Starting data processing..."
+
+def start_processing_job(job_id: str, aethalometer_path: str, weather_path: Optional[str],
+                         atn_min: float, wavelength: str, aethalometer_stream=None,
+                         ona_series: Optional[Dict[str, List[str]]] = None, profile: Optional[str] = None):
+    """Initialize a job's status and run it on a background thread"""
+    init_job_status(job_id)
+    # Inputs stay with the job until it finishes; the janitor then ages them out if the job failed
+    register_artifacts(job_id, [aethalometer_path, weather_path])
+    
+    processing_thread = threading.Thread(
+        target=process_data_async,
+        args=(job_id, aethalometer_path, weather_path, atn_min, wavelength),
+        kwargs={'aethalometer_stream': aethalometer_stream, 'ona_series': ona_series, 'profile': profile}
+    )
+    processing_thread.daemon = True
+    processing_thread.start()
 
 @api_bp.route('/process', methods=['POST'])
 def process_data():
@@ -49,29 +126,24 @@ def process_data():
             return jsonify({'error': 'No aethalometer file provided'}), 400
         
         aethalometer_file = request.files['aethalometer_file']
-        if not validate_file(aethalometer_file, {'csv'}):
-            return jsonify({'error': 'Invalid aethalometer file format. Only CSV files are allowed.'}), 400
+        if not validate_file(aethalometer_file, INPUT_EXTENSIONS):
+            return jsonify({'error': 'Invalid aethalometer file format. Only CSV files (optionally .gz, .zst or .zip compressed) are allowed.'}), 400
         
         # Validate weather file if provided
         weather_file = request.files.get('weather_file')
-        if weather_file and not validate_file(weather_file, {'csv'}):
-            return jsonify({'error': 'Invalid weather file format. Only CSV files are allowed.'}), 400
+        if weather_file and not validate_file(weather_file, INPUT_EXTENSIONS):
+            return jsonify({'error': 'Invalid weather file format. Only CSV files (optionally .gz, .zst or .zip compressed) are allowed.'}), 400
         
         # Validate parameters
         try:
-            atn_min = float(request.form.get('atn_min', 0.01))
-            if atn_min <= 0:
-                return jsonify({'error': 'ATN min must be positive'}), 400
-        except ValueError:
-            return jsonify({'error': 'Invalid ATN min value'}), 400
-        
-        wavelength = request.form.get('wavelength', 'Blue')
-        if wavelength not in ['Blue', 'Green', 'Red', 'UV', 'IR']:
-            return jsonify({'error': 'Invalid wavelength specified'}), 400
+            params = parse_processing_params(request.form)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        atn_min = params['atn_min']
+        wavelength = params['wavelength']
         
         # Generate unique job ID
-        timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
-        job_id = f"job_{timestamp}_{hash(aethalometer_file.filename)}"
+        job_id = new_job_id(aethalometer_file.filename)
         
         # Create necessary directories
         upload_folder = 'app/data'
@@ -81,32 +153,38 @@ def process_data():
         for folder in [upload_folder, results_folder, static_folder]:
             os.makedirs(folder, exist_ok=True)
         
-        # Clean up old files
-        cleanup_old_files(upload_folder)
-        cleanup_old_files(results_folder)
-        cleanup_old_files(static_folder)
-        
-        # Save uploaded files
-        aethalometer_path = os.path.join(upload_folder, secure_filename(aethalometer_file.filename))
-        aethalometer_file.save(aethalometer_path)
+        # Save uploaded files under names of their own, so an identical upload cannot
+        # overwrite a file that a running job is reading
+        upload_prefix = uuid.uuid4().hex[:12]
+        aethalometer_path = os.path.join(upload_folder, f"{upload_prefix}_{secure_filename(aethalometer_file.filename)}")
+        digests = [save_hashed(aethalometer_file, aethalometer_path)]
         
         weather_path = None
         if weather_file and weather_file.filename:
-            weather_path = os.path.join(upload_folder, secure_filename(weather_file.filename))
-            weather_file.save(weather_path)
+            weather_path = os.path.join(upload_folder, f"{upload_prefix}_{secure_filename(weather_file.filename)}")
+            digests.append(save_hashed(weather_file, weather_path))
+        count_upload_bytes(sum(size for _, size in digests), 'process')
         
-        # Initialize processing status
-        processing_status[job_id] = "Initializing"
-        processing_progress[job_id] = 0
-        processing_messages[job_id] = "Starting data processing..."
+        # An identical job already running (same input content and parameters) is
+        # shared: the duplicate gets its job ID, progress and results. The job has a
+        # status before it can be claimed, so a duplicate never polls an unknown ID.
+        init_job_status(job_id)
+        running_job_id = claim_job(job_key([digest for digest, _ in digests], params), job_id)
+        count_cache_lookup('inflight_jobs', running_job_id != job_id)
+        if running_job_id != job_id:
+            for tracker in (processing_status, processing_progress, processing_messages):
+                tracker.pop(job_id, None)
+            remove_files([aethalometer_path, weather_path])
+            return jsonify({
+                'job_id': running_job_id,
+                'status': 'Processing started',
+                'coalesced': True,
+                'message': 'An identical job is already running. Poll /api/status/{job_id} for its updates.'
+            })
         
         # Start processing in background thread
-        processing_thread = threading.Thread(
-            target=process_data_async,
-            args=(job_id, aethalometer_path, weather_path, atn_min, wavelength)
-        )
-        processing_thread.daemon = True
-        processing_thread.start()
+        start_processing_job(job_id, aethalometer_path, weather_path, atn_min, wavelength,
+                             ona_series=params['ona_series'], profile=params['profile'])
         
         return jsonify({
             'job_id': job_id,
@@ -115,123 +193,476 @@ def process_data():
         })
         
     except Exception as e:
-        print(f"Error in process_data: {e}")
-        print(traceback.format_exc())
+        logger.error("Error in process_data: %s", e, exc_info=True)
         return jsonify({'error': str(e)}), 500
 
-def process_data_async(job_id: str, aethalometer_path: str, weather_path: Optional[str], 
-                      atn_min: float, wavelength: str):
-    """Process data asynchronously with improved error handling and memory management"""
+def remove_files(paths):
+    """Remove a job's uploaded input files once they are no longer needed"""
     try:
-        # Process aethalometer data
-        aethalometer_df = process_aethalometer_data_in_chunks(aethalometer_path, job_id=job_id)
-        if aethalometer_df.empty:
-            raise ValueError("Invalid aethalometer data format")
-        
-        # Apply ONA algorithm
-        original_df, processed_df = apply_ona_algorithm(aethalometer_df, wavelength, atn_min, job_id=job_id)
-        if processed_df.empty:
-            raise ValueError(f"Could not find {wavelength} ATN and BC columns")
-
-        # Ensure required columns exist
-        required_columns = {'timestamp', 'rawBC', 'processedBC'}
-        if not all(col in processed_df.columns for col in required_columns):
-            missing_cols = required_columns - set(processed_df.columns)
-            raise ValueError(f"Missing required columns in processed data: {', '.join(missing_cols)}")
-        
-        # Process weather data if provided
-        weather_df = None
-        combined_df = None
-        if weather_path:
-            try:
-                weather_df = process_weather_data(weather_path, job_id=job_id)
-                
-                if weather_df is not None and not weather_df.empty:
-                    try:
-                        combined_df = synchronize_data(processed_df, weather_df, job_id=job_id)
-                    except ValueError as e:
-                        error_msg = f"Warning: Weather data synchronization failed: {str(e)}"
-                        print(f"[DEBUG] {error_msg}")
-                        print(traceback.format_exc())
-                        processing_messages[job_id] = error_msg
-            except Exception as e:
-                error_msg = f"Warning: Weather data processing failed: {str(e)}"
-                print(f"[DEBUG] {error_msg}")
-                print(traceback.format_exc())
-                processing_messages[job_id] = error_msg
+        for path in paths:
+            if path:
+                os.remove(path)
+    except Exception as e:
+        logger.error("Error cleaning up temporary files: %s", e)
+
+def ona_stage(job_id: str, state: Dict[str, Any]):
+    """aethalometer -> processed, processed_ref; the parsed frame is dropped unless multi-series ONA still needs it"""
+    frame = state['aethalometer'] if state['ona_series'] else state.pop('aethalometer')
+    processed_df = apply_ona_algorithm(frame, state['wavelength'], state['atn_min'], job_id=job_id)
+    del frame
+    if processed_df.empty:
+        raise ValueError(f"Could not find {state['wavelength']} ATN and BC columns")
+
+    # Ensure required columns exist
+    required_columns = {'timestamp', 'rawBC', 'processedBC'}
+    if not all(col in processed_df.columns for col in required_columns):
+        missing_cols = required_columns - set(processed_df.columns)
+        raise ValueError(f"Missing required columns in processed data: {', '.join(missing_cols)}")
+    
+    # Later stages attach to the shared ONA output instead of receiving copies, and the
+    # job keeps only the attached view rather than a second private copy
+    state['processed_ref'] = publish_frame(processed_df)
+    del processed_df
+    state['processed'] = attach_frame(state['processed_ref'])
+    state['rows'] = len(state['processed'])
+
+def multi_series_stage(job_id: str, state: Dict[str, Any]):
+    """aethalometer -> multi_series; extra dual-spot / BCc series from the same parsed frame, written as one table"""
+    aethalometer_df = state.pop('aethalometer')
+    ona_series = state['ona_series']
+    series = resolve_ona_series(aethalometer_df.columns, ona_series['wavelengths'], ona_series['variants'])
+    if not series:
+        raise ValueError("None of the requested ONA series were found in the data")
+    multi_df = apply_ona_multi(aethalometer_df, series, state['atn_min'], job_id=job_id)
+    del aethalometer_df
+    filename = f"processed_multi_{state['timestamp']}.csv"
+    multi_df.to_csv(os.path.join('app/data/results', filename), index=False)
+    register_artifacts(job_id, [os.path.join('app/data/results', filename)])
+    state['multi_series'] = {
+        'download_path': filename,
+        'series': [f'{w} {ONA_VARIANTS[v][1]}' for w, v, _, _ in series]
+    }
+
+def parse_weather(job_id: str, weather_path: Optional[str]) -> Optional[pd.DataFrame]:
+    """Load weather data, or None with a warning on the job when it cannot be read"""
+    if not weather_path:
+        return None
+    try:
+        with track_stage(job_id, 'parse') as record:
+            weather_df = process_weather_data(weather_path, job_id=job_id)
+            record['rows'] = len(weather_df) if weather_df is not None else 0
+    except Exception as e:
+        error_msg = f"Warning: Weather data processing failed: {str(e)}"
+        logger.warning(error_msg, exc_info=True)
+        processing_messages[job_id] = error_msg
+        return None
+    if weather_df is None or weather_df.empty:
+        return None
+    return weather_df
+
+def merge_weather(job_id: str, processed, weather_df: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+    """Merge weather data with processed output; failures only produce a warning"""
+    if weather_df is None:
+        return None
+    try:
+        with track_stage(job_id, 'synchronize') as record:
+            combined_df = synchronize_data(processed, weather_df, job_id=job_id)
+            record['rows'] = len(combined_df)
+        return combined_df
+    except Exception as e:
+        error_msg = f"Warning: Weather data synchronization failed: {str(e)}"
+        logger.warning(error_msg, exc_info=True)
+        processing_messages[job_id] = error_msg
+        return None
+
+def synchronize_weather(job_id: str, processed, weather_path: Optional[str]) -> Optional[pd.DataFrame]:
+    """Load weather data and merge it with the processed output; failures only produce a warning"""
+    return merge_weather(job_id, processed, parse_weather(job_id, weather_path))
+
+def weather_stage(job_id: str, state: Dict[str, Any]):
+    """processed_ref, weather_path -> combined"""
+    state['combined'] = synchronize_weather(job_id, state['processed_ref'], state['weather_path'])
+
+def output_stage(job_id: str, state: Dict[str, Any]):
+    """processed -> processed CSV in the results folder"""
+    processed_path = os.path.join('app/data/results', f"processed_{state['wavelength']}_{state['timestamp']}.csv")
+    # Written with a sparse time index so exports can seek to a time range (see export.py)
+    write_indexed_csv([state['processed']], processed_path)
+    register_artifacts(job_id, [processed_path, index_path(processed_path)])
+    state['rows'] = len(state['processed'])
+
+def store_job_results(job_id: str, visualizations: Dict[str, Any], processed_sample: pd.DataFrame,
+                      combined_df: Optional[pd.DataFrame], total_rows: int, wavelength: str,
+                      atn_min: float, timestamp: str, metadata: Dict[str, Any],
+                      multi_series: Optional[Dict[str, Any]] = None):
+    """Mark a job completed and store the result summary returned by /api/status"""
+    if not visualizations or all(v is None for v in visualizations.values()):
+        raise ValueError("Failed to generate visualizations")
+    
+    sample_size = len(processed_sample)
+    with track_stage(job_id, 'serialize', rows=sample_size):
+        result_data = store_result_data(processed_sample, combined_df, visualizations, total_rows,
+                                        wavelength, atn_min, timestamp, metadata, multi_series)
+    
+    # Store results
+    processing_status[job_id] = "Completed"
+    processing_progress[job_id] = 100
+    processing_messages[job_id] = "Processing completed successfully"
+    processing_status[job_id + "_results"] = result_data
+    
+    # The .gz variants are written once results are available; until then clients get
+    # the uncompressed files. Results and plots are kept until the janitor evicts them.
+    paths = result_paths(result_data)
+    with track_stage(job_id, 'precompress'):
+        paths += precompress_artifacts(paths)
+    register_artifacts(job_id, paths + [index_path(paths[0])])
+
+def precompress_artifacts(paths: List[str]) -> List[str]:
+    """Write the .gz variants of a job's artifacts, returning the ones written"""
+    written = []
+    for path in paths:
+        try:
+            gz_path = precompress(path)
+        except OSError as e:
+            logger.warning("Could not precompress %s: %s", path, e)
+            continue
+        if gz_path:
+            written.append(gz_path)
+    return written
+
+def store_result_data(processed_sample: pd.DataFrame, combined_df: Optional[pd.DataFrame],
+                      visualizations: Dict[str, Any], total_rows: int, wavelength: str, atn_min: float,
+                      timestamp: str, metadata: Dict[str, Any], multi_series: Optional[Dict[str, Any]]):
+    """JSON-ready result summary of a job"""
+    sample_size = len(processed_sample)
+    result_data = {
+        'processed_data': clean_dict_for_json(
+            json_floats(processed_sample).replace({np.nan: None}).to_dict(orient='records')
+        ),
+        'combined_data': [],
+        'wavelength': wavelength,
+        'atn_min': atn_min,
+        'visualizations': clean_dict_for_json(visualizations),
+        'download_path': f'processed_{wavelength}_{timestamp}.csv',
+        'total_rows': total_rows,
+        'sample_size': sample_size,
+        'metadata': metadata
+    }
+    if multi_series:
+        result_data['multi_series'] = multi_series
+    
+    if combined_df is not None and not combined_df.empty:
+        result_data['combined_data'] = clean_dict_for_json(
+            json_floats(combined_df.head(sample_size)).replace({np.nan: None}).to_dict(orient='records')
+        )
+    return ensure_json_serializable(result_data)
+
+def result_paths(result_data: Dict[str, Any]) -> List[str]:
+    """Files on disk behind the download paths and plot URLs of a job's results"""
+    paths = [os.path.join('app/data/results', result_data['download_path'])]
+    if result_data.get('multi_series'):
+        paths.append(os.path.join('app/data/results', result_data['multi_series']['download_path']))
+    for url in result_data['visualizations'].values():
+        if isinstance(url, str) and url.startswith('/static/'):
+            paths.append(os.path.join('app/static', url[len('/static/'):]))
+    return paths
+
+def fail_visualization_stage(job_id: str, e: Exception):
+    """Record a visualization failure on the job"""
+    error_msg = f"Error creating visualizations: {str(e)}"
+    logger.error(error_msg, exc_info=True)
+    processing_status[job_id] = "Error"
+    processing_messages[job_id] = error_msg
+    processing_progress[job_id] = 0
+
+def visualization_stage(job_id: str, state: Dict[str, Any]):
+    """processed_ref, combined -> plots and the stored job results"""
+    logger.debug("Creating visualizations...")
+    combined_df = state.pop('combined', None)
+    try:
+        visualizations = create_visualizations(
+            state['processed_ref'], combined_df, state['wavelength'], state['timestamp'], job_id=job_id
+        )
+        
+        # Prepare data samples efficiently
+        processed_df = state['processed']
+        processed_sample = processed_df[['timestamp', 'rawBC', 'processedBC']].head(min(1000, len(processed_df)))
+        
+        store_job_results(job_id, visualizations, processed_sample, combined_df, len(processed_df),
+                          state['wavelength'], state['atn_min'], state['timestamp'],
+                          {'ona_backend': get_ona_backend()}, multi_series=state.get('multi_series'))
+        
+    except Exception as e:
+        fail_visualization_stage(job_id, e)
+
+def run_processing_stages(job_id: str, load_aethalometer: Callable[[], pd.DataFrame],
+                          weather_path: Optional[str], atn_min: float, wavelength: str,
+                          ona_series: Optional[Dict[str, List[str]]] = None):
+    """
+    Run ingestion, ONA, weather synchronization, output and visualization as explicit stages.
+    
+    load_aethalometer parses the input, so the job state dict holds the only reference
+    to the parsed frame. Each stage reads its inputs from the state and pops what later
+    stages no longer need: the parsed frame goes right after ONA (or after multi-series
+    ONA when requested). Every stage's timing, rows and memory are recorded (see profiling.py).
+    """
+    state = {
+        'weather_path': weather_path,
+        'atn_min': atn_min,
+        'wavelength': wavelength,
+        'ona_series': ona_series,
+        'timestamp': datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    }
+    stages = [('ona', ona_stage)]
+    if ona_series:
+        stages.append(('multi_series', multi_series_stage))
+    stages += [('weather', weather_stage), ('output', output_stage), ('visualization', visualization_stage)]
+    
+    try:
+        with track_stage(job_id, 'ingest') as record:
+            state['aethalometer'] = load_aethalometer()
+            if state['aethalometer'].empty:
+                raise ValueError("Invalid aethalometer data format")
+            record['rows'] = state['rows'] = len(state['aethalometer'])
+        
+        for name, stage in stages:
+            check_cancelled(job_id)
+            with track_stage(job_id, name) as record:
+                stage(job_id, state)
+                record['rows'] = state['rows']
+    finally:
+        state.pop('processed', None)
+        if 'processed_ref' in state:
+            release_frame(state.pop('processed_ref'))
+        state.clear()
+
+def run_disk_processing_stages(job_id: str, source, weather_path: Optional[str],
+                               atn_min: float, wavelength: str):
+    """
+    Disk-backed variant of the processing stages for inputs larger than the memory budget.
+    
+    Only timestamp, ATN and BC are kept, in memory-mapped spill files; ONA and the CSV
+    output work over them in blocks, and plots use a reduced preview of the output
+    (see disk_mode.py). The combined_data sample is merged from full-resolution rows,
+    as in memory; the weather correlation plot uses the preview.
+    """
+    with track_stage(job_id, 'ingest') as record:
+        spilled = spill_aethalometer_data(source, wavelength, job_id=job_id)
+        record['rows'] = spilled['rows']
+    try:
+        with track_stage(job_id, 'ona', rows=spilled['rows']):
+            apply_ona_disk(spilled, atn_min, job_id=job_id)
+            preview_df = result_preview(spilled)
+        
+        check_cancelled(job_id)
+        with track_stage(job_id, 'weather', rows=len(preview_df)):
+            weather_df = parse_weather(job_id, weather_path)
+            combined_df = merge_weather(job_id, preview_df, weather_df)
+            combined_sample = None
+            if combined_df is not None:
+                combined_sample = merge_weather(job_id, result_head(spilled, 1000), weather_df)
+            del weather_df
         
-        # Save results
+        check_cancelled(job_id)
         timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-        results_folder = 'app/data/results'
-        processed_path = os.path.join(results_folder, f'processed_{wavelength}_{timestamp}.csv')
+        with track_stage(job_id, 'output', rows=spilled['rows']):
+            processed_path = os.path.join('app/data/results', f'processed_{wavelength}_{timestamp}.csv')
+            processing_messages[job_id] = "Writing processed data..."
+            register_artifacts(job_id, [processed_path, index_path(processed_path)])
+            write_result_csv(spilled, processed_path)
         
-        # Save processed data efficiently
-        processed_df.to_csv(processed_path, index=False)
+        logger.debug("Creating visualizations from the disk-backed preview...")
+        with track_stage(job_id, 'visualization', rows=len(preview_df)):
+            try:
+                visualizations = create_visualizations(preview_df, combined_df, wavelength, timestamp, job_id=job_id)
+                processed_sample = result_head(spilled, 1000)[['timestamp', 'rawBC', 'processedBC']]
+                # Plots show the preview, a reduced copy of the output; flagged so clients can tell
+                store_job_results(job_id, visualizations, processed_sample, combined_sample, spilled['rows'],
+                                  wavelength, atn_min, timestamp,
+                                  {'ona_backend': get_ona_backend(), 'disk_backed': True,
+                                   'plot_rows': len(preview_df)})
+            except Exception as e:
+                fail_visualization_stage(job_id, e)
+    finally:
+        release_spilled(spilled)
+
+def process_data_async(job_id: str, aethalometer_path: str, weather_path: Optional[str], 
+                      atn_min: float, wavelength: str, aethalometer_stream=None,
+                      ona_series: Optional[Dict[str, List[str]]] = None, profile: Optional[str] = None):
+    """
+    Process data asynchronously with improved error handling and memory management.
+    
+    When aethalometer_stream is given (an upload still being received), ingestion reads
+    from it instead of opening aethalometer_path, which is its final location on disk.
+    Inputs expected to exceed the memory budget are processed in disk-backed mode;
+    multi-series output needs every column of the parsed frame, so it always runs in memory.
+    With profile set, the job runs under that profiler (see profiling.py). The job
+    starts once its estimated peak memory fits the admission budget (see admission.py).
+    """
+    try:
+        source = aethalometer_stream if aethalometer_stream is not None else aethalometer_path
+        total_size = aethalometer_stream.total_size if aethalometer_stream is not None else os.path.getsize(aethalometer_path)
+        disk_mode = not ona_series and use_disk_mode(total_size, aethalometer_path)
+        estimate = estimate_job_memory(aethalometer_path, total_size, weather_path, ona_series, disk_mode)
         
-        # Create visualizations
-        print("[DEBUG] Creating visualizations...")
         try:
-            visualizations = create_visualizations(
-                original_df, processed_df, combined_df, wavelength, timestamp, job_id=job_id
-            )
-            
-            if not visualizations or all(v is None for v in visualizations.values()):
-                raise ValueError("Failed to generate visualizations")
-                
-            # Prepare results data
-            total_rows = len(processed_df)
-            sample_size = min(1000, total_rows)
-            
-            # Prepare data samples efficiently
-            processed_sample = processed_df[['timestamp', 'rawBC', 'processedBC']].head(sample_size)
-            
-            result_data = {
-                'processed_data': clean_dict_for_json(
-                    processed_sample.replace({np.nan: None}).to_dict(orient='records')
-                ),
-                'combined_data': [],
-                'wavelength': wavelength,
-                'atn_min': atn_min,
-                'visualizations': clean_dict_for_json(visualizations),
-                'download_path': f'processed_{wavelength}_{timestamp}.csv',
-                'total_rows': total_rows,
-                'sample_size': sample_size
-            }
-            
-            if combined_df is not None and not combined_df.empty:
-                result_data['combined_data'] = clean_dict_for_json(
-                    combined_df.head(sample_size).replace({np.nan: None}).to_dict(orient='records')
-                )
-            
-            # Store results
-            processing_status[job_id] = "Completed"
-            processing_progress[job_id] = 100
-            processing_messages[job_id] = "Processing completed successfully"
-            processing_status[job_id + "_results"] = ensure_json_serializable(result_data)
-            
-        except Exception as e:
-            error_msg = f"Error creating visualizations: {str(e)}"
-            print(error_msg)
-            print(traceback.format_exc())
+            with admission(job_id, estimate), capture_profile(job_id, profile):
+                if disk_mode:
+                    run_disk_processing_stages(job_id, source, weather_path, atn_min, wavelength)
+                else:
+                    run_processing_stages(
+                        job_id, lambda: process_aethalometer_data_in_chunks(source, job_id=job_id),
+                        weather_path, atn_min, wavelength, ona_series=ona_series
+                    )
+        finally:
+            if aethalometer_stream is not None:
+                aethalometer_stream.close()
+                # Parts sent after the job ended, or a complete request that never came,
+                # must not keep the session alive
+                release_upload(aethalometer_stream.session)
+        
+        # Cleanup temporary files
+        remove_files([aethalometer_path, weather_path])
+        
+    except JobCancelled:
+        finish_cancelled(job_id)
+    except Exception as e:
+        if cancel_requested(job_id):
+            # Cancelling a streaming upload aborts it, which fails the read before a checkpoint is reached
+            finish_cancelled(job_id)
+        else:
+            error_msg = f"Error during processing: {str(e)}"
             processing_status[job_id] = "Error"
             processing_messages[job_id] = error_msg
             processing_progress[job_id] = 0
+            logger.error(error_msg, exc_info=True)
+    finally:
+        clear_cancel(job_id)
+        release_job(job_id)
+
+def finish_cancelled(job_id: str):
+    """Mark a job cancelled and remove its inputs and whatever outputs it had written"""
+    processing_status[job_id] = "Cancelled"
+    processing_messages[job_id] = "Processing was cancelled"
+    processing_status.pop(job_id + "_results", None)
+    removed = discard_job_artifacts(job_id)
+    inc_counter('aethalometer_jobs_cancelled_total')
+    logger.info("Job %s cancelled, %s files removed", job_id, removed)
+
+@api_bp.route('/batch', methods=['POST'])
+def process_batch():
+    """
+    Process many daily aethalometer files as one continuous series.
+    
+    Accepts several aethalometer_files, or one zip archive of CSV files as archive. The
+    files are parsed in parallel, merged and deduplicated by timestamp, and then run
+    through ONA once so windows are not cut at file boundaries.
+    """
+    try:
+        aethalometer_files = [f for f in request.files.getlist('aethalometer_files') if f and f.filename]
+        archive_file = request.files.get('archive')
+        
+        if not aethalometer_files and not (archive_file and archive_file.filename):
+            return jsonify({'error': 'No aethalometer files or archive provided'}), 400
+        
+        for aethalometer_file in aethalometer_files:
+            if not validate_file(aethalometer_file, INPUT_EXTENSIONS):
+                return jsonify({'error': f'Invalid aethalometer file format: {aethalometer_file.filename}'}), 400
+        
+        if archive_file and archive_file.filename and not validate_file(archive_file, {'zip'}):
+            return jsonify({'error': 'Invalid archive format. Only zip archives are allowed.'}), 400
+        
+        weather_file = request.files.get('weather_file')
+        if weather_file and not validate_file(weather_file, INPUT_EXTENSIONS):
+            return jsonify({'error': 'Invalid weather file format. Only CSV files (optionally .gz, .zst or .zip compressed) are allowed.'}), 400
         
-        # Cleanup temporary files
         try:
-            os.remove(aethalometer_path)
-            if weather_path:
-                os.remove(weather_path)
-        except Exception as e:
-            print(f"Error cleaning up temporary files: {e}")
+            params = parse_processing_params(request.form)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-    except Exception as e:
-        error_msg = f"Error during processing: {str(e)}"
-        processing_status[job_id] = "Error"
-        processing_messages[job_id] = error_msg
+        job_id = new_job_id(archive_file.filename if archive_file and archive_file.filename
+                            else aethalometer_files[0].filename)
+        
+        upload_folder = os.path.join('app/data', job_id)
+        for folder in [upload_folder, 'app/data/results', 'app/static']:
+            os.makedirs(folder, exist_ok=True)
+        
+        # Each upload gets a prefix of its own, so files sharing a name (day1.csv from two
+        # stations, say) do not overwrite each other
+        saved_paths = []
+        for index, aethalometer_file in enumerate(aethalometer_files):
+            path = os.path.join(upload_folder, f"{index:03d}_{secure_filename(aethalometer_file.filename)}")
+            aethalometer_file.save(path)
+            saved_paths.append(path)
+        inputs = list(saved_paths)
+        
+        if archive_file and archive_file.filename:
+            archive_path = os.path.join(upload_folder, f"archive_{secure_filename(archive_file.filename)}")
+            archive_file.save(archive_path)
+            saved_paths.append(archive_path)
+            try:
+                inputs.extend(list_archive_members(archive_path))
+            except (ValueError, zipfile.BadZipFile) as e:
+                shutil.rmtree(upload_folder, ignore_errors=True)
+                return jsonify({'error': f'Invalid archive: {str(e)}'}), 400
+        
+        weather_path = None
+        if weather_file and weather_file.filename:
+            weather_path = os.path.join(upload_folder, f"weather_{secure_filename(weather_file.filename)}")
+            weather_file.save(weather_path)
+        count_upload_bytes(sum(os.path.getsize(p) for p in saved_paths + [weather_path] if p), 'batch')
+        
+        processing_status[job_id] = "Initializing"
         processing_progress[job_id] = 0
-        print(error_msg)
-        print(traceback.format_exc())
+        processing_messages[job_id] = f"Starting batch processing of {len(inputs)} files..."
+        
+        processing_thread = threading.Thread(
+            target=process_batch_async,
+            args=(job_id, inputs, weather_path, params['atn_min'], params['wavelength'], upload_folder),
+            kwargs={'ona_series': params['ona_series'], 'profile': params['profile']}
+        )
+        processing_thread.daemon = True
+        processing_thread.start()
+        
+        return jsonify({
+            'job_id': job_id,
+            'status': 'Processing started',
+            'file_count': len(inputs),
+            'message': 'Batch processing has started. Poll /api/status/{job_id} for updates.'
+        })
+        
+    except Exception as e:
+        logger.error("Error in process_batch: %s", e, exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+def process_batch_async(job_id: str, inputs: List, weather_path: Optional[str],
+                        atn_min: float, wavelength: str, upload_folder: str,
+                        ona_series: Optional[Dict[str, List[str]]] = None, profile: Optional[str] = None):
+    """Parse a batch in parallel, merge it into one series and run the shared processing stages"""
+    try:
+        estimate = estimate_batch_memory(inputs, weather_path, ona_series)
+        with admission(job_id, estimate), capture_profile(job_id, profile):
+            run_processing_stages(
+                job_id, lambda: merge_aethalometer_frames(parse_files_parallel(inputs, job_id=job_id), job_id=job_id),
+                weather_path, atn_min, wavelength, ona_series=ona_series
+            )
+        
+    except JobCancelled:
+        finish_cancelled(job_id)
+    except Exception as e:
+        if cancel_requested(job_id):
+            # A file that fails while the parse pool winds down after a cancel is not a job error
+            finish_cancelled(job_id)
+        else:
+            error_msg = f"Error during batch processing: {str(e)}"
+            processing_status[job_id] = "Error"
+            processing_messages[job_id] = error_msg
+            processing_progress[job_id] = 0
+            logger.error(error_msg, exc_info=True)
+    finally:
+        clear_cancel(job_id)
+        shutil.rmtree(upload_folder, ignore_errors=True)
 
 @api_bp.route('/status/<job_id>', methods=['GET'])
 def get_status(job_id: str):
@@ -250,8 +681,11 @@ def get_status(job_id: str):
         response = {
             'status': status,
             'message': message,
-            'progress': progress
+            'progress': progress,
+            'stages': job_profile(job_id)['stages']
         }
+        if job_id in processing_admissions:
+            response['admission'] = processing_admissions[job_id]
         
         # Add results if processing is complete
         if status == "Completed":
@@ -279,22 +713,71 @@ def get_status(job_id: str):
                     'error': 'All visualization attempts failed'
                 }), 500
                 
+            # Results someone is looking at are the last to be evicted
+            touch_job(job_id)
             response['results'] = results
             
         return jsonify(response)
         
     except Exception as e:
-        print(f"Error in get_status: {e}")
-        print(traceback.format_exc())
+        logger.error("Error in get_status: %s", e, exc_info=True)
         return jsonify({
             'status': 'Error',
             'message': str(e),
             'error': 'Internal server error'
         }), 500
 
+@api_bp.route('/jobs/<job_id>/profile', methods=['GET'])
+def get_job_profile(job_id: str):
+    """Per-stage wall time, CPU time, rows and memory of a job, plus its profiler report if one was requested"""
+    if job_id not in processing_status:
+        return jsonify({'error': 'Invalid or expired job ID'}), 404
+
+    profile = job_profile(job_id)
+    profile['job_id'] = job_id
+    profile['status'] = processing_status[job_id]
+    return jsonify(profile)
+
+@api_bp.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id: str):
+    """
+    Ask a running job to stop.
+    
+    The job thread stops at its next checkpoint (between input chunks, during the ONA
+    window scan, around weather synchronization and between plots), reports the status
+    Cancelled and removes its inputs and partial outputs. An upload still streaming
+    into the job is aborted. A job shared by identical submissions keeps running until
+    every one of them has cancelled; each earlier request only detaches its submitter.
+    """
+    if job_id not in processing_status:
+        return jsonify({'error': 'Invalid or expired job ID'}), 404
+    if processing_status[job_id] in FINISHED_STATUSES:
+        return jsonify({'error': f'Job has already finished ({processing_status[job_id]})'}), 409
+    
+    attached = detach_job(job_id)
+    if attached:
+        return jsonify({
+            'job_id': job_id,
+            'status': 'Detached',
+            'attached': attached,
+            'message': 'Other identical submissions are still attached, so the job keeps running for them.'
+        })
+    
+    request_cancel(job_id)
+    processing_messages[job_id] = "Cancelling..."
+    for upload_id, session in list(upload_sessions.items()):
+        if session['job_id'] == job_id and not session['complete']:
+            release_upload(session)
+    
+    return jsonify({
+        'job_id': job_id,
+        'status': 'Cancelling',
+        'message': 'Cancellation requested. Poll /api/status/{job_id} until the status is Cancelled.'
+    }), 202
+
 @api_bp.route('/download/<filename>', methods=['GET'])
 def download_file(filename: str):
-    """Download processed file with security checks"""
+    """Download a processed file; with DOWNLOAD_MODE=accel nginx sends the bytes (see file_delivery.py)"""
     try:
         if not filename or '..' in filename:
             return jsonify({'error': 'Invalid filename'}), 400
@@ -303,8 +786,9 @@ def download_file(filename: str):
         if not os.path.exists(file_path):
             return jsonify({'error': 'File not found'}), 404
         
-        return send_from_directory('app/data/results', filename, as_attachment=True)
+        touch_artifact(file_path)
+        return send_artifact('app/data/results', filename, as_attachment=True)
         
     except Exception as e:
-        print(f"Error in download_file: {e}")
+        logger.error("Error in download_file: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
@@ -0,0 +1,106 @@
+import logging
+import os
+import pandas as pd
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+
+from app.processing.export import EXPORT_FORMATS, parse_resample, stream_export
+from app.processing.series_store import series_files
+from app.utils.status_tracker import processing_status
+from app.utils.janitor import touch_artifact
+from app.utils.metrics import inc_counter
+
+logger = logging.getLogger(__name__)
+
+export_bp = Blueprint('export', __name__)
+
+def parse_time(value, name):
+    """Optional UTC time parameter; naive times are taken as UTC"""
+    if not value:
+        return None
+    try:
+        timestamp = pd.Timestamp(value)
+    except ValueError:
+        raise ValueError(f'Invalid {name} time')
+    return timestamp.tz_localize('UTC') if timestamp.tzinfo is None else timestamp.tz_convert('UTC')
+
+def parse_export_params(values):
+    """Validate the export parameters of a request, raising ValueError with a client-facing message"""
+    fmt = values.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Invalid format. Use one of: {', '.join(EXPORT_FORMATS)}")
+    if fmt == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError('Parquet export needs pyarrow, which is not installed on this server')
+
+    start = parse_time(values.get('start'), 'start')
+    end = parse_time(values.get('end'), 'end')
+    if start is not None and end is not None and start > end:
+        raise ValueError('start must not be after end')
+
+    columns = values.get('columns')
+    return {
+        'fmt': fmt,
+        'columns': [c.strip() for c in columns.split(',') if c.strip()] if columns else None,
+        'start': start,
+        'end': end,
+        'resample': parse_resample(values.get('resample')),
+        'compress': values.get('gzip', '').lower() in ('1', 'true', 'yes')
+    }
+
+def result_files(results, start=None, end=None):
+    """
+    CSV files holding a completed job's processed rows: its result file, or for a series
+    append the stored series segments in the range
+    """
+    if 'series' in results:
+        return series_files(results['series']['series_id'], start, end)
+    path = os.path.join('app/data/results', results['download_path'])
+    return [path] if os.path.exists(path) else []
+
+@export_bp.route('/<job_id>/export', methods=['GET'])
+def export_results(job_id: str):
+    """
+    Stream a subset of a job's processed data as csv, parquet or netcdf.
+
+    Query parameters: start and end (ISO times, UTC unless an offset is given), columns
+    (comma-separated; timestamp is always included), resample (fixed interval such as
+    1h), format and gzip. Rows are read, encoded and sent chunk by chunk.
+    """
+    if job_id not in processing_status:
+        return jsonify({'error': 'Invalid or expired job ID'}), 404
+    results = processing_status.get(job_id + '_results')
+    if processing_status[job_id] != 'Completed' or not results:
+        return jsonify({'error': 'Job has not completed'}), 409
+
+    try:
+        params = parse_export_params(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # A series range between its segments still exports the (empty) range of one of them
+    paths = result_files(results, params['start'], params['end']) or result_files(results)
+    if not paths:
+        return jsonify({'error': 'Processed data is no longer available'}), 404
+
+    try:
+        parts = stream_export(paths, **params)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    for path in paths:
+        touch_artifact(path)
+    inc_counter('aethalometer_exports_total', format=params['fmt'])
+    mimetype, extension = EXPORT_FORMATS[params['fmt']]
+    if 'series' in results:
+        filename = f"series_{results['series']['series_id']}.{extension}"
+    else:
+        filename = f"{os.path.splitext(results['download_path'])[0]}.{extension}"
+    if params['compress']:
+        mimetype, filename = 'application/gzip', filename + '.gz'
+    return Response(stream_with_context(parts), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        # Sent on as it is produced rather than buffered by nginx
+        'X-Accel-Buffering': 'no'
+    })
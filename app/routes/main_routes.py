@@ -1,7 +1,22 @@
-from flask import Blueprint, render_template
+import os
+from flask import Blueprint, render_template, abort
+from app.utils.file_delivery import send_artifact
+from app.utils.janitor import touch_artifact
+from app.routes.series_routes import restore_series_plot
 
 main_bp = Blueprint('main', __name__)
 
 @main_bp.route('/')
 def index():
     return render_template('index.html')
+
+@main_bp.route('/static/<path:filename>')
+def static_file(filename):
+    """Plot files, with cache headers, Range support and .gz variants (nginx serves these itself when in front)"""
+    if '..' in filename or filename.startswith('/'):
+        abort(404)
+    path = os.path.join('app/static', filename)
+    if not os.path.isfile(path) and not restore_series_plot(filename):
+        abort(404)
+    touch_artifact(path)
+    return send_artifact('app/static', filename)
@@ -0,0 +1,209 @@
+import logging
+from flask import Blueprint, request, jsonify, Response
+from werkzeug.utils import secure_filename
+import os
+import re
+import threading
+
+from app.processing.aethalometer import process_aethalometer_data_in_chunks
+from app.processing.input_streams import INPUT_EXTENSIONS
+from app.processing.ona_kernels import get_ona_backend
+from app.processing.series_store import (
+    append_to_series, load_series_state, load_aggregates, load_pending, iter_series_rows,
+    series_lock, series_plot_name, SERIES_PLOT_PATTERN
+)
+from app.processing.visualization import create_series_visualizations
+from app.routes.api_routes import validate_file, parse_processing_params, new_job_id, remove_files, finish_cancelled
+from app.utils.status_tracker import processing_status, processing_progress, processing_messages
+from app.utils.json_encoder import ensure_json_serializable
+from app.utils.profiling import track_stage, capture_profile, parse_profiler
+from app.utils.metrics import count_upload_bytes
+from app.utils.janitor import register_artifacts
+from app.utils.cancellation import JobCancelled, clear_cancel
+from app.utils.admission import admission
+from app.processing.memory_estimate import estimate_job_memory
+
+logger = logging.getLogger(__name__)
+
+series_bp = Blueprint('series', __name__)
+
+SERIES_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+def series_summary(state):
+    """Client-facing view of a series state"""
+    return {
+        'series_id': state['series_id'],
+        'wavelength': state['wavelength'],
+        'atn_min': state['atn_min'],
+        'rows_finalized': state['rows_finalized'],
+        'segments': len(state['segments']),
+        'last_timestamp': state['last_timestamp'],
+        'open_window': state['open_window'],
+        'plot': f"/static/{series_plot_name(state['series_id'], state.get('revision', 0))}" if state['segments'] else None
+    }
+
+def restore_series_plot(filename):
+    """
+    Rewrite the plot of a series' current revision when its file is gone (removed by
+    the janitor of a process that did not know it was current, or after a restart);
+    returns whether filename names such a plot. Plots of older revisions are not restored.
+    """
+    match = SERIES_PLOT_PATTERN.match(filename)
+    if not match:
+        return False
+    series_id = match['series_id']
+    with series_lock(series_id):
+        state = load_series_state(series_id)
+        if state is None or state.get('revision', 0) != int(match['revision']):
+            return False
+        aggregates = load_aggregates(series_id)
+        if aggregates is None:
+            return False
+        create_series_visualizations(aggregates, load_pending(state), state['wavelength'], series_id,
+                                     state.get('revision', 0))
+    return True
+
+@series_bp.route('/<series_id>/append', methods=['POST'])
+def append_series(series_id: str):
+    """
+    Append a new file to a stored series, creating the series on first use.
+
+    Only the new rows are parsed and run through ONA; wavelength and atn_min are
+    taken from the request when the series is created and from its state afterwards.
+    """
+    try:
+        if not SERIES_ID_PATTERN.match(series_id):
+            return jsonify({'error': 'Invalid series ID'}), 400
+        
+        if 'aethalometer_file' not in request.files:
+            return jsonify({'error': 'No aethalometer file provided'}), 400
+        
+        aethalometer_file = request.files['aethalometer_file']
+        if not validate_file(aethalometer_file, INPUT_EXTENSIONS):
+            return jsonify({'error': 'Invalid aethalometer file format. Only CSV files (optionally .gz, .zst or .zip compressed) are allowed.'}), 400
+        
+        state = load_series_state(series_id)
+        try:
+            if state:
+                params = {'atn_min': state['atn_min'], 'wavelength': state['wavelength'],
+                          'profile': parse_profiler(request.form)}
+            else:
+                params = parse_processing_params(request.form)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        job_id = new_job_id(aethalometer_file.filename)
+        upload_folder = 'app/data'
+        os.makedirs(upload_folder, exist_ok=True)
+        aethalometer_path = os.path.join(upload_folder, f"{job_id}_{secure_filename(aethalometer_file.filename)}")
+        aethalometer_file.save(aethalometer_path)
+        count_upload_bytes(os.path.getsize(aethalometer_path), 'series')
+        register_artifacts(job_id, [aethalometer_path])
+        
+        processing_status[job_id] = "Initializing"
+        processing_progress[job_id] = 0
+        processing_messages[job_id] = f"Appending to series {series_id}..."
+        
+        processing_thread = threading.Thread(
+            target=process_series_append_async,
+            args=(job_id, series_id, aethalometer_path, params['atn_min'], params['wavelength']),
+            kwargs={'profile': params['profile']}
+        )
+        processing_thread.daemon = True
+        processing_thread.start()
+        
+        return jsonify({
+            'job_id': job_id,
+            'series_id': series_id,
+            'status': 'Processing started',
+            'message': 'Append has started. Poll /api/status/{job_id} for updates.'
+        })
+        
+    except Exception as e:
+        logger.error("Error in append_series: %s", e, exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+def process_series_append_async(job_id: str, series_id: str, aethalometer_path: str,
+                                atn_min: float, wavelength: str, profile=None):
+    """Parse only the new file, resume ONA on the series and refresh its plot from the aggregates"""
+    try:
+        estimate = estimate_job_memory(aethalometer_path, os.path.getsize(aethalometer_path))
+        with admission(job_id, estimate), capture_profile(job_id, profile):
+            with track_stage(job_id, 'ingest') as record:
+                new_df = process_aethalometer_data_in_chunks(aethalometer_path, job_id=job_id)
+                if new_df.empty:
+                    raise ValueError("Invalid aethalometer data format")
+                record['rows'] = len(new_df)
+            
+            with track_stage(job_id, 'ona', rows=len(new_df)):
+                state, added_rows = append_to_series(series_id, new_df, wavelength, atn_min, job_id=job_id)
+            del new_df
+            
+            with track_stage(job_id, 'visualization'):
+                aggregates = load_aggregates(series_id)
+                if aggregates is None:
+                    raise ValueError("Series has no finalized ONA windows yet")
+                
+                processing_messages[job_id] = "Updating series visualization..."
+                processing_progress[job_id] = 95
+                visualizations = create_series_visualizations(aggregates, load_pending(state), state['wavelength'], series_id,
+                                                              state.get('revision', 0))
+        
+        result_data = {
+            'series': series_summary(state),
+            'added_rows': added_rows,
+            'wavelength': state['wavelength'],
+            'atn_min': state['atn_min'],
+            'visualizations': visualizations,
+            'download_path': f'/api/series/{series_id}/download',
+            'total_rows': state['rows_finalized'],
+            'metadata': {'ona_backend': get_ona_backend()}
+        }
+        
+        processing_status[job_id] = "Completed"
+        processing_progress[job_id] = 100
+        processing_messages[job_id] = f"Appended {added_rows} rows to series {series_id}"
+        processing_status[job_id + "_results"] = ensure_json_serializable(result_data)
+        
+    except JobCancelled:
+        # Only ingestion has checkpoints, so the stored series is never left half-appended
+        finish_cancelled(job_id)
+    except Exception as e:
+        error_msg = f"Error appending to series: {str(e)}"
+        processing_status[job_id] = "Error"
+        processing_messages[job_id] = error_msg
+        processing_progress[job_id] = 0
+        logger.error(error_msg, exc_info=True)
+    finally:
+        clear_cancel(job_id)
+        remove_files([aethalometer_path])
+
+@series_bp.route('/<series_id>', methods=['GET'])
+def get_series(series_id: str):
+    """Report the stored state of a series"""
+    if not SERIES_ID_PATTERN.match(series_id):
+        return jsonify({'error': 'Invalid series ID'}), 400
+    state = load_series_state(series_id)
+    if state is None:
+        return jsonify({'error': 'Series not found'}), 404
+    return jsonify(series_summary(state))
+
+@series_bp.route('/<series_id>/download', methods=['GET'])
+def download_series(series_id: str):
+    """Stream the whole series as one CSV, segment by segment"""
+    if not SERIES_ID_PATTERN.match(series_id):
+        return jsonify({'error': 'Invalid series ID'}), 400
+    if load_series_state(series_id) is None:
+        return jsonify({'error': 'Series not found'}), 404
+    
+    def generate():
+        header = True
+        for frame in iter_series_rows(series_id):
+            yield frame.to_csv(index=False, header=header)
+            header = False
+    
+    return Response(
+        generate(),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename=series_{series_id}.csv'}
+    )
@@ -0,0 +1,179 @@
+import logging
+from flask import Blueprint, request, jsonify, current_app
+
+from app.processing.input_streams import INPUT_EXTENSIONS
+from app.routes.api_routes import (
+    validate_filename, parse_processing_params, new_job_id, start_processing_job
+)
+from app.utils.metrics import count_upload_bytes
+from app.utils.upload_store import (
+    upload_sessions, create_upload, write_part, complete_upload, abort_upload,
+    discard_upload, upload_summary, open_upload_stream
+)
+
+logger = logging.getLogger(__name__)
+
+upload_bp = Blueprint('uploads', __name__)
+
+UPLOAD_KINDS = {'aethalometer', 'weather'}
+
+def _request_values():
+    """Accept parameters as JSON, form fields or query string"""
+    values = dict(request.args)
+    values.update(request.form)
+    values.update(request.get_json(silent=True) or {})
+    return values
+
+def _resolve_weather_upload(values):
+    """Return the path of a completed weather upload referenced by a request, if any"""
+    weather_upload_id = values.get('weather_upload_id')
+    if not weather_upload_id:
+        return None
+    weather = upload_sessions.get(weather_upload_id)
+    if not weather or weather['kind'] != 'weather':
+        raise ValueError('Unknown weather upload ID')
+    if not weather['complete']:
+        raise ValueError('Weather upload has not been completed')
+    discard_upload(weather_upload_id)
+    return weather['path']
+
+def _start_upload_job(session, values, stream):
+    """Start processing an aethalometer upload, optionally while it is still arriving"""
+    params = parse_processing_params(values)
+    weather_path = _resolve_weather_upload(values)
+    job_id = new_job_id(session['filename'])
+    session['job_id'] = job_id
+    start_processing_job(
+        job_id, session['path'], weather_path, params['atn_min'], params['wavelength'],
+        aethalometer_stream=open_upload_stream(session) if stream else None,
+        ona_series=params['ona_series'], profile=params['profile']
+    )
+    return job_id
+
+@upload_bp.route('', methods=['POST'])
+def init_upload():
+    """
+    Start a chunked upload.
+
+    Expects filename and size, plus kind ('aethalometer' or 'weather'). For aethalometer
+    uploads, passing stream=true with the usual processing parameters starts the job
+    immediately so parsing runs while the remaining parts are uploaded.
+    """
+    try:
+        values = _request_values()
+        filename = values.get('filename')
+        if not validate_filename(filename, INPUT_EXTENSIONS):
+            return jsonify({'error': 'Invalid file format. Only CSV files (optionally .gz, .zst or .zip compressed) are allowed.'}), 400
+
+        try:
+            total_size = int(values.get('size'))
+            if total_size <= 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            return jsonify({'error': 'A positive file size is required'}), 400
+
+        # The file is preallocated at the declared size, so the size is held to the same
+        # limit as a regular upload before anything is written
+        max_size = current_app.config.get('MAX_CONTENT_LENGTH')
+        if max_size and total_size > max_size:
+            return jsonify({'error': f'File size exceeds the {max_size} byte upload limit'}), 413
+
+        kind = values.get('kind', 'aethalometer')
+        if kind not in UPLOAD_KINDS:
+            return jsonify({'error': 'Invalid upload kind'}), 400
+
+        stream = str(values.get('stream', 'false')).lower() in ('1', 'true', 'yes')
+        if stream and kind == 'aethalometer':
+            # Validate before allocating anything so a bad request leaves nothing behind
+            try:
+                parse_processing_params(values)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+        session = create_upload(filename, total_size, 'app/data', kind=kind)
+
+        if stream and kind == 'aethalometer':
+            try:
+                _start_upload_job(session, values, stream=True)
+            except ValueError as e:
+                abort_upload(session)
+                discard_upload(session['upload_id'])
+                return jsonify({'error': str(e)}), 400
+
+        return jsonify(upload_summary(session)), 201
+
+    except Exception as e:
+        logger.error("Error in init_upload: %s", e, exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@upload_bp.route('/<upload_id>', methods=['GET'])
+def get_upload(upload_id: str):
+    """Report received byte ranges so an interrupted client can resume"""
+    session = upload_sessions.get(upload_id)
+    if not session:
+        return jsonify({'error': 'Invalid or expired upload ID'}), 404
+    return jsonify(upload_summary(session))
+
+@upload_bp.route('/<upload_id>', methods=['PUT'])
+def put_upload_part(upload_id: str):
+    """Write the raw request body at the given byte offset of the upload"""
+    try:
+        session = upload_sessions.get(upload_id)
+        if not session:
+            return jsonify({'error': 'Invalid or expired upload ID'}), 404
+
+        try:
+            offset = int(request.args.get('offset', 0))
+        except ValueError:
+            return jsonify({'error': 'Invalid part offset'}), 400
+
+        # Read straight from the WSGI input so the part is never spooled by Werkzeug
+        try:
+            written = write_part(session, offset, request.stream)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        count_upload_bytes(written, 'uploads')
+
+        response = upload_summary(session)
+        response['written'] = written
+        return jsonify(response)
+
+    except Exception as e:
+        logger.error("Error in put_upload_part: %s", e, exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@upload_bp.route('/<upload_id>/complete', methods=['POST'])
+def finish_upload(upload_id: str):
+    """Finish an upload and start processing it if that has not already happened"""
+    try:
+        session = upload_sessions.get(upload_id)
+        if not session:
+            return jsonify({'error': 'Invalid or expired upload ID'}), 404
+
+        try:
+            complete_upload(session)
+        except ValueError as e:
+            response = upload_summary(session)
+            response['error'] = str(e)
+            return jsonify(response), 409
+
+        # Weather uploads stay registered until an aethalometer job claims them
+        if session['kind'] == 'weather':
+            return jsonify(upload_summary(session))
+
+        if not session['job_id']:
+            try:
+                _start_upload_job(session, _request_values(), stream=False)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+        discard_upload(upload_id)
+        return jsonify({
+            'job_id': session['job_id'],
+            'status': 'Processing started',
+            'message': 'Processing has started. Poll /api/status/{job_id} for updates.'
+        })
+
+    except Exception as e:
+        logger.error("Error in finish_upload: %s", e, exc_info=True)
+        return jsonify({'error': str(e)}), 500
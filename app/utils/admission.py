@@ -0,0 +1,136 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from app.utils.cancellation import check_cancelled
+from app.utils.memory import current_rss
+from app.utils.metrics import inc_counter
+from app.utils.status_tracker import processing_status, processing_messages, processing_admissions
+
+logger = logging.getLogger(__name__)
+
+# Memory all running jobs may use together. 0 takes ADMISSION_MEMORY_FRACTION of the
+# container's memory limit (or of physical memory), less what the idle process uses.
+ADMISSION_MEMORY_MB = int(os.environ.get('ADMISSION_MEMORY_MB', 0))
+ADMISSION_MEMORY_FRACTION = float(os.environ.get('ADMISSION_MEMORY_FRACTION', 0.75))
+
+# Seconds between checks of a queued job for cancellation
+ADMISSION_POLL_INTERVAL = 1.0
+
+CGROUP_MEMORY_LIMITS = ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes')
+
+# Admitted jobs with their estimates, and queued job IDs in arrival order
+_admitted = {}
+_queue = []
+_estimates = {}
+_admission_condition = threading.Condition()
+_budget = None
+
+def _mb(size):
+    return round(size / (1024 * 1024), 1)
+
+def memory_limit_bytes():
+    """Memory limit of the container, or physical memory when there is none"""
+    for path in CGROUP_MEMORY_LIMITS:
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        # cgroup v1 reports "no limit" as a huge page-rounded number
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value)
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+def admission_budget_bytes():
+    """Memory shared by running jobs, fixed the first time it is needed"""
+    global _budget
+    if _budget is None:
+        if ADMISSION_MEMORY_MB > 0:
+            _budget = ADMISSION_MEMORY_MB * 1024 * 1024
+        else:
+            _budget = max(0, int(memory_limit_bytes() * ADMISSION_MEMORY_FRACTION) - current_rss())
+        logger.info("Job memory budget: %s MB", _mb(_budget))
+    return _budget
+
+def _fits(estimate):
+    # A job larger than the whole budget runs alone rather than never
+    return not _admitted or sum(_admitted.values()) + estimate <= admission_budget_bytes()
+
+def _wait_reason(job_id):
+    position = _queue.index(job_id)
+    estimate = _estimates[job_id]
+    free = admission_budget_bytes() - sum(_admitted.values())
+    if position:
+        return f"{position} queued job(s) ahead"
+    if estimate > admission_budget_bytes():
+        return (f"needs ~{_mb(estimate)} MB, more than the {_mb(admission_budget_bytes())} MB budget, "
+                f"so it waits for the {len(_admitted)} running job(s) to finish")
+    return f"needs ~{_mb(estimate)} MB, {_mb(max(free, 0))} MB of the {_mb(admission_budget_bytes())} MB budget free"
+
+def _admit_waiting():
+    """Admit queued jobs in arrival order while the head of the queue fits; call with the condition held"""
+    while _queue and _fits(_estimates[_queue[0]]):
+        job_id = _queue.pop(0)
+        _admitted[job_id] = _estimates[job_id]
+        processing_admissions[job_id].update({'state': 'admitted', 'queue_position': None, 'wait_reason': None})
+        if processing_status.get(job_id) == "Queued":
+            processing_status[job_id] = "Initializing"
+            processing_messages[job_id] = "Memory available, starting data processing..."
+    for job_id in _queue:
+        reason = _wait_reason(job_id)
+        processing_admissions[job_id].update({'queue_position': _queue.index(job_id) + 1, 'wait_reason': reason})
+        processing_messages[job_id] = f"Queued: {reason}"
+    _admission_condition.notify_all()
+
+@contextmanager
+def admission(job_id, estimate):
+    """
+    Hold a job until its estimated peak memory fits the remaining budget, then run the block.
+
+    Jobs are admitted first come, first served: a queued job also waits for every job
+    queued before it, so large jobs are not starved by smaller ones. The estimate,
+    queue position and wait reason are kept in processing_admissions for /api/status.
+    A queued job can be cancelled, which marks its entry cancelled. The reservation is
+    returned when the block ends.
+    """
+    queued_at = time.time()
+    with _admission_condition:
+        _estimates[job_id] = estimate
+        processing_admissions[job_id] = {
+            'estimated_peak_mb': _mb(estimate),
+            'budget_mb': _mb(admission_budget_bytes()),
+            'state': 'queued',
+            'queue_position': None,
+            'wait_reason': None,
+            'queued_seconds': 0.0
+        }
+        _queue.append(job_id)
+        _admit_waiting()
+        if job_id in _queue:
+            processing_status[job_id] = "Queued"
+            inc_counter('aethalometer_jobs_queued_total')
+            logger.info("Job %s queued: %s", job_id, processing_admissions[job_id]['wait_reason'])
+        try:
+            while job_id in _queue:
+                _admission_condition.wait(ADMISSION_POLL_INTERVAL)
+                check_cancelled(job_id)
+        except BaseException:
+            if job_id in _queue:
+                _queue.remove(job_id)
+                _admit_waiting()
+            _estimates.pop(job_id, None)
+            # A job cancelled while queued leaves the queue for good
+            processing_admissions[job_id].update({'state': 'cancelled', 'queue_position': None, 'wait_reason': None,
+                                                  'queued_seconds': round(time.time() - queued_at, 3)})
+            raise
+        processing_admissions[job_id]['queued_seconds'] = round(time.time() - queued_at, 3)
+
+    try:
+        yield
+    finally:
+        with _admission_condition:
+            _admitted.pop(job_id, None)
+            _estimates.pop(job_id, None)
+            _admit_waiting()
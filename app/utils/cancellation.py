@@ -0,0 +1,29 @@
+import threading
+
+# Jobs whose cancellation was requested and not yet acknowledged by their thread
+_cancel_requests = set()
+_cancel_lock = threading.Lock()
+
+class JobCancelled(BaseException):
+    """
+    Raised at a checkpoint of a job whose cancellation was requested.
+
+    A BaseException, like asyncio.CancelledError, so the except Exception blocks that
+    turn stage failures into warnings or errors let it through to the job thread.
+    """
+
+def request_cancel(job_id):
+    with _cancel_lock:
+        _cancel_requests.add(job_id)
+
+def cancel_requested(job_id):
+    return bool(job_id) and job_id in _cancel_requests
+
+def check_cancelled(job_id):
+    """Checkpoint: raise JobCancelled if the job has been asked to stop; does nothing without a job_id"""
+    if cancel_requested(job_id):
+        raise JobCancelled(job_id)
+
+def clear_cancel(job_id):
+    with _cancel_lock:
+        _cancel_requests.discard(job_id)
@@ -0,0 +1,75 @@
+import hashlib
+import json
+import threading
+
+# Block size used when copying an upload to disk while hashing it
+SAVE_BLOCK_SIZE = 1024 * 1024
+
+# Running jobs by the key of their inputs and parameters, the key of each job, and the
+# number of submissions attached to each job
+_inflight_jobs = {}
+_job_keys = {}
+_attached = {}
+_inflight_lock = threading.Lock()
+
+def save_hashed(file_storage, path):
+    """Save an uploaded file, hashing its content on the way; returns (hex digest, size)"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'wb') as f:
+        while True:
+            block = file_storage.stream.read(SAVE_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+            f.write(block)
+            size += len(block)
+    return digest.hexdigest(), size
+
+def job_key(digests, params):
+    """Key identifying a job by the content of its inputs and its parameters"""
+    return hashlib.sha256(json.dumps([digests, params], sort_keys=True).encode('utf-8')).hexdigest()
+
+def claim_job(key, job_id):
+    """
+    Register job_id as the job computing key, unless an identical job is already running.
+
+    Returns the ID of the job that computes the result: job_id itself, or the running
+    job that a duplicate submission should attach to.
+    """
+    with _inflight_lock:
+        running = _inflight_jobs.get(key)
+        if running is not None:
+            _attached[running] += 1
+            return running
+        _inflight_jobs[key] = job_id
+        _job_keys[job_id] = key
+        _attached[job_id] = 1
+        return job_id
+
+def detach_job(job_id):
+    """
+    Withdraw one submission from a job, such as when one of its submitters cancels.
+
+    Returns how many submissions are still attached; at 0 the job should stop, and
+    identical submissions no longer attach to it. Jobs that were never claimed have a
+    single submitter.
+    """
+    with _inflight_lock:
+        remaining = _attached.get(job_id, 1) - 1
+        if remaining > 0:
+            _attached[job_id] = remaining
+            return remaining
+        _attached.pop(job_id, None)
+        key = _job_keys.get(job_id)
+        if key is not None and _inflight_jobs.get(key) == job_id:
+            del _inflight_jobs[key]
+        return 0
+
+def release_job(job_id):
+    """Stop routing duplicates to a job once it has finished; later submissions start afresh"""
+    with _inflight_lock:
+        _attached.pop(job_id, None)
+        key = _job_keys.pop(job_id, None)
+        if key is not None and _inflight_jobs.get(key) == job_id:
+            del _inflight_jobs[key]
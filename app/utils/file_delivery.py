@@ -0,0 +1,85 @@
+import gzip
+import logging
+import mimetypes
+import os
+import re
+import shutil
+from urllib.parse import quote
+from flask import Response, request, send_from_directory
+
+logger = logging.getLogger(__name__)
+
+# 'direct' sends files from Flask; 'accel' only authorizes the request and hands the file
+# to nginx with X-Accel-Redirect (see frontend/nginx.conf), so no Python worker is held
+# for the length of the transfer
+DOWNLOAD_MODE = os.environ.get('DOWNLOAD_MODE', 'direct')
+
+# Internal nginx locations serving each folder in accel mode
+ACCEL_LOCATIONS = {
+    'app/data/results': os.environ.get('ACCEL_RESULTS_LOCATION', '/protected/results/'),
+    'app/static': os.environ.get('ACCEL_STATIC_LOCATION', '/protected/static/')
+}
+
+# Result and plot names that carry the job timestamp, or the revision of a stored series,
+# are never rewritten, so clients may keep them for as long as they like
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+IMMUTABLE_NAME_PATTERN = re.compile(r'_\d{8}_\d{6}\.\w+$|^series_[A-Za-z0-9_-]+_r\d+_\w+\.html$')
+
+# Any other file may be rewritten in place, so caches revalidate it (Last-Modified and
+# ETag) on every use
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+# Write a .gz copy next to each result CSV and plot, served to clients that accept gzip
+PRECOMPRESS_ARTIFACTS = os.environ.get('PRECOMPRESS_ARTIFACTS', '1') == '1'
+PRECOMPRESS_MIN_BYTES = 1024
+PRECOMPRESS_LEVEL = 6
+
+def precompress(path):
+    """Write path.gz next to a finished artifact and return its path, or None if it was not worth it"""
+    if not PRECOMPRESS_ARTIFACTS or os.path.getsize(path) < PRECOMPRESS_MIN_BYTES:
+        return None
+    gz_path = path + '.gz'
+    partial_path = gz_path + '.partial'
+    with open(path, 'rb') as source, gzip.open(partial_path, 'wb', compresslevel=PRECOMPRESS_LEVEL) as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+    # Renamed into place so a half-written copy is never served
+    os.replace(partial_path, gz_path)
+    return gz_path
+
+def cache_control(filename):
+    """Cache-Control for an artifact: immutable only for names that are never reused"""
+    if IMMUTABLE_NAME_PATTERN.search(filename):
+        return IMMUTABLE_CACHE_CONTROL
+    return REVALIDATE_CACHE_CONTROL
+
+def _accepts_gzip():
+    return 'gzip' in request.headers.get('Accept-Encoding', '').lower()
+
+def send_artifact(folder, filename, as_attachment=False):
+    """
+    Send a result or plot file, with immutable cache headers when its name is never reused.
+
+    In accel mode the response carries only headers and nginx sends the bytes with
+    sendfile, answering Range requests and picking the .gz variant itself (gzip_static).
+    In direct mode Flask answers conditional and Range requests and sends the .gz
+    variant when the client accepts gzip. The caller checks the file exists.
+    """
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    if DOWNLOAD_MODE == 'accel':
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = ACCEL_LOCATIONS[folder] + quote(filename)
+        if as_attachment:
+            response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    else:
+        name = filename
+        gzipped = _accepts_gzip() and os.path.isfile(os.path.join(folder, filename + '.gz'))
+        if gzipped:
+            name = filename + '.gz'
+        # Absolute, as Flask resolves relative folders against the package root
+        response = send_from_directory(os.path.abspath(folder), name, mimetype=mimetype,
+                                       as_attachment=as_attachment, download_name=filename, conditional=True)
+        if gzipped:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = cache_control(filename)
+    return response
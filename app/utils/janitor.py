@@ -0,0 +1,193 @@
+import logging
+import os
+import threading
+import time
+from app.utils.metrics import inc_counter, FINISHED_STATUSES
+from app.utils.status_tracker import processing_status
+from app.utils.upload_store import upload_sessions, expire_uploads
+
+logger = logging.getLogger(__name__)
+
+# Seconds between sweeps of the storage folders; 0 disables the janitor
+JANITOR_INTERVAL = float(os.environ.get('JANITOR_INTERVAL', 300))
+
+# Files not accessed for this long are removed
+STORAGE_MAX_AGE_HOURS = float(os.environ.get('STORAGE_MAX_AGE_HOURS', 24))
+
+# Folders looked after, with the most bytes their files may use. Only files directly in
+# a folder are managed (job upload folders and the series store look after themselves).
+STORAGE_QUOTAS = {
+    'app/data': int(os.environ.get('UPLOADS_MAX_MB', 4096)) * 1024 * 1024,
+    'app/data/results': int(os.environ.get('RESULTS_MAX_MB', 2048)) * 1024 * 1024,
+    'app/static': int(os.environ.get('STATIC_MAX_MB', 1024)) * 1024 * 1024
+}
+
+# Artifacts by path: {'job_id', 'accessed'}; files found on disk without an entry are
+# adopted with their modification time as the last access
+_artifacts = {}
+# Long-lived files by owner, such as the current plot of a stored series: never removed
+# while they are the owner's current files
+_kept = {}
+_index_lock = threading.Lock()
+_janitor_thread = None
+
+def register_artifacts(job_id, paths):
+    """Add files produced or uploaded for a job to the index; does not touch the filesystem"""
+    now = time.time()
+    with _index_lock:
+        for path in paths:
+            if path:
+                _artifacts[os.path.normpath(path)] = {'job_id': job_id, 'accessed': now}
+
+def keep_artifacts(owner, paths):
+    """
+    Make paths the long-lived files of owner. The owner's previous files become
+    ordinary artifacts again and are aged from now on.
+    """
+    now = time.time()
+    paths = {os.path.normpath(path) for path in paths if path}
+    with _index_lock:
+        for path in _kept.pop(owner, set()) - paths:
+            if path in _artifacts:
+                _artifacts[path]['accessed'] = now
+        _kept[owner] = paths
+        for path in paths:
+            _artifacts[path] = {'job_id': None, 'accessed': now}
+
+def touch_artifact(path):
+    """Mark a file, and every other artifact of its job, as just accessed"""
+    with _index_lock:
+        entry = _artifacts.get(os.path.normpath(path))
+        job_id = entry['job_id'] if entry else None
+    if job_id:
+        touch_job(job_id)
+    elif entry:
+        entry['accessed'] = time.time()
+
+def touch_job(job_id):
+    """Mark every artifact of a job as just accessed, so its results are evicted last"""
+    now = time.time()
+    with _index_lock:
+        for entry in _artifacts.values():
+            if entry['job_id'] == job_id:
+                entry['accessed'] = now
+
+def job_artifacts(job_id):
+    """Indexed files of a job"""
+    with _index_lock:
+        return sorted(path for path, entry in _artifacts.items() if entry['job_id'] == job_id)
+
+def discard_job_artifacts(job_id):
+    """Remove every indexed file of a job right away, such as the partial outputs of a cancelled job"""
+    removed = 0
+    for path in job_artifacts(job_id):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        if _remove(path, os.path.dirname(path), 'cancelled', size):
+            removed += 1
+    return removed
+
+def _in_use(entry):
+    """Whether a file still belongs to a running job"""
+    job_id = entry['job_id']
+    return job_id is not None and processing_status.get(job_id, 'Completed') not in FINISHED_STATUSES
+
+def _remove(path, folder, reason, size):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning("Could not remove %s: %s", path, e)
+        return False
+    with _index_lock:
+        _artifacts.pop(path, None)
+    inc_counter('aethalometer_storage_evictions_total', folder=folder, reason=reason)
+    inc_counter('aethalometer_storage_evicted_bytes_total', size, folder=folder, reason=reason)
+    logger.debug("Removed %s (%s, %s bytes)", path, reason, size)
+    return True
+
+def _scan(folder):
+    """Files directly in a folder as (path, size, last access, in use), adopting unknown ones"""
+    files = []
+    try:
+        entries = list(os.scandir(folder))
+    except FileNotFoundError:
+        return files
+    uploading = {os.path.normpath(session['path']) for session in list(upload_sessions.values())}
+    with _index_lock:
+        kept = set().union(*_kept.values())
+    for item in entries:
+        if item.name.startswith('.') or not item.is_file(follow_symlinks=False):
+            continue
+        path = os.path.normpath(item.path)
+        try:
+            stat = item.stat()
+        except FileNotFoundError:
+            continue
+        with _index_lock:
+            entry = _artifacts.setdefault(path, {'job_id': None, 'accessed': stat.st_mtime})
+            accessed, in_use = entry['accessed'], _in_use(entry) or path in uploading or path in kept
+        files.append((path, stat.st_size, accessed, in_use))
+    return files
+
+def sweep(now=None):
+    """
+    Apply the age and byte quotas to every storage folder once.
+
+    Uploads idle for longer than UPLOAD_SESSION_TTL are aborted first and their files removed.
+    Files idle for longer than STORAGE_MAX_AGE_HOURS are removed; a folder still over
+    its byte quota then loses its least recently accessed files first. Files of jobs
+    that are still running, uploads in progress and kept files are never removed.
+    """
+    now = now or time.time()
+    max_age = STORAGE_MAX_AGE_HOURS * 3600
+    removed = 0
+    for path in expire_uploads(now):
+        path = os.path.normpath(path)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        if _remove(path, os.path.dirname(path), 'expired', size):
+            removed += 1
+
+    for folder, max_bytes in STORAGE_QUOTAS.items():
+        files = _scan(folder)
+        total = sum(size for _, size, _, _ in files)
+        for path, size, accessed, in_use in sorted(files, key=lambda f: f[2]):
+            if in_use:
+                continue
+            if now - accessed > max_age:
+                reason = 'age'
+            elif total > max_bytes:
+                reason = 'quota'
+            else:
+                continue
+            if _remove(path, folder, reason, size):
+                total -= size
+                removed += 1
+
+    # Forget entries whose files are gone (removed with their job, or by hand)
+    with _index_lock:
+        for path in [p for p in _artifacts if not os.path.exists(p)]:
+            del _artifacts[path]
+    return removed
+
+def _run():
+    while True:
+        time.sleep(JANITOR_INTERVAL)
+        try:
+            sweep()
+        except Exception as e:
+            logger.error("Storage janitor sweep failed: %s", e, exc_info=True)
+
+def start_janitor():
+    """Start the background janitor thread once per process"""
+    global _janitor_thread
+    if JANITOR_INTERVAL <= 0 or _janitor_thread is not None:
+        return
+    _janitor_thread = threading.Thread(target=_run, name='storage-janitor', daemon=True)
+    _janitor_thread.start()
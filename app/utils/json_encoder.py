@@ -1,7 +1,10 @@
+import logging
 import json
 import numpy as np
 import pandas as pd
 
+logger = logging.getLogger(__name__)
+
 class NpEncoder(json.JSONEncoder):
     """Custom JSON encoder that handles NumPy types and NaN values"""
     def default(self, obj):
@@ -58,7 +61,7 @@ def ensure_json_serializable(obj):
         parsed = json.loads(json_str)
         return parsed
     except Exception as e:
-        print(f"JSON serialization error: {e}")
+        logger.error("JSON serialization error: %s", e)
         # If there's an error, return a sanitized version
         if isinstance(obj, dict):
             return {k: ensure_json_serializable(v) for k, v in obj.items()}
@@ -0,0 +1,25 @@
+import logging
+import os
+
+# Level of the application's loggers: DEBUG, INFO, WARNING or ERROR
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+
+LOG_FORMAT = '%(asctime)s [%(levelname)s] %(name)s: %(message)s'
+
+def configure_logging(level=None):
+    """
+    Send the records of every app.* module logger to stderr at the configured level.
+
+    Modules log through logging.getLogger(__name__) with lazy %-style arguments, and
+    diagnostics that are expensive to compute are guarded by isEnabledFor(DEBUG), so
+    below DEBUG they cost nothing.
+    """
+    logger = logging.getLogger('app')
+    logger.setLevel((level or LOG_LEVEL).upper())
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        logger.addHandler(handler)
+        # The server's own root handlers would print every record a second time
+        logger.propagate = False
+    return logger
@@ -0,0 +1,39 @@
+import os
+import resource
+import threading
+
+# How often a stage's resident set is sampled to find its peak
+MEMORY_SAMPLE_INTERVAL = float(os.environ.get('MEMORY_SAMPLE_INTERVAL', 0.05))
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def current_rss():
+    """Resident set size of this process in bytes"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        # No procfs: fall back to the lifetime peak (kilobytes on Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class MemorySampler:
+    """Background thread recording the highest resident set seen while it runs"""
+    def __init__(self, interval=None):
+        self.interval = interval or MEMORY_SAMPLE_INTERVAL
+        self.start_rss = self.peak_rss = self.end_rss = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, current_rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        self.end_rss = current_rss()
+        self.peak_rss = max(self.peak_rss, self.end_rss)
@@ -0,0 +1,129 @@
+import os
+import threading
+from app.utils.memory import current_rss
+from app.utils.status_tracker import processing_status
+from app.utils.preload import startup_times
+
+# Upper bounds (seconds) of the stage latency histogram buckets
+STAGE_LATENCY_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Folders whose disk usage is reported, by label
+DISK_USAGE_FOLDERS = {'static': 'app/static', 'results': 'app/data/results'}
+
+# Job statuses after which a job no longer holds a worker
+FINISHED_STATUSES = ('Completed', 'Error', 'Cancelled')
+
+# Counters keyed by (name, sorted label pairs) and stage latency histograms keyed by stage
+_counters = {}
+_stage_histograms = {}
+_metrics_lock = threading.Lock()
+
+def inc_counter(name, value=1, **labels):
+    """Add to a counter; counters only live in this process and reset on restart"""
+    key = (name, tuple(sorted(labels.items())))
+    with _metrics_lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe_stage(stage, seconds, rows=None):
+    """Record one run of a job stage (called by track_stage)"""
+    with _metrics_lock:
+        histogram = _stage_histograms.get(stage)
+        if histogram is None:
+            histogram = _stage_histograms[stage] = {'buckets': [0] * len(STAGE_LATENCY_BUCKETS), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(STAGE_LATENCY_BUCKETS):
+            if seconds <= bound:
+                histogram['buckets'][i] += 1
+        histogram['sum'] += seconds
+        histogram['count'] += 1
+    if rows:
+        inc_counter('aethalometer_stage_rows_total', rows, stage=stage)
+
+def count_upload_bytes(size, route):
+    inc_counter('aethalometer_upload_bytes_total', size, route=route)
+
+def count_cache_lookup(cache, hit):
+    inc_counter('aethalometer_cache_lookups_total', cache=cache, result='hit' if hit else 'miss')
+
+def folder_size(path):
+    """Total size in bytes of the files under a folder"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                # Removed by cleanup while walking
+                continue
+    return total
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+def _job_counts():
+    counts = {}
+    for job_id, status in list(processing_status.items()):
+        if job_id.endswith('_results'):
+            continue
+        counts[status] = counts.get(status, 0) + 1
+    return counts
+
+def render_metrics():
+    """Current metrics in the Prometheus text exposition format"""
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    counts = _job_counts()
+    family('aethalometer_jobs', 'gauge', 'Jobs known to this process by status')
+    for status, count in sorted(counts.items()):
+        lines.append(f'aethalometer_jobs{_labels([("status", status)])} {count}')
+    family('aethalometer_jobs_active', 'gauge', 'Jobs that have not completed or failed yet')
+    lines.append(f'aethalometer_jobs_active {sum(c for s, c in counts.items() if s not in FINISHED_STATUSES)}')
+    family('aethalometer_startup_seconds', 'gauge', 'Seconds spent on each startup and preload step of this process')
+    for step, seconds in sorted(startup_times.items()):
+        lines.append(f'aethalometer_startup_seconds{_labels([("step", step)])} {seconds}')
+
+    with _metrics_lock:
+        counters = dict(_counters)
+        histograms = {stage: {'buckets': list(h['buckets']), 'sum': h['sum'], 'count': h['count']}
+                      for stage, h in _stage_histograms.items()}
+
+    help_texts = {
+        'aethalometer_stage_rows_total': 'Rows processed by each job stage (divide its rate by the stage seconds rate for rows/second)',
+        'aethalometer_upload_bytes_total': 'Bytes of input files received',
+        'aethalometer_cache_lookups_total': 'Cache lookups by cache and result',
+        'aethalometer_exports_total': 'Streaming exports started by format',
+        'aethalometer_jobs_cancelled_total': 'Jobs stopped by a cancellation request',
+        'aethalometer_jobs_queued_total': 'Jobs that had to wait for memory before starting',
+        'aethalometer_storage_evictions_total': 'Files removed by the storage janitor by folder and reason (age, quota or cancelled)',
+        'aethalometer_storage_evicted_bytes_total': 'Bytes freed by the storage janitor by folder and reason'
+    }
+    for name in sorted({name for name, _ in counters}):
+        family(name, 'counter', help_texts.get(name, name))
+        for (counter, labels), value in sorted(counters.items()):
+            if counter == name:
+                lines.append(f'{name}{_labels(labels)} {value}')
+
+    family('aethalometer_stage_seconds', 'histogram', 'Wall time of job stages')
+    for stage, histogram in sorted(histograms.items()):
+        for bound, count in zip(STAGE_LATENCY_BUCKETS, histogram['buckets']):
+            lines.append(f'aethalometer_stage_seconds_bucket{_labels([("stage", stage), ("le", bound)])} {count}')
+        lines.append(f'aethalometer_stage_seconds_bucket{_labels([("stage", stage), ("le", "+Inf")])} {histogram["count"]}')
+        lines.append(f'aethalometer_stage_seconds_sum{_labels([("stage", stage)])} {histogram["sum"]}')
+        lines.append(f'aethalometer_stage_seconds_count{_labels([("stage", stage)])} {histogram["count"]}')
+
+    family('aethalometer_disk_usage_bytes', 'gauge', 'Size of the files in the output folders')
+    for label, path in DISK_USAGE_FOLDERS.items():
+        lines.append(f'aethalometer_disk_usage_bytes{_labels([("folder", label)])} {folder_size(path)}')
+
+    family('process_resident_memory_bytes', 'gauge', 'Resident memory of this process')
+    lines.append(f'process_resident_memory_bytes {current_rss()}')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,55 @@
+import importlib
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+# 'lazy' leaves the plotting and statistics libraries and the ONA kernel compilation to
+# the first job that needs them, for fast startup and low idle memory; 'eager' loads
+# them at startup so no job pays for them
+PRELOAD = os.environ.get('PRELOAD', 'lazy')
+
+# Heavy modules imported by preload(), in the order the stages need them
+PRELOAD_MODULES = ('numpy', 'pandas', 'scipy.stats', 'plotly.graph_objects', 'plotly.subplots')
+
+# Imported once by the forkserver that starts the batch and ONA segment workers, so each
+# worker is forked with them loaded instead of importing pandas itself
+WORKER_PRELOAD_MODULES = ['app.processing.batch', 'app.processing.segmentation']
+
+# Seconds spent on each step of startup and preloading, for /metrics and benchmarks.startup
+startup_times = {}
+
+def configure_worker_preload():
+    """Have the forkserver import the worker modules once; must run before any pool is started"""
+    multiprocessing.set_forkserver_preload(WORKER_PRELOAD_MODULES)
+
+def record_startup_time(step, seconds):
+    startup_times[step] = round(seconds, 4)
+
+def preload():
+    """
+    Import the heavy modules, compile the ONA kernel and start the worker forkserver now.
+
+    Modules already imported cost nothing and are recorded as 0. Returns startup_times.
+    """
+    for name in PRELOAD_MODULES:
+        started = time.perf_counter()
+        loaded = name in sys.modules
+        importlib.import_module(name)
+        record_startup_time(f'import {name}', 0.0 if loaded else time.perf_counter() - started)
+
+    from app.processing.ona_kernels import select_ona_backend
+    started = time.perf_counter()
+    select_ona_backend()
+    record_startup_time('ona kernel', time.perf_counter() - started)
+
+    started = time.perf_counter()
+    from multiprocessing import forkserver
+    forkserver.ensure_running()
+    record_startup_time('worker forkserver', time.perf_counter() - started)
+
+    logger.info("Preloaded in %.2fs", sum(t for step, t in startup_times.items() if step != 'create_app'))
+    return startup_times
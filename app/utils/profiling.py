@@ -0,0 +1,145 @@
+import logging
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from app.utils.memory import MemorySampler, current_rss
+from app.utils.metrics import observe_stage
+from app.utils.status_tracker import processing_stages, processing_captures
+
+logger = logging.getLogger(__name__)
+
+# Profilers a job can request with profile=...
+PROFILERS = ('cprofile', 'pyinstrument')
+
+# Functions listed in a cProfile report
+PROFILE_TOP_FUNCTIONS = int(os.environ.get('PROFILE_TOP_FUNCTIONS', 40))
+
+# Stages open in each job thread, so nested stages are recorded as parent/child
+_open_stages = threading.local()
+
+def _mb(size):
+    return round(size / (1024 * 1024), 1)
+
+def parse_profiler(values):
+    """Validate the optional profile parameter of a request, raising ValueError with a client-facing message"""
+    profiler = values.get('profile') or None
+    if profiler is None:
+        return None
+    if profiler not in PROFILERS:
+        raise ValueError(f"Invalid profile value. Use one of: {', '.join(PROFILERS)}")
+    if profiler == 'pyinstrument':
+        try:
+            import pyinstrument  # noqa: F401
+        except ImportError:
+            raise ValueError('pyinstrument is not installed on this server')
+    return profiler
+
+def _accumulate(job_id, record, seconds, cpu_seconds, rss):
+    """Add one call of a repeated stage to its single record"""
+    records = processing_stages.setdefault(job_id, [])
+    total = next((r for r in reversed(records) if r['stage'] == record['stage']), None)
+    if total is None:
+        total = {'stage': record['stage'], 'calls': 0, 'rows': None, 'seconds': 0.0, 'cpu_seconds': 0.0,
+                 'peak_rss_mb': 0.0}
+        records.append(total)
+    total['calls'] += 1
+    total['seconds'] = round(total['seconds'] + seconds, 6)
+    total['cpu_seconds'] = round(total['cpu_seconds'] + cpu_seconds, 6)
+    total['peak_rss_mb'] = max(total['peak_rss_mb'], _mb(rss))
+    if record['rows'] is not None:
+        total['rows'] = (total['rows'] or 0) + record['rows']
+    _add_rate(total)
+
+def _add_rate(record):
+    if record.get('rows') and record['seconds'] > 0:
+        record['rows_per_second'] = round(record['rows'] / record['seconds'], 1)
+
+@contextmanager
+def track_stage(job_id, stage, rows=None, accumulate=False):
+    """
+    Record a job stage's wall time, CPU time, row count and resident memory.
+
+    Records go to processing_stages[job_id] in the order stages start; a stage opened
+    inside another is named parent/child. The block may set record['rows'] once the
+    count is known. With accumulate, repeated calls (one per input chunk, say) add up
+    into one record, and memory is read when each call ends instead of being sampled.
+    Does nothing without a job_id.
+
+    CPU time is that of the calling thread, so work done in pool processes is not
+    included; RSS is per process, so jobs running at the same time share their peaks.
+    """
+    if not job_id:
+        yield {}
+        return
+
+    stack = getattr(_open_stages, 'names', None)
+    if stack is None:
+        stack = _open_stages.names = []
+    record = {'stage': '/'.join(stack + [stage]), 'rows': rows}
+    if not accumulate:
+        # Listed now so a parent comes before its children
+        processing_stages.setdefault(job_id, []).append(record)
+
+    sampler = None if accumulate else MemorySampler()
+    started = time.perf_counter()
+    cpu_started = time.thread_time()
+    stack.append(stage)
+    try:
+        with sampler or nullcontext():
+            yield record
+    finally:
+        stack.pop()
+        seconds = time.perf_counter() - started
+        cpu_seconds = time.thread_time() - cpu_started
+        observe_stage(record['stage'], seconds, record['rows'])
+        if accumulate:
+            _accumulate(job_id, record, seconds, cpu_seconds, current_rss())
+        else:
+            record.update({
+                'seconds': round(seconds, 6),
+                'cpu_seconds': round(cpu_seconds, 6),
+                'start_rss_mb': _mb(sampler.start_rss),
+                'peak_rss_mb': _mb(sampler.peak_rss),
+                'end_rss_mb': _mb(sampler.end_rss)
+            })
+            _add_rate(record)
+            logger.debug("Stage %s: %.3fs, peak RSS %s MB", record['stage'], seconds, record['peak_rss_mb'])
+
+@contextmanager
+def capture_profile(job_id, profiler=None):
+    """Run the block under cProfile or pyinstrument and store the report with the job"""
+    if not profiler:
+        yield
+        return
+
+    if profiler == 'pyinstrument':
+        from pyinstrument import Profiler
+        session = Profiler()
+        session.start()
+        try:
+            yield
+        finally:
+            session.stop()
+            processing_captures[job_id] = {'profiler': profiler, 'report': session.output_text()}
+        return
+
+    session = cProfile.Profile()
+    session.enable()
+    try:
+        yield
+    finally:
+        session.disable()
+        report = io.StringIO()
+        pstats.Stats(session, stream=report).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+        processing_captures[job_id] = {'profiler': profiler, 'report': report.getvalue()}
+
+def job_profile(job_id):
+    """Stage records and the optional profiler report of a job"""
+    return {
+        'stages': processing_stages.get(job_id, []),
+        'capture': processing_captures.get(job_id)
+    }
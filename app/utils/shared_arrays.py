@@ -0,0 +1,205 @@
+import os
+import threading
+import uuid
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+# Where published arrays live: 'shm' (POSIX shared memory) or 'npy' (memory-mapped files)
+SHARED_ARRAY_BACKEND = os.environ.get('SHARED_ARRAY_BACKEND', 'shm')
+
+# Folder for memory-mapped .npy arrays and raw spill files
+SHARED_FOLDER = 'app/data/shared'
+
+# Open segments/maps in this process, so attached views stay valid until released
+_handles = {}
+_handles_guard = threading.Lock()
+
+# Segments released while views were still alive, closed once those views are gone
+_lingering = []
+
+def _open_handle(descriptor):
+    """Return this process' handle on a published array, opening it on first use"""
+    key = descriptor['name']
+    with _handles_guard:
+        handle = _handles.get(key)
+        if handle is None:
+            if descriptor['backend'] == 'shm':
+                handle = shared_memory.SharedMemory(name=key)
+            elif descriptor['backend'] == 'raw':
+                handle = np.memmap(descriptor['path'], dtype=np.dtype(descriptor['dtype']), mode='r+',
+                                   shape=tuple(descriptor['shape']))
+            else:
+                handle = np.load(descriptor['path'], mmap_mode='r+')
+            _handles[key] = handle
+        return handle
+
+def _new_name():
+    return f"aeth_{uuid.uuid4().hex[:16]}"
+
+def publish_array(values, backend=None):
+    """
+    Copy an array into shared storage and return its descriptor.
+
+    The descriptor is a small dict (name, dtype, shape and location) that can be pickled
+    to another process or stage and passed to attach_array().
+    """
+    values = np.ascontiguousarray(values)
+    if values.dtype == object:
+        raise ValueError("Object arrays cannot be shared")
+    backend = backend or SHARED_ARRAY_BACKEND
+    name = _new_name()
+    descriptor = {'backend': backend, 'name': name, 'dtype': values.dtype.str, 'shape': values.shape}
+
+    if backend == 'shm':
+        handle = shared_memory.SharedMemory(name=name, create=True, size=max(1, values.nbytes))
+        np.ndarray(values.shape, dtype=values.dtype, buffer=handle.buf)[...] = values
+    elif backend == 'npy':
+        os.makedirs(SHARED_FOLDER, exist_ok=True)
+        descriptor['path'] = os.path.join(SHARED_FOLDER, f'{name}.npy')
+        handle = np.lib.format.open_memmap(descriptor['path'], mode='w+', dtype=values.dtype, shape=values.shape)
+        handle[...] = values
+    else:
+        raise ValueError(f"Unknown shared array backend: {backend}")
+
+    with _handles_guard:
+        _handles[name] = handle
+    return descriptor
+
+def allocate_array(shape, dtype, backend=None):
+    """
+    Create an uninitialized shared array to be filled in place.
+
+    Returns (descriptor, writable view). The 'raw' backend is a plain memory-mapped file
+    under SHARED_FOLDER, used for spilling arrays that do not need to fit in memory.
+    """
+    backend = backend or SHARED_ARRAY_BACKEND
+    if backend != 'raw':
+        descriptor = publish_array(np.zeros(shape, dtype=dtype), backend=backend)
+        return descriptor, attach_array(descriptor)
+
+    os.makedirs(SHARED_FOLDER, exist_ok=True)
+    name = _new_name()
+    descriptor = {'backend': 'raw', 'name': name, 'dtype': np.dtype(dtype).str, 'shape': tuple(shape),
+                  'path': os.path.join(SHARED_FOLDER, f'{name}.bin')}
+    handle = np.memmap(descriptor['path'], dtype=np.dtype(dtype), mode='w+', shape=tuple(shape))
+    with _handles_guard:
+        _handles[name] = handle
+    return descriptor, handle
+
+class ArraySpool:
+    """Append-only array spilled to a raw file, attachable as a memory map once finished"""
+    def __init__(self, dtype):
+        os.makedirs(SHARED_FOLDER, exist_ok=True)
+        self.dtype = np.dtype(dtype)
+        self.name = _new_name()
+        self.path = os.path.join(SHARED_FOLDER, f'{self.name}.bin')
+        self.length = 0
+        self._file = open(self.path, 'wb')
+
+    def append(self, values):
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        values.tofile(self._file)
+        self.length += len(values)
+
+    def finish(self):
+        """Close the file and return the descriptor of the spilled array"""
+        self._file.close()
+        return {'backend': 'raw', 'name': self.name, 'dtype': self.dtype.str,
+                'shape': (self.length,), 'path': self.path}
+
+    def discard(self):
+        self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def attach_array(descriptor):
+    """Return a view of a published array; nothing is copied"""
+    handle = _open_handle(descriptor)
+    if descriptor['backend'] == 'shm':
+        return np.ndarray(tuple(descriptor['shape']), dtype=np.dtype(descriptor['dtype']), buffer=handle.buf)
+    return handle
+
+def _close_lingering():
+    """Close released segments whose views have since been dropped"""
+    for handle in list(_lingering):
+        try:
+            handle.close()
+        except BufferError:
+            continue
+        _lingering.remove(handle)
+
+def detach_array(descriptor):
+    """Drop this process' handle on an array without deleting it (used by workers)"""
+    with _handles_guard:
+        handle = _handles.pop(descriptor['name'], None)
+        if descriptor['backend'] == 'shm' and handle is not None:
+            _lingering.append(handle)
+        _close_lingering()
+
+def release_array(descriptor):
+    """Delete a published array; views that are still alive keep their memory until dropped"""
+    detach_array(descriptor)
+    if descriptor['backend'] == 'shm':
+        try:
+            segment = shared_memory.SharedMemory(name=descriptor['name'])
+        except FileNotFoundError:
+            return
+        segment.close()
+        segment.unlink()
+    elif os.path.exists(descriptor['path']):
+        os.remove(descriptor['path'])
+
+def publish_frame(df, columns=None, backend=None):
+    """
+    Publish the numeric, boolean and timestamp columns of a frame.
+
+    Returns a frame descriptor that apply_ona_algorithm, synchronize_data and
+    create_visualizations accept in place of a DataFrame.
+    """
+    columns = list(columns) if columns is not None else list(df.columns)
+    descriptor = {'kind': 'frame', 'length': len(df), 'columns': []}
+    try:
+        for col in columns:
+            series = df[col]
+            tz = None
+            if isinstance(series.dtype, pd.DatetimeTZDtype):
+                tz = str(series.dt.tz)
+                series = series.dt.tz_convert('UTC').dt.tz_localize(None)
+            column = publish_array(series.to_numpy(), backend=backend)
+            column['column'] = col
+            column['tz'] = tz
+            descriptor['columns'].append(column)
+    except Exception:
+        release_frame(descriptor)
+        raise
+    return descriptor
+
+def attach_frame(descriptor):
+    """
+    Build a DataFrame over the buffers of a published frame.
+
+    Numeric columns are views of the shared buffers; a timezone-aware timestamp column
+    is attached as UTC, which costs one int64 copy of that column.
+    """
+    data = {}
+    for column in descriptor['columns']:
+        values = pd.Series(attach_array(column), copy=False)
+        if column['tz']:
+            values = values.dt.tz_localize('UTC').dt.tz_convert(column['tz'])
+        data[column['column']] = values
+    return pd.DataFrame(data, copy=False)
+
+def release_frame(descriptor):
+    """Delete every array of a published frame"""
+    for column in descriptor['columns']:
+        release_array(column)
+
+def is_frame_descriptor(value):
+    return isinstance(value, dict) and value.get('kind') == 'frame'
+
+def as_frame(value):
+    """Accept either a DataFrame or a frame descriptor and return a DataFrame"""
+    if is_frame_descriptor(value):
+        return attach_frame(value)
+    return value
@@ -2,3 +2,12 @@
 processing_status = {}
 processing_progress = {}
 processing_messages = {}
+
+# Per-stage timing, CPU and memory records of each job
+processing_stages = {}
+
+# cProfile/pyinstrument reports of jobs that requested one
+processing_captures = {}
+
+# Memory estimate and queue state of each job (see admission.py)
+processing_admissions = {}
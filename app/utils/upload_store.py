@@ -0,0 +1,201 @@
+import io
+import os
+import threading
+import time
+import uuid
+from werkzeug.utils import secure_filename
+from app.utils.cancellation import check_cancelled
+
+# Active chunked uploads, keyed by upload ID
+upload_sessions = {}
+
+# Seconds a streaming reader waits for the next part before giving up on the upload
+UPLOAD_STALL_TIMEOUT = int(os.environ.get('UPLOAD_STALL_TIMEOUT', 3600))
+
+# Seconds an upload may go without receiving a part before the janitor aborts it and
+# removes its file; completed weather uploads that no job claimed expire the same way
+UPLOAD_SESSION_TTL = float(os.environ.get('UPLOAD_SESSION_TTL', 6 * 3600))
+
+# Block size used when copying a part from the request stream to disk
+WRITE_BLOCK_SIZE = 1024 * 1024
+
+def create_upload(filename, total_size, upload_folder, kind='aethalometer'):
+    """Register a new chunked upload and preallocate its final file"""
+    upload_id = uuid.uuid4().hex
+    os.makedirs(upload_folder, exist_ok=True)
+    path = os.path.join(upload_folder, f"{upload_id}_{secure_filename(filename)}")
+
+    # Parts are written in place at their offsets, so the file is created at full size up front
+    with open(path, 'wb') as f:
+        f.truncate(total_size)
+
+    session = {
+        'upload_id': upload_id,
+        'filename': filename,
+        'kind': kind,
+        'path': path,
+        'total_size': total_size,
+        'received': [],
+        'complete': False,
+        'aborted': False,
+        'job_id': None,
+        'created': time.time(),
+        'updated': time.time(),
+        'condition': threading.Condition()
+    }
+    upload_sessions[upload_id] = session
+    return session
+
+def _add_range(ranges, start, end):
+    """Merge [start, end) into a sorted list of disjoint received ranges"""
+    merged = []
+    for r_start, r_end in ranges:
+        if r_end < start or r_start > end:
+            merged.append([r_start, r_end])
+        else:
+            start, end = min(start, r_start), max(end, r_end)
+    merged.append([start, end])
+    merged.sort()
+    return merged
+
+def contiguous_bytes(session):
+    """Number of bytes received without gaps from the start of the file"""
+    ranges = session['received']
+    if ranges and ranges[0][0] == 0:
+        return ranges[0][1]
+    return 0
+
+def received_bytes(session):
+    """Total number of distinct bytes received so far"""
+    return sum(end - start for start, end in session['received'])
+
+def write_part(session, offset, stream):
+    """Copy a part from a request stream into the upload file at the given offset"""
+    if session['complete'] or session['aborted']:
+        raise ValueError("Upload is no longer accepting parts")
+    if offset < 0 or offset > session['total_size']:
+        raise ValueError("Part offset is outside the declared file size")
+
+    position = offset
+    with open(session['path'], 'r+b') as f:
+        f.seek(offset)
+        while True:
+            block = stream.read(WRITE_BLOCK_SIZE)
+            if not block:
+                break
+            if position + len(block) > session['total_size']:
+                raise ValueError("Part extends past the declared file size")
+            f.write(block)
+            f.flush()
+
+            # Publish each block as soon as it is on disk so a streaming reader can consume it
+            with session['condition']:
+                session['received'] = _add_range(session['received'], position, position + len(block))
+                session['updated'] = time.time()
+                session['condition'].notify_all()
+            position += len(block)
+
+    return position - offset
+
+def complete_upload(session):
+    """Mark an upload as finished once every byte has been received"""
+    with session['condition']:
+        if contiguous_bytes(session) != session['total_size']:
+            raise ValueError(
+                f"Upload incomplete: {received_bytes(session)} of {session['total_size']} bytes received"
+            )
+        session['complete'] = True
+        session['condition'].notify_all()
+
+def abort_upload(session):
+    """Abort an upload, waking any reader that is waiting for more data"""
+    with session['condition']:
+        session['aborted'] = True
+        session['condition'].notify_all()
+
+def discard_upload(upload_id):
+    """Forget an upload session once its file has been handed to a job"""
+    upload_sessions.pop(upload_id, None)
+
+def release_upload(session):
+    """Abort and forget the upload of a streaming job that has finished, completed or not"""
+    abort_upload(session)
+    discard_upload(session['upload_id'])
+
+def expire_uploads(now=None):
+    """
+    Abort and forget sessions that have not received a part for UPLOAD_SESSION_TTL
+    seconds. Returns the files of those no job owns, for the caller to remove; a
+    streaming job fails on the aborted read and removes its input itself.
+    """
+    now = now or time.time()
+    orphaned = []
+    for session in list(upload_sessions.values()):
+        if now - session['updated'] <= UPLOAD_SESSION_TTL:
+            continue
+        release_upload(session)
+        if session['job_id'] is None:
+            orphaned.append(session['path'])
+    return orphaned
+
+def upload_summary(session):
+    """JSON-friendly view of an upload's state, used by clients to resume"""
+    return {
+        'upload_id': session['upload_id'],
+        'filename': session['filename'],
+        'total_size': session['total_size'],
+        'received': [list(r) for r in session['received']],
+        'received_bytes': received_bytes(session),
+        'next_offset': contiguous_bytes(session),
+        'complete': session['complete'],
+        'job_id': session['job_id']
+    }
+
+class GrowingFileReader(io.RawIOBase):
+    """
+    Read-only stream over an upload that is still being received.
+
+    Reads return data as soon as it is contiguous from the start of the file and
+    block while later parts are still in flight, so ingestion can parse the parts
+    that have already arrived.
+    """
+    def __init__(self, session):
+        super().__init__()
+        self.session = session
+        self.total_size = session['total_size']
+        self._file = open(session['path'], 'rb')
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._position >= self.total_size:
+            return 0
+
+        session = self.session
+        with session['condition']:
+            while contiguous_bytes(session) <= self._position:
+                if session['aborted']:
+                    # A job cancelled while its upload streams in stops here rather than failing
+                    check_cancelled(session['job_id'])
+                    raise IOError("Upload was aborted")
+                if not session['condition'].wait(timeout=UPLOAD_STALL_TIMEOUT):
+                    raise TimeoutError("Timed out waiting for the next upload part")
+            available = contiguous_bytes(session) - self._position
+
+        size = min(len(buffer), available)
+        self._file.seek(self._position)
+        data = self._file.read(size)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+def open_upload_stream(session):
+    """Open a reader over a (possibly still growing) upload"""
+    return GrowingFileReader(session)
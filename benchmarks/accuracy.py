@@ -0,0 +1,120 @@
+import argparse
+import json
+import sys
+import time
+from types import SimpleNamespace
+import numpy as np
+from app.processing import compact
+from app.processing.aethalometer import process_aethalometer_data_in_chunks, apply_ona_algorithm, find_measurement_columns
+from app.processing.export import encode_chunks
+from app.utils.log import configure_logging
+from benchmarks.run import input_files, parse_size
+
+DEFAULT_ROWS = '200k'
+
+# Largest relative difference of processed BC between the compact and float64 paths,
+# over rows in the same window in both; float32 itself resolves about 6e-8
+DEFAULT_TOLERANCE = 1e-6
+
+# Share of rows allowed in a different window; ATN is kept in float64 so windows
+# should match exactly
+DEFAULT_MAX_WINDOW_MISMATCH = 0.0
+
+def run_path(path, args, compact_dtypes):
+    """Ingest and ONA in one representation; returns the output and its sizes"""
+    compact.COMPACT_DTYPES = compact_dtypes
+    started = time.perf_counter()
+    df = process_aethalometer_data_in_chunks(path)
+    parsed_bytes = int(df.memory_usage(deep=True).sum())
+    processed = apply_ona_algorithm(df, args.wavelength, args.atn_min)
+    seconds = time.perf_counter() - started
+    del df
+    output_bytes = sum(len(part) for part in encode_chunks([processed], list(processed.columns), 'netcdf'))
+    return processed, {
+        'seconds': round(seconds, 3),
+        'parsed_mb': round(parsed_bytes / 1e6, 1),
+        'processed_mb': round(processed.memory_usage(deep=True).sum() / 1e6, 1),
+        'netcdf_mb': round(output_bytes / 1e6, 1)
+    }
+
+def window_ids(processed):
+    """Window index of every row, -1 outside a closed window"""
+    starts = processed['windowStart'].to_numpy()
+    ends = processed['windowEnd'].to_numpy()
+    opened = np.cumsum(starts)
+    closed = np.cumsum(ends) - ends
+    return np.where(opened > closed, opened - 1, -1)
+
+def compare(reference, candidate, atn_col):
+    """Differences of the compact output from the float64 one"""
+    if not reference['timestamp'].equals(candidate['timestamp']):
+        raise ValueError("Outputs differ in rows or timestamps")
+    same_window = window_ids(reference) == window_ids(candidate)
+    expected = reference['processedBC'].to_numpy()
+    actual = candidate['processedBC'].to_numpy(dtype=np.float64)
+    scale = np.maximum(np.abs(expected), 1.0)
+    relative = np.abs(actual - expected)[same_window] / scale[same_window]
+    return {
+        'rows': len(reference),
+        'window_mismatch_rows': int((~same_window).sum()),
+        'window_mismatch_share': float((~same_window).mean()),
+        'max_relative_error': float(relative.max()) if len(relative) else 0.0,
+        'mean_relative_error': float(relative.mean()) if len(relative) else 0.0,
+        'max_raw_bc_error': float(np.abs(candidate['rawBC'].to_numpy(dtype=np.float64)
+                                         - reference['rawBC'].to_numpy()).max()),
+        'max_atn_error': float(np.abs(candidate[atn_col].to_numpy(dtype=np.float64)
+                                      - reference[atn_col].to_numpy()).max())
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the compact float32 representation with the float64 path')
+    parser.add_argument('--rows', default=DEFAULT_ROWS, help=f'Rows of the generated input (default {DEFAULT_ROWS})')
+    parser.add_argument('--wavelength', default='Blue')
+    parser.add_argument('--atn-min', type=float, default=0.01)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f'Largest relative processed BC difference allowed (default {DEFAULT_TOLERANCE})')
+    parser.add_argument('--max-window-mismatch', type=float, default=DEFAULT_MAX_WINDOW_MISMATCH,
+                        help=f'Largest share of rows allowed in a different window (default {DEFAULT_MAX_WINDOW_MISMATCH})')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args(argv)
+
+    configure_logging('CRITICAL')
+    generate = SimpleNamespace(wavelengths=['UV', 'Blue', 'Green', 'Red', 'IR'], seed=args.seed, gzip=False,
+                               regenerate=False, tape_advance_rows=1440, gap_rate=0.001, noise=0.15)
+    meta = input_files(parse_size(args.rows), generate)
+    path = meta['aethalometer']['path']
+
+    reference, reference_sizes = run_path(path, args, False)
+    candidate, compact_sizes = run_path(path, args, True)
+    atn_col, _ = find_measurement_columns(reference.columns, args.wavelength)
+    report = {
+        'input': path,
+        'float64': reference_sizes,
+        'compact': compact_sizes,
+        'accuracy': compare(reference, candidate, atn_col)
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['accuracy']['rows']} rows of {path}")
+        print(f"  {'':<10} {'seconds':>8} {'parsed MB':>10} {'output MB':>10} {'netCDF MB':>10}")
+        for name in ('float64', 'compact'):
+            sizes = report[name]
+            print(f"  {name:<10} {sizes['seconds']:>8.3f} {sizes['parsed_mb']:>10.1f} {sizes['processed_mb']:>10.1f} "
+                  f"{sizes['netcdf_mb']:>10.1f}")
+        accuracy = report['accuracy']
+        print(f"  rows in a different window: {accuracy['window_mismatch_rows']} ({accuracy['window_mismatch_share']:.2e})")
+        print(f"  processed BC relative error: max {accuracy['max_relative_error']:.2e}, "
+              f"mean {accuracy['mean_relative_error']:.2e}")
+        print(f"  largest raw BC / ATN difference: {accuracy['max_raw_bc_error']:.3g} / {accuracy['max_atn_error']:.3g}")
+
+    accuracy = report['accuracy']
+    if accuracy['max_relative_error'] > args.tolerance or accuracy['window_mismatch_share'] > args.max_window_mismatch:
+        print("Compact representation is outside the accuracy limits", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
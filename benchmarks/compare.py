@@ -0,0 +1,64 @@
+import argparse
+import json
+import sys
+
+# Relative slowdown (or memory growth) reported as a regression
+DEFAULT_THRESHOLD = 0.2
+
+# Stages shorter than this in both runs are too noisy to compare
+MIN_SECONDS = 0.05
+
+# Memory growth changes smaller than this are noise
+MIN_MEMORY_MB = 10
+
+def load_runs(path):
+    """Stage records of a saved benchmark, keyed by (rows, stage)"""
+    with open(path) as f:
+        report = json.load(f)
+    return {(run['rows'], record['stage']): record for run in report['runs'] for record in run['stages']}
+
+def memory_growth(record):
+    """Resident memory a stage added on top of what the process held when it started"""
+    if 'start_rss_mb' not in record:
+        # Accumulated sub-stages only keep their peak
+        return None
+    return record['peak_rss_mb'] - record['start_rss_mb']
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """Rows of (rows, stage, baseline seconds, current seconds, ratio, memory growth change, regressed)"""
+    rows = []
+    for key in sorted(set(baseline) & set(current)):
+        before, after = baseline[key], current[key]
+        if 'error' in before or 'error' in after:
+            continue
+        ratio = after['seconds'] / before['seconds'] if before['seconds'] > 0 else None
+        slower = (ratio is not None and ratio > 1 + threshold
+                  and max(before['seconds'], after['seconds']) >= MIN_SECONDS)
+        growth_before, growth_after = memory_growth(before), memory_growth(after)
+        growth_change = None if growth_before is None else growth_after - growth_before
+        bigger = (growth_change is not None and growth_change >= MIN_MEMORY_MB
+                  and growth_change > threshold * max(growth_before, MIN_MEMORY_MB))
+        rows.append((key[0], key[1], before['seconds'], after['seconds'], ratio, growth_change, slower or bigger))
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two saved benchmark runs stage by stage')
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'Relative slowdown or peak memory growth reported as a regression (default {DEFAULT_THRESHOLD})')
+    args = parser.parse_args(argv)
+
+    rows = compare(load_runs(args.baseline), load_runs(args.current), args.threshold)
+    print(f"{'rows':>10} {'stage':<60} {'before s':>10} {'after s':>10} {'ratio':>7} {'+mem MB':>9}")
+    for size, stage, before, after, ratio, growth_change, regressed in rows:
+        print(f"{size:>10} {stage:<60} {before:>10.3f} {after:>10.3f} "
+              f"{ratio if ratio is not None else float('nan'):>7.2f} "
+              f"{growth_change if growth_change is not None else float('nan'):>+9.1f}{'  REGRESSION' if regressed else ''}")
+
+    regressions = sum(1 for row in rows if row[-1])
+    print(f"\n{regressions} regression(s) over {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
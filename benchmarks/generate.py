@@ -0,0 +1,177 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Column layout of an MA350 export, as in test_data/Jacros simplified.csv
+MA350_HEADER = (
+    ['Serial number', 'Time (UTC)', 'Datum ID', 'Session ID', 'Data format version', 'Firmware version',
+     'App version', 'Timezone offset (mins)', 'Date local (yyyy/MM/dd)', 'Time local (hh:mm:ss)',
+     'GPS lat (ddmm.mmmmm)', 'GPS long (dddmm.mmmmm)', 'GPS speed (km/h)', 'GPS sat count', 'Timebase (s)',
+     'Status', 'Battery remaining (%)', 'Accel X', 'Accel Y', 'Accel Z', 'Tape position',
+     'Flow setpoint (mL/min)', 'Flow total (mL/min)', 'Flow1 (mL/min)', 'Flow2 (mL/min)', 'Sample temp (C)',
+     'Sample RH (%)', 'Sample dewpoint (C)', 'Internal pressure (Pa)', 'Internal temp (C)', 'Optical config']
+)
+MA350_WAVELENGTHS = ['UV', 'Blue', 'Green', 'Red', 'IR']
+OPTICAL_CONFIG = 'DUALSPOT-UV-BLUE-GREEN-RED-IR'
+
+# Relative BC reported at each wavelength (UV sees brown carbon on top of BC)
+WAVELENGTH_BC_FACTOR = {'UV': 1.08, 'Blue': 1.0, 'Green': 0.98, 'Red': 0.96, 'IR': 0.95}
+
+# Relative attenuation per unit of loading; shorter wavelengths attenuate more
+WAVELENGTH_ATN_FACTOR = {'UV': 1.3, 'Blue': 1.0, 'Green': 0.86, 'Red': 0.69, 'IR': 0.51}
+
+# Rows generated and written at a time
+GENERATE_CHUNK_ROWS = 200000
+
+DEFAULT_START = '2022-04-12T09:46:01Z'
+
+def _ma350_columns(wavelengths):
+    columns = list(MA350_HEADER)
+    for wl in wavelengths:
+        columns += [f'{wl} Sen1', f'{wl} Sen2', f'{wl} Ref', f'{wl} ATN1', f'{wl} ATN2', f'{wl} K']
+    for wl in wavelengths:
+        columns += [f'{wl} BC1', f'{wl} BC2', f'{wl} BCc']
+    return columns + ['Readable status']
+
+def _timestamps(rng, start_ns, rows, timebase, gap_rate, max_gap_minutes):
+    """Sample times every timebase seconds, with an instrument gap after a gap_rate share of rows"""
+    steps = np.full(rows, timebase * 10**9, dtype=np.int64)
+    gaps = rng.random(rows) < gap_rate
+    steps[gaps] += rng.integers(1, max_gap_minutes + 1, gaps.sum()) * 60 * 10**9
+    steps[0] = 0
+    return start_ns + np.cumsum(steps)
+
+def _spot_attenuation(increments, spots, carry, carry_spot):
+    """Cumulative attenuation that restarts at zero on every new tape spot"""
+    totals = np.cumsum(increments)
+    starts = np.flatnonzero(np.r_[True, spots[1:] != spots[:-1]])
+    offsets = np.where(starts > 0, totals[np.maximum(starts - 1, 0)], 0.0)
+    group = np.cumsum(np.r_[True, spots[1:] != spots[:-1]]) - 1
+    atn = totals - offsets[group]
+    if spots[0] == carry_spot:
+        # The first spot continues from the previous chunk
+        atn[group == 0] += carry
+    return atn
+
+def generate_aethalometer_csv(path, rows, wavelengths=None, timebase=60, tape_advance_rows=1440,
+                              gap_rate=0.001, max_gap_minutes=120, noise=0.15, bc_level=2000.0,
+                              start=DEFAULT_START, seed=0):
+    """
+    Write a synthetic MA350-style aethalometer export and describe what was written.
+
+    BC follows a diurnal cycle with log-normal variation, plus Gaussian instrument noise
+    of noise times the level (so some readings are negative, as in real exports). ATN
+    grows with the BC loaded on the spot and drops back to zero at each tape advance,
+    every tape_advance_rows rows. A gap_rate share of rows is followed by a gap of up to
+    max_gap_minutes. The path may end in .gz to write a compressed file.
+    """
+    wavelengths = wavelengths or MA350_WAVELENGTHS
+    unknown = [wl for wl in wavelengths if wl not in MA350_WAVELENGTHS]
+    if unknown:
+        raise ValueError(f"Unknown wavelengths: {', '.join(unknown)}")
+
+    rng = np.random.default_rng(seed)
+    columns = _ma350_columns(wavelengths)
+    start_ns = pd.Timestamp(start).value
+    carry = {wl: (0.0, 0.0) for wl in wavelengths}
+    last_spot = -1
+    first_time = last_time = None
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    for offset in range(0, rows, GENERATE_CHUNK_ROWS):
+        n = min(GENERATE_CHUNK_ROWS, rows - offset)
+        times = _timestamps(rng, start_ns, n, timebase, gap_rate, max_gap_minutes)
+        start_ns = times[-1] + timebase * 10**9
+        stamps = pd.DatetimeIndex(times.view('datetime64[ns]')).tz_localize('UTC')
+        first_time = first_time if first_time is not None else stamps[0]
+        last_time = stamps[-1]
+
+        hours = np.asarray(stamps.hour + stamps.minute / 60)
+        diurnal = 1 + 0.5 * np.sin((hours - 8) / 24 * 2 * np.pi)
+        level = bc_level * diurnal * rng.lognormal(0, 0.3, n)
+        spots = (offset + np.arange(n)) // tape_advance_rows
+
+        frame = {
+            'Serial number': 'MA350-0238',
+            'Time (UTC)': stamps.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'Datum ID': offset + np.arange(n) + 1,
+            'Session ID': 12,
+            'Data format version': 1,
+            'Firmware version': 1.1,
+            'App version': 1.4,
+            'Timezone offset (mins)': 0,
+            'Date local (yyyy/MM/dd)': stamps.strftime('%Y-%m-%d'),
+            'Time local (hh:mm:ss)': stamps.strftime('%-I:%M:%S %p'),
+            'GPS lat (ddmm.mmmmm)': 0,
+            'GPS long (dddmm.mmmmm)': 0,
+            'GPS speed (km/h)': 0,
+            'GPS sat count': 0,
+            'Timebase (s)': timebase,
+            'Status': 64,
+            'Battery remaining (%)': 100,
+            'Accel X': rng.integers(-25800, -25700, n),
+            'Accel Y': rng.integers(-80, 0, n),
+            'Accel Z': rng.integers(-1850, -1800, n),
+            'Tape position': spots % 85 + 1,
+            'Flow setpoint (mL/min)': 100,
+            'Flow total (mL/min)': np.round(100 + rng.normal(0, 0.3, n), 2),
+            'Flow1 (mL/min)': np.round(55.3 + rng.normal(0, 0.2, n), 2),
+            'Flow2 (mL/min)': np.round(44.6 + rng.normal(0, 0.2, n), 2),
+            'Sample temp (C)': np.round(20 + 8 * diurnal + rng.normal(0, 0.3, n), 2),
+            'Sample RH (%)': np.round(np.clip(60 - 20 * diurnal + rng.normal(0, 2, n), 5, 100), 1),
+            'Sample dewpoint (C)': np.round(12 + rng.normal(0, 1, n), 2),
+            'Internal pressure (Pa)': rng.integers(76400, 76700, n),
+            'Internal temp (C)': np.round(30 + 5 * diurnal + rng.normal(0, 0.2, n), 2),
+            'Optical config': OPTICAL_CONFIG
+        }
+        for wl in wavelengths:
+            bc = level * WAVELENGTH_BC_FACTOR[wl]
+            # Attenuation gained per sample is proportional to the BC loaded
+            loading = bc * timebase / 60 * 2.5e-6 * WAVELENGTH_ATN_FACTOR[wl]
+            atn1 = _spot_attenuation(np.abs(loading * rng.normal(1, 0.05, n)), spots, carry[wl][0], last_spot)
+            atn2 = _spot_attenuation(np.abs(0.76 * loading * rng.normal(1, 0.05, n)), spots, carry[wl][1], last_spot)
+            carry[wl] = (atn1[-1], atn2[-1])
+            reference = rng.integers(835000, 945000, n)
+            frame[f'{wl} Sen1'] = (reference * np.exp(-atn1 / 100)).astype(np.int64)
+            frame[f'{wl} Sen2'] = (reference * np.exp(-atn2 / 100)).astype(np.int64)
+            frame[f'{wl} Ref'] = reference
+            frame[f'{wl} ATN1'] = np.round(atn1, 6)
+            frame[f'{wl} ATN2'] = np.round(atn2, 6)
+            frame[f'{wl} K'] = 0
+            bc1 = bc + rng.normal(0, noise * bc_level, n)
+            bc2 = 0.94 * bc + rng.normal(0, noise * bc_level, n)
+            frame[f'{wl} BC1'] = np.round(bc1)
+            frame[f'{wl} BC2'] = np.round(bc2)
+            frame[f'{wl} BCc'] = np.round(bc1)
+        frame['Readable status'] = 'NA'
+        last_spot = spots[-1]
+
+        pd.DataFrame(frame, columns=columns).to_csv(path, mode='w' if offset == 0 else 'a',
+                                                    header=(offset == 0), index=False)
+
+    return {
+        'path': path,
+        'rows': rows,
+        'wavelengths': list(wavelengths),
+        'start': first_time.isoformat() if first_time is not None else None,
+        'end': last_time.isoformat() if last_time is not None else None,
+        'bytes': os.path.getsize(path)
+    }
+
+def generate_weather_csv(path, start, end, freq='15min', seed=0):
+    """Write a weather file covering start to end with diurnal temperature, humidity, wind and pressure"""
+    rng = np.random.default_rng(seed)
+    stamps = pd.date_range(pd.Timestamp(start).floor(freq), pd.Timestamp(end).ceil(freq), freq=freq)
+    n = len(stamps)
+    hours = stamps.hour + stamps.minute / 60
+    diurnal = np.sin((hours - 9) / 24 * 2 * np.pi)
+    frame = pd.DataFrame({
+        'timestamp': stamps.tz_localize(None).strftime('%Y-%m-%d %H:%M:%S'),
+        'temperature_c': np.round(12 + 6 * diurnal + rng.normal(0, 0.5, n), 2),
+        'relative_humidity_percent': np.round(np.clip(65 - 15 * diurnal + rng.normal(0, 3, n), 5, 100), 1),
+        'wind_speed_kmh': np.round(np.abs(8 + 4 * diurnal + rng.normal(0, 2, n)), 1),
+        'pressure_hpa': np.round(1013 + np.cumsum(rng.normal(0, 0.05, n)), 1)
+    })
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    frame.to_csv(path, index=False)
+    return {'path': path, 'rows': n, 'bytes': os.path.getsize(path)}
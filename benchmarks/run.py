@@ -0,0 +1,202 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from app.processing.aethalometer import process_aethalometer_data_in_chunks, apply_ona_algorithm
+from app.processing.weather import process_weather_data, synchronize_data
+from app.processing.visualization import downsample_data, create_visualizations
+from app.utils.json_encoder import ensure_json_serializable, clean_dict_for_json
+from app.utils.log import configure_logging
+from app.utils.profiling import track_stage, job_profile
+from app.utils.status_tracker import processing_status, processing_progress, processing_messages, processing_stages
+from benchmarks.generate import generate_aethalometer_csv, generate_weather_csv
+
+# Input sizes benchmarked by default
+DEFAULT_SIZES = '10k,1M,30M'
+
+# Generated inputs are kept here and reused by later runs with the same parameters
+DATA_FOLDER = 'benchmarks/data'
+RESULTS_FOLDER = 'benchmarks/results'
+
+# Size run first and discarded, so numba compilation and first-call imports are not
+# charged to the smallest benchmarked size
+WARMUP_ROWS = 2000
+
+# Rows of processed output serialized, as in the job results returned by /api/status
+RESULT_SAMPLE_ROWS = 1000
+
+STATIC_FOLDER = 'app/static'
+
+def parse_size(text):
+    """Row count from a size such as 10k, 1M or 30000"""
+    text = text.strip().lower()
+    factor = {'k': 10**3, 'm': 10**6}.get(text[-1:], 1)
+    number = text[:-1] if factor > 1 else text
+    return int(float(number) * factor)
+
+def input_files(rows, args):
+    """Generate (or reuse) the aethalometer and weather files for a run"""
+    name = f"ma350_{rows}_{'-'.join(args.wavelengths)}_{args.seed}"
+    aethalometer_path = os.path.join(DATA_FOLDER, f'{name}.csv{".gz" if args.gzip else ""}')
+    weather_path = os.path.join(DATA_FOLDER, f'{name}_weather.csv')
+    meta_path = os.path.join(DATA_FOLDER, f'{name}.json')
+
+    if not args.regenerate and os.path.exists(meta_path) and os.path.exists(aethalometer_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        meta['generate_seconds'] = 0.0
+        return meta
+
+    started = time.perf_counter()
+    aethalometer = generate_aethalometer_csv(aethalometer_path, rows, wavelengths=args.wavelengths,
+                                             tape_advance_rows=args.tape_advance_rows, gap_rate=args.gap_rate,
+                                             noise=args.noise, seed=args.seed)
+    weather = generate_weather_csv(weather_path, aethalometer['start'], aethalometer['end'], seed=args.seed)
+    meta = {'aethalometer': aethalometer, 'weather': weather}
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    meta['generate_seconds'] = round(time.perf_counter() - started, 3)
+    return meta
+
+def run_stage(job_id, stage, call, rows=None):
+    """
+    Run one public stage under track_stage; failures are recorded and give None.
+
+    rows defaults to the length of a returned frame, so pass the input length for
+    stages that reduce their input.
+    """
+    gc.collect()
+    record = {}
+    try:
+        with track_stage(job_id, stage, rows=rows) as record:
+            result = call()
+            if rows is None and isinstance(result, pd.DataFrame):
+                record['rows'] = len(result)
+        return result
+    except Exception as e:
+        record['error'] = f'{type(e).__name__}: {e}'
+        print(f"  {stage} failed: {record['error']}", file=sys.stderr)
+        return None
+
+def benchmark_size(rows, args):
+    """Run every stage on one generated input and return the stage records"""
+    meta = input_files(rows, args)
+    job_id = f'benchmark_{rows}'
+    timestamp = f'benchmark_{rows}'
+    print(f"{rows} rows: {meta['aethalometer']['bytes']} bytes of input", file=sys.stderr)
+
+    df = run_stage(job_id, 'process_aethalometer_data_in_chunks',
+                   lambda: process_aethalometer_data_in_chunks(meta['aethalometer']['path'], job_id=job_id))
+    processed = None
+    if df is not None:
+        processed = run_stage(job_id, 'apply_ona_algorithm',
+                              lambda: apply_ona_algorithm(df, args.wavelength, args.atn_min, job_id=job_id))
+    del df
+
+    combined = None
+    weather_df = run_stage(job_id, 'process_weather_data', lambda: process_weather_data(meta['weather']['path']))
+    if processed is not None:
+        if weather_df is not None:
+            combined = run_stage(job_id, 'synchronize_data', lambda: synchronize_data(processed.copy(), weather_df),
+                                 rows=len(processed))
+        run_stage(job_id, 'downsample_data', lambda: downsample_data(processed), rows=len(processed))
+        visualizations = run_stage(job_id, 'create_visualizations', lambda: create_visualizations(
+            processed, combined, args.wavelength, timestamp, job_id=job_id), rows=len(processed))
+        sample = processed[['timestamp', 'rawBC', 'processedBC']].head(RESULT_SAMPLE_ROWS)
+        result_data = {
+            'processed_data': clean_dict_for_json(sample.replace({np.nan: None}).to_dict(orient='records')),
+            'combined_data': [] if combined is None else clean_dict_for_json(
+                combined.head(RESULT_SAMPLE_ROWS).replace({np.nan: None}).to_dict(orient='records')),
+            'visualizations': visualizations or {}
+        }
+        run_stage(job_id, 'ensure_json_serializable', lambda: ensure_json_serializable(result_data), rows=len(sample))
+
+    # Plots are written to the static folder like a job's; they are not needed afterwards
+    for name in os.listdir(STATIC_FOLDER):
+        if timestamp in name:
+            os.remove(os.path.join(STATIC_FOLDER, name))
+
+    stages = job_profile(job_id)['stages']
+    for state in (processing_status, processing_progress, processing_messages, processing_stages):
+        state.pop(job_id, None)
+    return {
+        'rows': rows,
+        'input_bytes': meta['aethalometer']['bytes'],
+        'weather_rows': meta['weather']['rows'],
+        'generate_seconds': meta['generate_seconds'],
+        'stages': stages
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment():
+    return {
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+def print_summary(run):
+    print(f"\n{run['rows']} rows")
+    print(f"  {'stage':<60} {'seconds':>10} {'cpu':>10} {'peak MB':>9} {'rows/s':>12}")
+    for record in run['stages']:
+        print(f"  {record['stage']:<60} {record.get('seconds', 0):>10.3f} {record.get('cpu_seconds', 0):>10.3f} "
+              f"{record.get('peak_rss_mb', 0):>9.1f} {record.get('rows_per_second', ''):>12}"
+              f"{'  ' + record['error'] if 'error' in record else ''}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time and memory-profile the processing stages on synthetic MA350 data')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f'Comma-separated row counts (default {DEFAULT_SIZES})')
+    parser.add_argument('--output', help=f'Result file (default {RESULTS_FOLDER}/<date>_<time>.json)')
+    parser.add_argument('--wavelength', default='Blue')
+    parser.add_argument('--atn-min', type=float, default=0.01)
+    parser.add_argument('--wavelengths', default='UV,Blue,Green,Red,IR', help='Wavelengths written to the input files')
+    parser.add_argument('--tape-advance-rows', type=int, default=1440, help='Rows between tape advances')
+    parser.add_argument('--gap-rate', type=float, default=0.001, help='Share of rows followed by a gap')
+    parser.add_argument('--noise', type=float, default=0.15, help='BC noise relative to the mean level')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--gzip', action='store_true', help='Generate gzip-compressed aethalometer files')
+    parser.add_argument('--regenerate', action='store_true', help='Generate the inputs even if they exist')
+    args = parser.parse_args(argv)
+    args.wavelengths = args.wavelengths.split(',')
+    if args.wavelength not in args.wavelengths:
+        parser.error('--wavelength must be one of --wavelengths')
+
+    # Stage failures are reported by run_stage, without the pipeline's own tracebacks
+    configure_logging('CRITICAL')
+    os.makedirs(STATIC_FOLDER, exist_ok=True)
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': environment(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'regenerate')},
+        'runs': []
+    }
+    output = args.output or os.path.join(RESULTS_FOLDER, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+
+    benchmark_size(WARMUP_ROWS, args)
+    for size in args.sizes.split(','):
+        run = benchmark_size(parse_size(size), args)
+        report['runs'].append(run)
+        print_summary(run)
+        # Written after every size, so a run that runs out of memory keeps the smaller ones
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(f"\nSaved {output}")
+
+if __name__ == '__main__':
+    main()
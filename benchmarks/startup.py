@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Cold start, from interpreter launch to create_app() returning, that a run must stay under
+DEFAULT_TARGET_SECONDS = 1.0
+
+# Modules with the largest cumulative import time listed in the report
+TOP_MODULES = 15
+
+# Run in a fresh interpreter so nothing is imported yet; prints its own measurements as JSON.
+# Import timing is switched on through the environment and dropped from it straight away,
+# so worker processes started by the app (the forkserver) do not add their imports.
+PROBE = '''
+import json, os, resource, time
+os.environ.pop("PYTHONPROFILEIMPORTTIME", None)
+started = time.perf_counter()
+from app import create_app
+create_app()
+seconds = time.perf_counter() - started
+from app.utils.preload import startup_times
+print(json.dumps({"seconds": seconds, "idle_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  "steps": startup_times}))
+'''
+
+def parse_importtime(stderr):
+    """Cumulative import microseconds of every module, from the -X importtime report"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+def measure(preload):
+    env = dict(os.environ, PRELOAD=preload, JANITOR_INTERVAL='0', LOG_LEVEL='WARNING', PYTHONPROFILEIMPORTTIME='1')
+    result = subprocess.run([sys.executable, '-c', PROBE], env=env,
+                            capture_output=True, text=True, check=True)
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    modules = parse_importtime(result.stderr)
+    top = sorted(modules.items(), key=lambda m: -m[1])
+    report['top_imports'] = [{'module': name, 'seconds': round(us / 1e6, 4)} for name, us in top[:TOP_MODULES]]
+    report['preload'] = preload
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure app cold start and the imports behind it')
+    parser.add_argument('--preload', choices=('lazy', 'eager'), default='lazy',
+                        help='PRELOAD mode to measure (default lazy, as workers start)')
+    parser.add_argument('--target', type=float, default=DEFAULT_TARGET_SECONDS,
+                        help=f'Cold start in seconds reported as a regression when exceeded (default {DEFAULT_TARGET_SECONDS})')
+    parser.add_argument('--json', action='store_true', help='Print the full report as JSON')
+    args = parser.parse_args(argv)
+
+    report = measure(args.preload)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"Cold start ({args.preload}): {report['seconds']:.3f}s, idle RSS {report['idle_rss_mb']:.0f} MB")
+        for step, seconds in report['steps'].items():
+            print(f"  {step:<28} {seconds:8.3f}s")
+        print("Slowest imports (cumulative):")
+        for entry in report['top_imports']:
+            print(f"  {entry['module']:<40} {entry['seconds']:8.3f}s")
+
+    if report['seconds'] > args.target:
+        print(f"Cold start {report['seconds']:.3f}s is over the {args.target}s target", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+import threading
+import time
+import pandas as pd
+import pytest
+from benchmarks.generate import generate_aethalometer_csv, generate_weather_csv
+
+# Rows of the synthetic MA350 input: a dozen tape advances and a few gaps
+MA350_ROWS = 20000
+
+FINISHED_STATUSES = ('Completed', 'Error', 'Cancelled')
+
+@pytest.fixture(scope='session')
+def ma350_files(tmp_path_factory):
+    """Synthetic MA350 file with tape advances, gaps and noise, and weather covering it (see benchmarks/generate.py)"""
+    folder = tmp_path_factory.mktemp('ma350')
+    aethalometer = generate_aethalometer_csv(str(folder / 'ma350.csv'), MA350_ROWS,
+                                             wavelengths=['UV', 'Blue', 'Green', 'Red', 'IR'],
+                                             tape_advance_rows=1440, gap_rate=0.001, noise=0.15, seed=0)
+    weather = generate_weather_csv(str(folder / 'weather.csv'), aethalometer['start'], aethalometer['end'], seed=0)
+    return {'aethalometer': aethalometer['path'], 'weather': weather['path']}
+
+@pytest.fixture(scope='session')
+def daily_files(ma350_files, tmp_path_factory):
+    """The synthetic MA350 file split into per-day files"""
+    data = pd.read_csv(ma350_files['aethalometer'], dtype=str)
+    folder = tmp_path_factory.mktemp('days')
+    paths = []
+    for day, rows in data.groupby(data['Time (UTC)'].str[:10]):
+        paths.append(str(folder / f'{day}.csv'))
+        rows.to_csv(paths[-1], index=False)
+    return paths
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Test client of an app working in an empty copy of the app's data folders, without the storage janitor"""
+    from app import create_app
+    from app.utils import janitor
+    monkeypatch.setattr(janitor, 'JANITOR_INTERVAL', 0)
+    for folder in ('app/data/results', 'app/static'):
+        (tmp_path / folder).mkdir(parents=True)
+    monkeypatch.chdir(tmp_path)
+    threads = set(threading.enumerate())
+    app, _ = create_app()
+    yield app.test_client()
+    # Jobs precompress and clean up after reporting Completed; let them end in this folder
+    for thread in set(threading.enumerate()) - threads:
+        thread.join(timeout=60)
+
+@pytest.fixture
+def wait_for_job(client):
+    """Poll /api/status until a job finishes; returns the last status"""
+    def wait(job_id, timeout=120):
+        deadline = time.monotonic() + timeout
+        while True:
+            status = client.get(f'/api/status/{job_id}').get_json()
+            if status['status'] in FINISHED_STATUSES:
+                return status
+            assert time.monotonic() < deadline, f"Job {job_id} still {status['status']} after {timeout}s"
+            time.sleep(0.05)
+    return wait
+
+class HeldStage:
+    """Holds jobs inside ONA until released, so requests land while they are running"""
+
+    def __init__(self, apply_ona):
+        self.apply_ona = apply_ona
+        self.entered = threading.Event()
+        self.released = threading.Event()
+        self.error = None
+
+    def __call__(self, *args, **kwargs):
+        self.entered.set()
+        self.released.wait(60)
+        if self.error:
+            raise self.error
+        return self.apply_ona(*args, **kwargs)
+
+@pytest.fixture
+def held_ona(client, monkeypatch):
+    """Jobs of the client wait in ONA until held_ona.released is set; held_ona.error makes ONA fail instead"""
+    from app.routes import api_routes
+    held = HeldStage(api_routes.apply_ona_algorithm)
+    monkeypatch.setattr(api_routes, 'apply_ona_algorithm', held)
+    yield held
+    held.released.set()
@@ -0,0 +1,41 @@
+import threading
+import time
+from app.utils import admission
+from app.utils.cancellation import JobCancelled, request_cancel, clear_cancel
+from app.utils.status_tracker import processing_admissions
+
+def hold_admission(job_id, estimate, released, outcome):
+    try:
+        with admission.admission(job_id, estimate):
+            outcome[job_id] = 'admitted'
+            released.wait(30)
+    except JobCancelled:
+        outcome[job_id] = 'cancelled'
+
+def test_cancelled_queued_job_leaves_the_queue(monkeypatch):
+    monkeypatch.setattr(admission, '_budget', 100)
+    monkeypatch.setattr(admission, 'ADMISSION_POLL_INTERVAL', 0.01)
+    released, outcome = threading.Event(), {}
+    threads = [threading.Thread(target=hold_admission, args=(job_id, 80, released, outcome))
+               for job_id in ('running', 'queued')]
+    try:
+        threads[0].start()
+        while 'running' not in outcome:
+            time.sleep(0.01)
+        threads[1].start()
+        while processing_admissions.get('queued', {}).get('queue_position') != 1:
+            time.sleep(0.01)
+
+        request_cancel('queued')
+        threads[1].join(10)
+        assert outcome['queued'] == 'cancelled'
+        entry = processing_admissions['queued']
+        assert entry['state'] == 'cancelled' and entry['queue_position'] is None and entry['wait_reason'] is None
+        assert 'queued' not in admission._queue and 'queued' not in admission._estimates
+    finally:
+        released.set()
+        for thread in threads:
+            thread.join(10)
+        clear_cancel('queued')
+        for job_id in ('running', 'queued'):
+            processing_admissions.pop(job_id, None)
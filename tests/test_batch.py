@@ -0,0 +1,40 @@
+import io
+import numpy as np
+import pandas as pd
+import pytest
+
+def processed_rows(client, status):
+    response = client.get(f"/api/download/{status['results']['download_path']}")
+    return pd.read_csv(io.BytesIO(response.data))
+
+def test_batch_matches_the_whole_file(client, wait_for_job, ma350_files, daily_files):
+    with open(ma350_files['aethalometer'], 'rb') as f:
+        job = client.post('/api/process', data={'aethalometer_file': (f, 'ma350.csv'), 'wavelength': 'Blue'},
+                          content_type='multipart/form-data').get_json()
+    expected = processed_rows(client, wait_for_job(job['job_id']))
+
+    assert len(daily_files) > 10
+    files = [open(path, 'rb') for path in reversed(daily_files)]
+    try:
+        # Every file has the same name, as daily files from different folders can
+        job = client.post('/api/batch', data={'aethalometer_files': [(f, 'day.csv') for f in files],
+                                              'wavelength': 'Blue'},
+                          content_type='multipart/form-data').get_json()
+    finally:
+        for f in files:
+            f.close()
+    status = wait_for_job(job['job_id'])
+    assert status['status'] == 'Completed', status['message']
+    result = processed_rows(client, status)
+    assert result['timestamp'].equals(expected['timestamp'])
+    np.testing.assert_array_equal(result['processedBC'], expected['processedBC'])
+
+def test_batch_failing_after_cancel_is_cancelled(client, wait_for_job, held_ona, daily_files):
+    with open(daily_files[0], 'rb') as f:
+        job_id = client.post('/api/batch', data={'aethalometer_files': [f], 'wavelength': 'Blue'},
+                             content_type='multipart/form-data').get_json()['job_id']
+    assert held_ona.entered.wait(60)
+    assert client.delete(f'/api/jobs/{job_id}').status_code == 202
+    held_ona.error = RuntimeError('ONA interrupted')
+    held_ona.released.set()
+    assert wait_for_job(job_id)['status'] == 'Cancelled'
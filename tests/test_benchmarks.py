@@ -0,0 +1,63 @@
+import json
+import numpy as np
+import pandas as pd
+from benchmarks import compare, run
+from benchmarks.generate import generate_aethalometer_csv, generate_weather_csv
+
+STAGES = ['process_aethalometer_data_in_chunks', 'apply_ona_algorithm', 'process_weather_data', 'synchronize_data',
+          'downsample_data', 'create_visualizations', 'ensure_json_serializable']
+
+def test_generated_file_has_tape_advances_and_gaps(ma350_files):
+    data = pd.read_csv(ma350_files['aethalometer'])
+    assert len(data) == 20000
+    assert {'UV BC1', 'Blue ATN1', 'IR BCc', 'Time (UTC)'} <= set(data.columns)
+
+    # ATN restarts at each tape advance and grows in between
+    drops = np.flatnonzero(np.diff(data['Blue ATN1']) < 0) + 1
+    np.testing.assert_array_equal(drops, np.arange(1440, 20000, 1440))
+    assert (data['Blue ATN1'] < 0).sum() == 0
+
+    steps = pd.to_datetime(data['Time (UTC)']).diff().dropna()
+    assert (steps == pd.Timedelta('1min')).mean() > 0.99
+    assert (steps > pd.Timedelta('1min')).any()
+    assert (data['Blue BC1'] < 0).any()
+
+def test_generated_weather_covers_the_aethalometer_data(ma350_files):
+    data = pd.read_csv(ma350_files['aethalometer'], usecols=['Time (UTC)'])
+    times = pd.to_datetime(data['Time (UTC)']).dt.tz_localize(None)
+    weather = pd.read_csv(ma350_files['weather'], parse_dates=['timestamp'])
+    assert weather['timestamp'].min() <= times.min()
+    assert weather['timestamp'].max() >= times.max()
+    assert (weather['timestamp'].diff().dropna() == pd.Timedelta('15min')).all()
+
+def test_generator_is_deterministic_and_writes_gzip(tmp_path):
+    first = generate_aethalometer_csv(str(tmp_path / 'a.csv'), 3000, wavelengths=['Blue'], seed=3)
+    again = generate_aethalometer_csv(str(tmp_path / 'b.csv.gz'), 3000, wavelengths=['Blue'], seed=3)
+    assert (first['start'], first['end']) == (again['start'], again['end'])
+    pd.testing.assert_frame_equal(pd.read_csv(first['path']), pd.read_csv(again['path']))
+    assert again['bytes'] < first['bytes']
+    weather = generate_weather_csv(str(tmp_path / 'w.csv'), first['start'], first['end'])
+    assert weather['rows'] > 0
+
+def test_runner_saves_every_stage_and_compares_runs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(run, 'WARMUP_ROWS', 500)
+    output = tmp_path / 'run.json'
+    run.main(['--sizes', '2k', '--wavelengths', 'Blue,IR', '--output', str(output)])
+
+    report = json.loads(output.read_text())
+    assert report['config']['sizes'] == '2k'
+    [result] = report['runs']
+    assert result['rows'] == 2000
+    records = {record['stage']: record for record in result['stages']}
+    assert [stage for stage in records if stage in STAGES] == STAGES
+    for stage in STAGES:
+        assert 'error' not in records[stage]
+        assert records[stage]['seconds'] >= 0 and records[stage]['peak_rss_mb'] > 0
+    assert records['apply_ona_algorithm']['rows'] == 2000
+    assert list((tmp_path / 'app/static').iterdir()) == []
+
+    # A run compared with itself has no regressions
+    runs = compare.load_runs(str(output))
+    rows = compare.compare(runs, runs)
+    assert rows and not any(row[-1] for row in rows)
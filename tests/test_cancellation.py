@@ -0,0 +1,43 @@
+import os
+from app.utils.janitor import job_artifacts
+
+def submit(client, path, name='ma350.csv'):
+    with open(path, 'rb') as f:
+        return client.post('/api/process', data={'aethalometer_file': (f, name), 'wavelength': 'Blue'},
+                           content_type='multipart/form-data').get_json()
+
+def data_files():
+    return sorted(name for name in os.listdir('app/data') if os.path.isfile(os.path.join('app/data', name)))
+
+def test_cancel_stops_a_running_job_and_removes_its_files(client, wait_for_job, held_ona, ma350_files):
+    job_id = submit(client, ma350_files['aethalometer'])['job_id']
+    assert held_ona.entered.wait(60)
+    assert data_files()
+
+    response = client.delete(f'/api/jobs/{job_id}')
+    assert response.status_code == 202
+    assert response.get_json()['status'] == 'Cancelling'
+    held_ona.released.set()
+
+    status = wait_for_job(job_id)
+    assert status['status'] == 'Cancelled'
+    assert 'results' not in status
+    assert not any(os.path.exists(path) for path in job_artifacts(job_id))
+    assert data_files() == []
+    assert os.listdir('app/data/results') == []
+    assert client.delete(f'/api/jobs/{job_id}').status_code == 409
+
+def test_cancel_aborts_a_streaming_upload(client, wait_for_job, ma350_files):
+    size = os.path.getsize(ma350_files['aethalometer'])
+    upload = client.post('/api/uploads', json={'filename': 'ma350.csv', 'size': size, 'stream': True,
+                                               'wavelength': 'Blue'}).get_json()
+    with open(ma350_files['aethalometer'], 'rb') as f:
+        client.put(f"/api/uploads/{upload['upload_id']}?offset=0", data=f.read(size // 4))
+
+    assert client.delete(f"/api/jobs/{upload['job_id']}").status_code == 202
+    assert wait_for_job(upload['job_id'], timeout=30)['status'] == 'Cancelled'
+    assert client.get(f"/api/uploads/{upload['upload_id']}").status_code == 404
+    assert data_files() == []
+
+def test_cancel_unknown_job_is_not_found(client):
+    assert client.delete('/api/jobs/nope').status_code == 404
@@ -0,0 +1,18 @@
+import os
+from app.cli import output_names
+
+def test_distinct_file_names_are_kept():
+    assert output_names(['a/day1.csv', 'b/day2.csv.gz']) == ['day1', 'day2']
+
+def test_shared_file_names_get_their_folder():
+    assert output_names(['a/day1.csv', 'b/day1.csv', 'c/day2.csv']) == ['a_day1', 'b_day1', 'day2']
+    assert output_names(['x/a/day1.csv', 'y/a/day1.csv', 'b/day1.csv']) == ['x_a_day1', 'y_a_day1', 'b_day1']
+
+def test_names_of_one_folder_are_numbered():
+    assert output_names(['a/day1.csv', 'a/day1.csv.gz', 'b/day1.csv']) == ['a_day1', 'a_day1_2', 'b_day1']
+    assert output_names(['day1.csv', 'day1_2.csv', 'day1.zip']) == ['day1', 'day1_2', 'day1_3']
+
+def test_names_are_unique():
+    paths = ['day1.csv', 'a_day1.csv', os.path.join('a', 'day1.csv'), os.path.join('a', 'day1.csv.gz')]
+    names = output_names(paths)
+    assert len(set(names)) == len(paths)
@@ -0,0 +1,47 @@
+from app.routes import api_routes
+from app.utils.coalescing import release_job
+
+def submit(client, path, name='ma350.csv'):
+    with open(path, 'rb') as f:
+        return client.post('/api/process', data={'aethalometer_file': (f, name), 'wavelength': 'Blue'},
+                           content_type='multipart/form-data').get_json()
+
+def test_identical_submissions_share_one_job(client, wait_for_job, held_ona, ma350_files):
+    job_id = submit(client, ma350_files['aethalometer'])['job_id']
+    assert held_ona.entered.wait(60)
+    duplicate = submit(client, ma350_files['aethalometer'], name='copy.csv')
+    assert duplicate['coalesced'] and duplicate['job_id'] == job_id
+    with open(ma350_files['aethalometer'], 'rb') as f:
+        other = client.post('/api/process', data={'aethalometer_file': (f, 'ma350.csv'), 'wavelength': 'IR'},
+                            content_type='multipart/form-data').get_json()
+    assert other['job_id'] != job_id and 'coalesced' not in other
+
+    held_ona.released.set()
+    assert wait_for_job(job_id)['status'] == 'Completed'
+    assert wait_for_job(other['job_id'])['status'] == 'Completed'
+
+def test_coalesced_job_runs_until_every_submitter_cancels(client, wait_for_job, held_ona, ma350_files):
+    job_id = submit(client, ma350_files['aethalometer'])['job_id']
+    assert held_ona.entered.wait(60)
+    duplicate = submit(client, ma350_files['aethalometer'])
+    assert duplicate['coalesced'] and duplicate['job_id'] == job_id
+
+    response = client.delete(f'/api/jobs/{job_id}')
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'Detached'
+    assert client.delete(f'/api/jobs/{job_id}').status_code == 202
+    held_ona.released.set()
+    assert wait_for_job(job_id)['status'] == 'Cancelled'
+
+def test_duplicate_of_a_starting_job_can_poll_it(client, ma350_files, monkeypatch):
+    # The first job is claimed but its thread never starts, as if the duplicate arrived in between
+    monkeypatch.setattr(api_routes, 'start_processing_job', lambda job_id, *args, **kwargs: None)
+    job_id = submit(client, ma350_files['aethalometer'])['job_id']
+    duplicate = submit(client, ma350_files['aethalometer'])
+    try:
+        assert duplicate['coalesced'] and duplicate['job_id'] == job_id
+        response = client.get(f'/api/status/{job_id}')
+        assert response.status_code == 200
+        assert response.get_json()['status'] == 'Initializing'
+    finally:
+        release_job(job_id)
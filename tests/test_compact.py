@@ -0,0 +1,28 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from app.processing import compact
+from app.processing.aethalometer import find_measurement_columns
+from benchmarks.accuracy import run_path, compare, DEFAULT_TOLERANCE, DEFAULT_MAX_WINDOW_MISMATCH
+
+@pytest.mark.parametrize('wavelength', ['Blue', 'IR'])
+def test_compact_processed_bc_within_tolerance(ma350_files, wavelength, monkeypatch):
+    ma350_path = ma350_files['aethalometer']
+    args = SimpleNamespace(wavelength=wavelength, atn_min=0.01)
+    outputs = {}
+    for mode in (False, True):
+        monkeypatch.setenv('COMPACT_DTYPES', '1' if mode else '0')
+        monkeypatch.setattr(compact, 'COMPACT_DTYPES', mode)
+        assert compact.bc_dtype() == (np.float32 if mode else np.float64)
+        outputs[mode], _ = run_path(ma350_path, args, mode)
+    reference, candidate = outputs[False], outputs[True]
+
+    assert reference['processedBC'].dtype == np.float64
+    assert candidate['processedBC'].dtype == np.float32
+    atn_col, _ = find_measurement_columns(reference.columns, wavelength)
+    accuracy = compare(reference, candidate, atn_col)
+    assert accuracy['rows'] == 20000
+    assert accuracy['window_mismatch_share'] <= DEFAULT_MAX_WINDOW_MISMATCH
+    assert accuracy['max_relative_error'] <= DEFAULT_TOLERANCE
+    assert accuracy['max_atn_error'] == 0.0
+    assert reference['windowStart'].dtype == candidate['windowStart'].dtype == bool
@@ -0,0 +1,56 @@
+import io
+import pandas as pd
+import pytest
+from app.processing import disk_mode
+from app.processing.aethalometer import process_aethalometer_data_in_chunks, apply_ona_algorithm
+from app.processing.disk_mode import (
+    spill_aethalometer_data, apply_ona_disk, iter_result_blocks, iter_combined_blocks, release_spilled
+)
+from app.processing.weather import process_weather_data, synchronize_data
+
+@pytest.fixture(scope='module')
+def in_memory(ma350_files):
+    return apply_ona_algorithm(process_aethalometer_data_in_chunks(ma350_files['aethalometer']), 'Blue', 0.01)
+
+@pytest.fixture
+def spilled(ma350_files, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    spilled = spill_aethalometer_data(ma350_files['aethalometer'], 'Blue')
+    apply_ona_disk(spilled, 0.01)
+    yield spilled
+    release_spilled(spilled)
+
+def test_disk_mode_matches_memory(spilled, in_memory):
+    result = pd.concat(list(iter_result_blocks(spilled, step=3000)), ignore_index=True)
+    pd.testing.assert_frame_equal(result, in_memory)
+
+def test_weather_is_merged_at_full_resolution(spilled, in_memory, ma350_files):
+    weather = process_weather_data(ma350_files['weather'])
+    combined = pd.concat(list(iter_combined_blocks(spilled, weather, step=3000)), ignore_index=True)
+    expected = synchronize_data(in_memory.copy(), weather)
+    assert len(combined) == 20000
+    pd.testing.assert_frame_equal(combined, expected)
+
+def test_disk_job_reports_its_plot_preview(client, wait_for_job, ma350_files, monkeypatch):
+    with open(ma350_files['aethalometer'], 'rb') as f:
+        data = f.read()
+
+    def run_job(data):
+        with open(ma350_files['weather'], 'rb') as w:
+            job = client.post('/api/process', data={'aethalometer_file': (io.BytesIO(data), 'ma350.csv'),
+                                                    'weather_file': (w, 'weather.csv'), 'wavelength': 'Blue'},
+                              content_type='multipart/form-data').get_json()
+        status = wait_for_job(job['job_id'])
+        assert status['status'] == 'Completed', status['message']
+        return status['results']
+
+    monkeypatch.setattr(disk_mode, 'DISK_MODE', 'never')
+    expected = run_job(data)
+    monkeypatch.setattr(disk_mode, 'DISK_MODE', 'always')
+    # A trailing blank line changes the digest, so the job is not coalesced with the first
+    results = run_job(data + b'\n')
+    assert results['metadata']['disk_backed'] is True
+    assert results['metadata']['plot_rows'] == 10000
+    assert 'disk_backed' not in expected['metadata']
+    assert results['total_rows'] == expected['total_rows'] == 20000
+    assert results['combined_data'] == expected['combined_data']
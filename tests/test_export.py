@@ -0,0 +1,167 @@
+import gzip
+import io
+import struct
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.io import netcdf_file
+from app.processing.export import NC_NUMRECS_OFFSET, NC_STREAMING, encode_chunks, write_chunks
+
+COLUMNS = ['timestamp', 'rawBC', 'processedBC', 'windowStart']
+
+def processed_frame(rows=1000):
+    return pd.DataFrame({
+        'timestamp': pd.date_range('2022-04-12 09:00', periods=rows, freq='min', tz='UTC'),
+        'rawBC': np.arange(rows, dtype=np.float32),
+        'processedBC': np.linspace(0, 5000, rows),
+        'windowStart': np.arange(rows) % 7 == 0
+    })
+
+def chunks_of(frame, size=300):
+    return [frame.iloc[start:start + size] for start in range(0, len(frame), size)]
+
+def read_netcdf(data):
+    with netcdf_file(io.BytesIO(data), mmap=False) as nc:
+        return {name: variable[:].copy() for name, variable in nc.variables.items()}
+
+def test_netcdf_round_trip():
+    frame = processed_frame()
+    variables = read_netcdf(b''.join(encode_chunks(chunks_of(frame), COLUMNS, 'netcdf', rows=len(frame))))
+
+    assert list(variables) == COLUMNS
+    times = pd.to_datetime(variables['timestamp'], unit='s', utc=True)
+    assert times.equals(pd.DatetimeIndex(frame['timestamp']))
+    assert variables['rawBC'].dtype.itemsize == 4
+    np.testing.assert_array_equal(variables['rawBC'], frame['rawBC'])
+    np.testing.assert_allclose(variables['processedBC'], frame['processedBC'])
+    np.testing.assert_array_equal(variables['windowStart'].astype(bool), frame['windowStart'])
+
+def test_netcdf_naive_timestamps_are_utc():
+    frame = processed_frame(10)
+    naive = frame.assign(timestamp=frame['timestamp'].dt.tz_localize(None))
+    variables = read_netcdf(b''.join(encode_chunks([naive], COLUMNS, 'netcdf', rows=len(naive))))
+    times = pd.to_datetime(variables['timestamp'], unit='s', utc=True)
+    assert times.equals(pd.DatetimeIndex(frame['timestamp']))
+
+def test_netcdf_without_rows_is_readable():
+    variables = read_netcdf(b''.join(encode_chunks([], COLUMNS, 'netcdf', rows=0)))
+    assert variables['timestamp'].shape == (0,)
+
+def test_netcdf_file_and_gzip_match_stream():
+    frame = processed_frame()
+    streamed = b''.join(encode_chunks(chunks_of(frame), COLUMNS, 'netcdf', rows=len(frame)))
+    written = io.BytesIO()
+    write_chunks(written, chunks_of(frame), COLUMNS, 'netcdf')
+    assert written.getvalue() == streamed
+    assert gzip.decompress(b''.join(encode_chunks(chunks_of(frame), COLUMNS, 'netcdf', compress=True,
+                                                            rows=len(frame)))) == streamed
+
+def test_netcdf_row_count_is_declared_up_front():
+    frame = processed_frame()
+    counted = b''.join(encode_chunks(chunks_of(frame), COLUMNS, 'netcdf', rows=len(frame)))
+    uncounted = b''.join(encode_chunks(chunks_of(frame), COLUMNS, 'netcdf'))
+    (numrecs,) = struct.unpack_from('>I', uncounted, NC_NUMRECS_OFFSET)
+    assert numrecs == NC_STREAMING
+    assert uncounted[NC_NUMRECS_OFFSET + 4:] == counted[NC_NUMRECS_OFFSET + 4:]
+    with pytest.raises(ValueError):
+        b''.join(encode_chunks(chunks_of(frame), COLUMNS, 'netcdf', rows=len(frame) - 1))
+
+def test_csv_round_trip():
+    frame = processed_frame(50)
+    data = b''.join(encode_chunks(chunks_of(frame, 20), COLUMNS, 'csv'))
+    parsed = pd.read_csv(io.BytesIO(data), parse_dates=['timestamp'])
+    assert list(parsed.columns) == COLUMNS
+    assert len(parsed) == len(frame)
+    np.testing.assert_allclose(parsed['processedBC'], frame['processedBC'])
+    assert b''.join(encode_chunks([], COLUMNS, 'csv')) == (','.join(COLUMNS) + '\n').encode()
+
+@pytest.fixture
+def completed_job(client, wait_for_job, ma350_files):
+    """A processed synthetic MA350 job and its downloaded output"""
+    with open(ma350_files['aethalometer'], 'rb') as f:
+        job = client.post('/api/process', data={'aethalometer_file': (f, 'ma350.csv'), 'wavelength': 'Blue'},
+                          content_type='multipart/form-data').get_json()
+    status = wait_for_job(job['job_id'])
+    assert status['status'] == 'Completed', status['message']
+    download = client.get(f"/api/download/{status['results']['download_path']}")
+    processed = pd.read_csv(io.BytesIO(download.data))
+    processed['timestamp'] = pd.to_datetime(processed['timestamp'], utc=True)
+    return job['job_id'], processed
+
+def export(client, job_id, **params):
+    response = client.get(f'/api/jobs/{job_id}/export', query_string=params)
+    assert response.status_code == 200, response.get_json()
+    return response
+
+def test_export_formats_hold_the_processed_rows(client, completed_job):
+    job_id, processed = completed_job
+    csv = export(client, job_id).data
+    exported = pd.read_csv(io.BytesIO(csv))
+    assert list(exported.columns) == list(processed.columns)
+    assert pd.to_datetime(exported['timestamp'], utc=True).equals(processed['timestamp'])
+    np.testing.assert_allclose(exported['processedBC'], processed['processedBC'])
+    assert gzip.decompress(export(client, job_id, gzip=1).data) == csv
+
+    response = export(client, job_id, format='netcdf')
+    assert response.headers['Content-Disposition'].endswith('.nc"')
+    variables = read_netcdf(response.data)
+    times = pd.to_datetime(variables['timestamp'], unit='s', utc=True)
+    assert times.equals(pd.DatetimeIndex(processed['timestamp']))
+    np.testing.assert_allclose(variables['processedBC'], processed['processedBC'])
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        assert client.get(f'/api/jobs/{job_id}/export?format=parquet').status_code == 400
+    else:
+        parquet = pd.read_parquet(io.BytesIO(export(client, job_id, format='parquet').data))
+        np.testing.assert_allclose(parquet['processedBC'], processed['processedBC'])
+
+def test_export_selects_range_columns_and_interval(client, completed_job):
+    job_id, processed = completed_job
+    start, end = processed['timestamp'].iloc[[2000, 9000]]
+    exported = pd.read_csv(io.BytesIO(export(client, job_id, start=start.isoformat(), end=end.isoformat(),
+                                             columns='processedBC').data))
+    in_range = processed[(processed['timestamp'] >= start) & (processed['timestamp'] <= end)]
+    assert list(exported.columns) == ['timestamp', 'processedBC']
+    assert len(exported) == len(in_range)
+    np.testing.assert_allclose(exported['processedBC'], in_range['processedBC'])
+    variables = read_netcdf(export(client, job_id, start=start.isoformat(), end=end.isoformat(),
+                                   columns='processedBC', format='netcdf').data)
+    np.testing.assert_allclose(variables['processedBC'], in_range['processedBC'])
+
+    hourly = pd.read_csv(io.BytesIO(export(client, job_id, resample='1h').data))
+    expected = (processed.set_index('timestamp').resample('1h')
+                .agg({'rawBC': 'mean', 'processedBC': 'mean'}).dropna(subset=['rawBC']))
+    assert len(hourly) == len(expected)
+    np.testing.assert_allclose(hourly['processedBC'], expected['processedBC'])
+    variables = read_netcdf(export(client, job_id, resample='1h', format='netcdf').data)
+    np.testing.assert_allclose(variables['processedBC'], expected['processedBC'])
+
+def test_export_rejects_invalid_requests(client, completed_job):
+    job_id, _ = completed_job
+    for params in ({'format': 'xml'}, {'start': 'soon'}, {'resample': '1M'},
+                   {'start': '2023-01-01', 'end': '2022-01-01'}):
+        assert client.get(f'/api/jobs/{job_id}/export', query_string=params).status_code == 400
+    assert client.get('/api/jobs/nope/export').status_code == 404
+
+def test_export_of_a_series_append_reads_the_stored_series(client, wait_for_job, daily_files):
+    for path in daily_files[:2]:
+        with open(path, 'rb') as f:
+            job = client.post('/api/series/site1/append', data={'aethalometer_file': (f, 'day.csv'), 'wavelength': 'Blue'},
+                              content_type='multipart/form-data').get_json()
+        assert wait_for_job(job['job_id'])['status'] == 'Completed'
+    series = pd.read_csv(io.BytesIO(client.get('/api/series/site1/download').data))
+    series['timestamp'] = pd.to_datetime(series['timestamp'], utc=True)
+
+    response = export(client, job['job_id'])
+    assert response.headers['Content-Disposition'].endswith('series_site1.csv"')
+    exported = pd.read_csv(io.BytesIO(response.data))
+    assert pd.to_datetime(exported['timestamp'], utc=True).equals(series['timestamp'])
+    np.testing.assert_allclose(exported['processedBC'], series['processedBC'])
+
+    start, end = series['timestamp'].iloc[[100, 2000]]
+    variables = read_netcdf(export(client, job['job_id'], start=start.isoformat(), end=end.isoformat(),
+                                   format='netcdf').data)
+    in_range = series[(series['timestamp'] >= start) & (series['timestamp'] <= end)]
+    np.testing.assert_allclose(variables['processedBC'], in_range['processedBC'])
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+from app.processing.aethalometer import process_aethalometer_data_in_chunks, apply_ona_algorithm, find_measurement_columns
+from app.processing.ona_kernels import ONA_KERNELS, scan_windows_python, get_ona_backend, select_ona_backend
+
+try:
+    import numba  # noqa: F401
+    BACKENDS = ['numpy', 'numba']
+except ImportError:
+    BACKENDS = ['numpy']
+
+@pytest.fixture(scope='module')
+def parsed(ma350_files):
+    return process_aethalometer_data_in_chunks(ma350_files['aethalometer'])
+
+@pytest.fixture
+def ona_backend():
+    """Select ONA backends within a test and restore the active one afterwards"""
+    active = get_ona_backend()
+    yield select_ona_backend
+    select_ona_backend(active)
+
+def run_ona(parsed, backend, ona_backend, wavelength='Blue'):
+    ona_backend(backend)
+    return apply_ona_algorithm(parsed.copy(), wavelength, 0.01)
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_kernel_matches_reference_loop(parsed, backend, ona_backend):
+    ona_backend(backend)
+    atn_col, _ = find_measurement_columns(parsed.columns, 'Blue')
+    atn_values = parsed[atn_col].to_numpy(dtype=np.float64)
+    expected_starts, expected_ends, expected_open = scan_windows_python(atn_values, 0.01)
+    starts, ends, open_start = ONA_KERNELS[backend](atn_values, 0.01)
+    np.testing.assert_array_equal(starts, expected_starts)
+    np.testing.assert_array_equal(ends, expected_ends)
+    assert open_start == expected_open
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('wavelength', ['Blue', 'IR'])
+def test_output_matches_reference_backend(parsed, backend, wavelength, ona_backend):
+    expected = run_ona(parsed, 'python', ona_backend, wavelength)
+    pd.testing.assert_frame_equal(run_ona(parsed, backend, ona_backend, wavelength), expected)
+
+def test_windows_hold_the_mean_of_raw_bc(parsed, ona_backend):
+    processed = run_ona(parsed, 'python', ona_backend)
+    starts = np.flatnonzero(processed['windowStart'])
+    ends = np.flatnonzero(processed['windowEnd'])
+    assert len(starts) == len(ends) > 100
+    raw_bc = processed['rawBC'].to_numpy()
+    processed_bc = processed['processedBC'].to_numpy()
+    for start, end in zip(starts, ends):
+        np.testing.assert_allclose(processed_bc[start:end + 1], raw_bc[start:end + 1].mean())
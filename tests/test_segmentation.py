@@ -0,0 +1,41 @@
+import threading
+import numpy as np
+import pytest
+from app.processing import segmentation
+from app.processing.ona_kernels import get_ona_backend, select_ona_backend
+
+@pytest.fixture
+def pooled_scan(monkeypatch):
+    """Force the process pool path with the numpy kernel"""
+    backend = get_ona_backend()
+    select_ona_backend('numpy')
+    monkeypatch.setattr(segmentation, 'PARALLEL_MIN_ROWS', 10)
+    yield
+    select_ona_backend(backend)
+
+def tape_advances(segments=20, rows=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.concatenate([np.cumsum(rng.random(rows) * 0.01) for _ in range(segments)])
+
+def test_concurrent_jobs_survive_pool_growth(pooled_scan):
+    atn = tape_advances()
+    expected = segmentation.find_segmented_windows(atn, max_workers=1)
+    errors = []
+
+    def scan(workers):
+        try:
+            starts, ends, open_start = segmentation.find_segmented_windows(atn, max_workers=workers)
+            np.testing.assert_array_equal(starts, expected[0])
+            np.testing.assert_array_equal(ends, expected[1])
+            assert open_start == expected[2]
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=scan, args=(workers,)) for workers in (2, 3, 4, 2, 5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert list(segmentation._pool_users) == [segmentation._pool]
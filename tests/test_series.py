@@ -0,0 +1,44 @@
+import io
+import os
+import time
+import pandas as pd
+from app.utils import janitor
+
+def append(client, wait_for_job, series_id, path):
+    with open(path, 'rb') as f:
+        job = client.post(f'/api/series/{series_id}/append', data={'aethalometer_file': (f, os.path.basename(path)),
+                                                                   'wavelength': 'Blue'},
+                          content_type='multipart/form-data').get_json()
+    status = wait_for_job(job['job_id'])
+    assert status['status'] == 'Completed', status['message']
+    return client.get(f'/api/series/{series_id}').get_json()
+
+def test_appends_extend_the_series(client, wait_for_job, daily_files):
+    first = append(client, wait_for_job, 'site1', daily_files[0])
+    second = append(client, wait_for_job, 'site1', daily_files[1])
+    assert second['rows_finalized'] > first['rows_finalized'] > 0
+
+    series = pd.read_csv(io.BytesIO(client.get('/api/series/site1/download').data))
+    days = pd.concat([pd.read_csv(path) for path in daily_files[:2]])
+    assert second['rows_finalized'] <= len(series) <= len(days)
+    assert pd.to_datetime(series['timestamp']).is_monotonic_increasing
+
+def test_current_plot_is_kept_and_restored(client, wait_for_job, daily_files, monkeypatch):
+    first = append(client, wait_for_job, 'site1', daily_files[0])
+    second = append(client, wait_for_job, 'site1', daily_files[1])
+    assert first['plot'] != second['plot']
+    old_plot, plot = first['plot'].split('/')[-1], second['plot'].split('/')[-1]
+
+    # Every file is past its age limit: the old revision goes, the current one stays
+    monkeypatch.setattr(janitor, 'STORAGE_MAX_AGE_HOURS', 0)
+    time.sleep(0.05)
+    janitor.sweep()
+    plots = os.listdir('app/static')
+    assert plot in plots and old_plot not in plots
+
+    os.remove(os.path.join('app/static', plot))
+    response = client.get(second['plot'])
+    assert response.status_code == 200
+    assert 'immutable' in response.headers['Cache-Control']
+    assert os.path.exists(os.path.join('app/static', plot))
+    assert client.get(first['plot']).status_code == 404
@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+from app.processing import timestamp_parser
+from app.processing.aethalometer import iter_aethalometer_chunks
+from benchmarks.generate import generate_aethalometer_csv
+
+@pytest.fixture
+def ma350_frame(tmp_path, monkeypatch):
+    """A short MA350 file as a frame, with the detected layouts of earlier tests forgotten"""
+    monkeypatch.setattr(timestamp_parser, '_parser_cache', {})
+    path = tmp_path / 'generated.csv'
+    generate_aethalometer_csv(str(path), 300, wavelengths=['Blue'], gap_rate=0)
+    return pd.read_csv(path, dtype={'Time (UTC)': str})
+
+def ingest(frame, path, chunk_size=100):
+    frame.to_csv(path, index=False)
+    return pd.concat(iter_aethalometer_chunks(str(path), chunk_size=chunk_size), ignore_index=True)
+
+def test_layout_change_is_detected_once(ma350_frame, tmp_path, monkeypatch):
+    times = pd.to_datetime(ma350_frame['Time (UTC)'], utc=True)
+    ma350_frame.loc[100:, 'Time (UTC)'] = times[100:].dt.strftime('%Y/%m/%d %H:%M:%S')
+
+    detected = []
+    detect = timestamp_parser.detect_timestamp_parser
+    monkeypatch.setattr(timestamp_parser, 'detect_timestamp_parser', lambda chunk: detected.append(1) or detect(chunk))
+    parsed = ingest(ma350_frame, tmp_path / 'ma350.csv')
+
+    assert parsed['timestamp'].equals(times.dt.as_unit('ns').rename('timestamp'))
+    # Re-detected in the second chunk only; the third reuses the new format
+    assert len(detected) == 1
+
+def test_unparsed_timestamps_stop_ingestion(ma350_frame, tmp_path, monkeypatch):
+    ma350_frame.loc[150, 'Time (UTC)'] = 'not a time'
+    ma350_frame.loc[160, 'Time (UTC)'] = None
+    with pytest.raises(ValueError, match="1 timestamps could not be parsed, such as 'not a time'"):
+        ingest(ma350_frame, tmp_path / 'ma350.csv')
+
+    monkeypatch.setattr(timestamp_parser, 'MAX_UNPARSED_TIMESTAMPS', 1)
+    parsed = ingest(ma350_frame, tmp_path / 'ma350.csv')
+    assert parsed['timestamp'].isna().sum() == 2
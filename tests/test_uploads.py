@@ -0,0 +1,109 @@
+import io
+import os
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from app.utils import janitor, upload_store
+
+# Bytes sent per PUT; parts are cut from the file at this size
+PART_SIZE = 1024 * 1024
+
+@pytest.fixture(scope='module')
+def ma350_bytes(ma350_files):
+    with open(ma350_files['aethalometer'], 'rb') as f:
+        return f.read()
+
+def put_part(client, upload_id, data, offset):
+    response = client.put(f'/api/uploads/{upload_id}?offset={offset}', data=data[offset:offset + PART_SIZE])
+    assert response.status_code == 200
+    return response.get_json()
+
+def processed_rows(client, status):
+    response = client.get(f"/api/download/{status['results']['download_path']}")
+    return pd.read_csv(io.BytesIO(response.data))
+
+def test_interrupted_upload_resumes_from_next_offset(client, wait_for_job, ma350_bytes):
+    size = len(ma350_bytes)
+    upload = client.post('/api/uploads', json={'filename': 'ma350.csv', 'size': size, 'wavelength': 'Blue'}).get_json()
+    upload_id = upload['upload_id']
+    assert upload['next_offset'] == 0
+
+    # The first part and a later one arrive, then the client drops out mid-part
+    put_part(client, upload_id, ma350_bytes, 0)
+    put_part(client, upload_id, ma350_bytes, 3 * PART_SIZE)
+    cut = PART_SIZE + PART_SIZE // 3
+    response = client.put(f'/api/uploads/{upload_id}?offset={PART_SIZE}', data=ma350_bytes[PART_SIZE:cut])
+    assert response.status_code == 200
+
+    summary = client.get(f'/api/uploads/{upload_id}').get_json()
+    assert summary['next_offset'] == cut
+    assert summary['received'] == [[0, cut], [3 * PART_SIZE, min(4 * PART_SIZE, size)]]
+    response = client.post(f'/api/uploads/{upload_id}/complete')
+    assert response.status_code == 409
+
+    # Resume from the reported offset and fill in whatever is still missing
+    offset = summary['next_offset']
+    while offset < size:
+        summary = client.put(f'/api/uploads/{upload_id}?offset={offset}',
+                             data=ma350_bytes[offset:offset + PART_SIZE]).get_json()
+        offset = summary['next_offset']
+    assert summary['received'] == [[0, size]]
+
+    job = client.post(f'/api/uploads/{upload_id}/complete', json={'wavelength': 'Blue'}).get_json()
+    status = wait_for_job(job['job_id'])
+    assert status['status'] == 'Completed', status['message']
+    assert len(processed_rows(client, status)) == 20000
+
+def test_streamed_upload_matches_regular_upload(client, wait_for_job, ma350_files, ma350_bytes):
+    with open(ma350_files['aethalometer'], 'rb') as f:
+        job = client.post('/api/process', data={'aethalometer_file': (f, 'ma350.csv'), 'wavelength': 'Blue'},
+                          content_type='multipart/form-data').get_json()
+    expected = processed_rows(client, wait_for_job(job['job_id']))
+
+    size = len(ma350_bytes)
+    upload = client.post('/api/uploads', json={'filename': 'ma350.csv', 'size': size, 'stream': True,
+                                               'wavelength': 'Blue'}).get_json()
+    assert upload['job_id']
+    for offset in range(0, size, PART_SIZE):
+        put_part(client, upload['upload_id'], ma350_bytes, offset)
+    assert client.post(f"/api/uploads/{upload['upload_id']}/complete").status_code == 200
+
+    status = wait_for_job(upload['job_id'])
+    assert status['status'] == 'Completed', status['message']
+    result = processed_rows(client, status)
+    assert result['timestamp'].equals(expected['timestamp'])
+    np.testing.assert_array_equal(result['processedBC'], expected['processedBC'])
+
+def test_unknown_upload_is_not_found(client):
+    assert client.get('/api/uploads/nope').status_code == 404
+    assert client.put('/api/uploads/nope?offset=0', data=b'x').status_code == 404
+
+def test_upload_above_the_size_limit_is_refused(client):
+    sessions = len(upload_store.upload_sessions)
+    response = client.post('/api/uploads', json={'filename': 'ma350.csv', 'size': 2 * 1024 ** 3})
+    assert response.status_code == 413
+    assert len(upload_store.upload_sessions) == sessions
+    assert os.listdir('app/data') == ['results']
+
+def test_idle_upload_expires(client, ma350_bytes):
+    upload_id = client.post('/api/uploads', json={'filename': 'ma350.csv', 'size': len(ma350_bytes)}).get_json()['upload_id']
+    put_part(client, upload_id, ma350_bytes, 0)
+    path = upload_store.upload_sessions[upload_id]['path']
+
+    janitor.sweep()
+    assert os.path.exists(path)
+    assert client.get(f'/api/uploads/{upload_id}').status_code == 200
+
+    janitor.sweep(time.time() + upload_store.UPLOAD_SESSION_TTL + 1)
+    assert not os.path.exists(path)
+    assert client.get(f'/api/uploads/{upload_id}').status_code == 404
+
+def test_streaming_session_ends_with_its_job(client, wait_for_job, ma350_bytes):
+    size = len(ma350_bytes)
+    upload = client.post('/api/uploads', json={'filename': 'ma350.csv', 'size': size, 'stream': True,
+                                               'wavelength': 'Blue'}).get_json()
+    # Not an aethalometer file, so the job fails before complete is ever called
+    client.put(f"/api/uploads/{upload['upload_id']}?offset=0", data=b'garbage,x\n' * (size // 10))
+    assert wait_for_job(upload['job_id'])['status'] == 'Error'
+    assert client.get(f"/api/uploads/{upload['upload_id']}").status_code == 404